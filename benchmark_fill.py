@@ -0,0 +1,65 @@
+import argparse
+import time
+
+import hist
+import numpy as np
+
+import utils
+
+# Micro-benchmark of the histogram filling of one chunk: one fill per variation, as done before
+# utils.histograms, against a single batched fill of all the weight variations. The variations
+# are those of a nominal sample: nominal and the up/down of every event weight systematic.
+
+def make_hist(variations):
+    return hist.Hist(
+        hist.axis.Regular(utils.config["global"]["NUM_BINS"], utils.config["global"]["BIN_LOW"],
+                          utils.config["global"]["BIN_HIGH"], name="observable"),
+        hist.axis.StrCategory(["ttbar"], name="process"),
+        hist.axis.StrCategory(variations, name="variation"),
+        storage=hist.storage.Weight(),
+    )
+
+def fill_each(h, observable, weights):
+    for name, weight in weights.items():
+        h.fill(observable=observable, process="ttbar", variation=name, weight=weight)
+
+def fill_batched(h, observable, weights):
+    utils.histograms.fill_variations(h, weights, observable=observable, process="ttbar")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare filling weight variations one at a time and in a single batched fill"
+    )
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000, 1000000], help="Events per chunk to benchmark")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed fills of each method, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random values")
+    args = parser.parse_args()
+
+    from test_processor import EVENT_SYSTS
+    variations = ["nominal"] + [f"{syst}_{direction}" for syst in EVENT_SYSTS for direction in ["up", "down"]]
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{len(variations)} variations")
+    print(f"{'Events':>10}{'One per variation [ms]':>24}{'Batched [ms]':>14}{'Speedup':>9}{'Identical':>11}")
+    for n_events in args.events:
+        observable = rng.exponential(150, n_events) + 50
+        weights = {name: rng.normal(1, 0.1, n_events) for name in variations}
+        results = {}
+        times = {}
+        for method in (fill_each, fill_batched):
+            best = None
+            for _ in range(args.repeats):
+                h = make_hist(variations)
+                t0 = time.perf_counter()
+                method(h, observable, weights)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            times[method] = best
+            results[method] = h
+        identical = (np.array_equal(results[fill_each].values(flow=True), results[fill_batched].values(flow=True))
+                     and np.array_equal(results[fill_each].variances(flow=True), results[fill_batched].variances(flow=True)))
+        print(f"{n_events:>10}{1e3*times[fill_each]:>24.3f}{1e3*times[fill_batched]:>14.3f}"
+              f"{times[fill_each]/times[fill_batched]:>9.1f}{str(identical):>11}")
+
+if __name__ == "__main__":
+    main()
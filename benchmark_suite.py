@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+from pathlib import Path
+import subprocess
+import threading
+
+import numpy as np
+
+from make_synthetic import add_size_arguments, size_options
+import utils
+
+# Offline end-to-end benchmark: xcache_test.py runs on synthetic files, read from disk or from a
+# local HTTP server, on a local cluster. The throughput of every run is appended to a history file
+# together with the git commit, so that performance can be followed from commit to commit.
+
+def ensure_synthetic(directory, options):
+    """
+    Write the synthetic files and fileset unless they already exist with the same options.
+    Returns the path of the fileset.
+    """
+    directory = Path(directory)
+    options_path = directory / "options.json"
+    fileset_path = directory / "fileset.json.gz"
+    if fileset_path.exists() and options_path.exists() and json.loads(options_path.read_text()) == options:
+        return fileset_path
+    print(f"Writing synthetic files to {directory}")
+    fileset_path = utils.synthetic.make_fileset(directory, **options)
+    options_path.write_text(json.dumps(options))
+    return fileset_path
+
+def serve_http(directory):
+    """
+    Serve a directory over HTTP (with range requests) from a background thread.
+    Returns the base URL.
+    """
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_static("/", str(Path(directory).resolve()))
+    runner = web.AppRunner(app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    threading.Thread(target=loop.run_forever, name="http", daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+def git_commit():
+    """
+    Short hash of the checked-out commit and whether the tree has uncommitted changes, or
+    (None, None) outside of a git repository.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"]).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def print_history(history_path, suite, last=10):
+    """
+    Print the median throughput and data rate of the last commits benchmarked with the same
+    suite configuration, and the change from one to the next.
+    """
+    by_commit = {}
+    with open(history_path) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["suite"] != suite:
+                continue
+            key = f"{entry['commit']}{'+' if entry['dirty'] else ''}"
+            by_commit.setdefault(key, []).append(entry)
+    print("\nBENCHMARK HISTORY (median over runs):\n----------------------------------------------------")
+    print(f"{'Commit':<12}{'Date':<22}{'Runs':>5}{'Throughput [evt/s]':>22}{'Data rate [MB/s]':>20}{'Change':>10}")
+    previous = None
+    for key, entries in list(by_commit.items())[-last:]:
+        throughput = np.median([e["throughput"] for e in entries])
+        bandwidth = np.median([e["bandwidth"] or 0 for e in entries])
+        change = f"{100*(throughput/previous - 1):+.1f}%" if previous else ""
+        print(f"{key:<12}{entries[-1]['timestamp']:<22}{len(entries):>5}{throughput:>22.1f}{bandwidth:>20.2f}{change:>10}")
+        previous = throughput
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmark of xcache_test.py on synthetic files"
+    )
+    parser.add_argument("--data-dir", default=".synthetic", help="Directory of the synthetic files (written if missing)")
+    parser.add_argument("--http", action="store_true", help="Read the files through a local HTTP server instead of from disk")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of runs")
+    parser.add_argument("--history", default="benchmarks/history.jsonl", help="File that the results of every run are appended to")
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    options = size_options(args)
+    fileset_path = ensure_synthetic(args.data_dir, options)
+    base = serve_http(args.data_dir) if args.http else str(Path(args.data_dir).resolve())
+
+    #Local cluster, synthetic fileset and server, whatever the analysis facility
+    utils.config["global"]["AF"] = "local"
+    utils.config["benchmarking"]["USE_HTC"] = False
+    utils.config["benchmarking"]["XROOTD_CHOICE"] = base
+    import xcache_test
+    from parse_reports import ParsedReport
+    xcache_test.FILESET_LOC = str(fileset_path)
+    xcache_test.XRD_CHOICE = base
+
+    commit, dirty = git_commit()
+    suite = {**options, "transport": "http" if args.http else "file",
+             **{key: utils.config["benchmarking"][key] for key in ("DISABLE_PROCESSING", "IO_FILE_PERCENT", "IO_READ_PATTERN", "PHASE_TIMING", "PREFETCH")}}
+    Path(args.history).parent.mkdir(parents=True, exist_ok=True)
+    for i in range(args.repeats):
+        print(f"\nBenchmark run {i+1}/{args.repeats}")
+        rep_fname = xcache_test.main([])
+        rep = ParsedReport(f"{rep_fname}.parquet")
+        entry = {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "suite": suite,
+            "cpus": os.cpu_count(),
+            "time": rep.TotalTime,
+            "events": rep.num_events,
+            "throughput": rep.throughput,
+            "bandwidth": rep.bandwidth,
+            "chunk_fail_rate": rep.tot_chunk_fail_rate,
+            "report": f"{rep_fname}.parquet",
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        print(f"{rep.throughput:.1f} events/s, {rep.bandwidth:.2f} MB/s")
+    print_history(args.history, suite)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import awkward as ak
+from coffea.nanoevents import NanoEventsFactory, NanoAODSchema
+import numpy as np
+
+import utils
+
+# Micro-benchmark of the reconstruction of the 4j2b observable: the previous version, which builds
+# every trijet combination with ak.combinations, against utils.trijet.top_trijet_mass. Both run
+# eagerly on the jets of synthetic events, for several mean jet multiplicities.
+
+B_TAG_THRESHOLD = 0.1917
+
+def combinations_trijet_mass(jets, btag_threshold):
+    """
+    The trijet reconstruction of TtbarAnalysis before utils.trijet, as the reference.
+    """
+    trijet = ak.combinations(jets, 3, fields=["j1", "j2", "j3"])
+    trijet["p4"] = trijet.j1 + trijet.j2 + trijet.j3
+    max_btag23 = ak.where(trijet.j2.btagPNetB > trijet.j3.btagPNetB, trijet.j2.btagPNetB, trijet.j3.btagPNetB)
+    trijet["max_btag"] = ak.where(trijet.j1.btagPNetB > max_btag23, trijet.j1.btagPNetB, max_btag23)
+    btag_filt = (trijet.j1.btagPNetB > btag_threshold) | (trijet.j2.btagPNetB > btag_threshold) | (trijet.j3.btagPNetB > btag_threshold)
+    trijet = trijet[btag_filt]
+    trijet_mass = trijet["p4"][ak.argmax(trijet.p4.pt, axis=1, keepdims=True)].mass
+    return ak.flatten(trijet_mass)
+
+def measure(function, jets, repeats):
+    """
+    Best wall time over repeats, and peak memory allocated during one call (as seen by tracemalloc,
+    which numpy and awkward buffers are reported to). Returns (time, peak bytes, result).
+    """
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        result = function(jets, B_TAG_THRESHOLD)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    function(jets, B_TAG_THRESHOLD)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, result
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the time and memory of the ak.combinations and kernel trijet reconstructions"
+    )
+    parser.add_argument("--events", type=int, default=20000, help="Number of synthetic events")
+    parser.add_argument("--jets", type=float, nargs="+", default=[4, 7, 10, 14], help="Mean jet multiplicities to benchmark")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed calls of each method, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random values")
+    args = parser.parse_args()
+
+    def load_jets(path):
+        return NanoEventsFactory.from_root({path: "Events"}, schemaclass=NanoAODSchema, delayed=False).events().Jet
+
+    print(f"{'Jets/event':>10}{'Max jets':>10}{'Combinations [s]':>18}{'Kernel [s]':>12}{'Speedup':>9}"
+          f"{'Combinations [MB]':>19}{'Kernel [MB]':>13}{'Identical':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        #Compile the kernel before timing
+        utils.synthetic.write_file(f"{directory}/warmup.root", 10, seed=args.seed, io_branches=False)
+        utils.trijet.top_trijet_mass(load_jets(f"{directory}/warmup.root"), B_TAG_THRESHOLD)
+
+        for jets_per_event in args.jets:
+            path = f"{directory}/jets_{jets_per_event:g}.root"
+            utils.synthetic.write_file(path, args.events, seed=args.seed, basket_entries=args.events,
+                                       io_branches=False, jets_per_event=jets_per_event)
+            jets = load_jets(path)
+            comb_time, comb_peak, comb_mass = measure(combinations_trijet_mass, jets, args.repeats)
+            kernel_time, kernel_peak, kernel_mass = measure(utils.trijet.top_trijet_mass, jets, args.repeats)
+            identical = ak.array_equal(comb_mass, kernel_mass, equal_nan=True) and comb_mass.type == kernel_mass.type
+            print(f"{jets_per_event:>10g}{int(np.max(ak.num(jets))):>10}{comb_time:>18.3f}{kernel_time:>12.3f}{comb_time/kernel_time:>9.1f}"
+                  f"{comb_peak/1e6:>19.1f}{kernel_peak/1e6:>13.1f}{str(identical):>11}")
+
+if __name__ == "__main__":
+    main()
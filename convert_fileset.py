@@ -0,0 +1,20 @@
+import argparse
+
+import utils
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert .json.gz filesets to the binary fileset format"
+    )
+    parser.add_argument("filesets", nargs="+", help="Filesets (.json.gz) to convert")
+    parser.add_argument("-o", "--output", help="Output file. Only allowed with a single input. By default, the input name with a .arrow suffix")
+    args = parser.parse_args()
+
+    if args.output and len(args.filesets) > 1:
+        parser.error("--output can only be used with a single fileset")
+    for fileset in args.filesets:
+        path = utils.filesets.convert(fileset, args.output)
+        print(f"Converted {fileset} to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import gzip
+import json
+import os
+from pathlib import Path
+
+import utils
+import xcache_test
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add the branch-size index of each dataset to a .json.gz fileset"
+    )
+    parser.add_argument("fileset", help="Fileset (.json.gz) to index")
+    parser.add_argument("-o", "--output", help="Output file. By default, the fileset is updated in place")
+    parser.add_argument("--server", nargs="+", default=xcache_test.XRD_CHOICE, help="XRootD server to read the files through, as in XROOTD_CHOICE (several to spread the files over them)")
+    parser.add_argument("--files", type=int, default=1, help="Number of files of each dataset to index")
+    parser.add_argument("--rebuild", action="store_true", help="Index datasets that already have an index again")
+    args = parser.parse_args()
+    server = args.server[0] if isinstance(args.server, list) and len(args.server) == 1 else args.server
+
+    with gzip.open(args.fileset, "rt") as file:
+        fileset = json.load(file)
+    indexed = utils.branchsizes.index_fileset(
+        fileset,
+        xrd_base=xcache_test.get_xrd_base(server),
+        files_per_dataset=args.files,
+        rebuild=args.rebuild,
+        timeout=utils.config["benchmarking"]["TIMEOUT"],
+    )
+    print(f"Indexed {len(indexed)} datasets, {sum(utils.branchsizes.SIZES_KEY in dataset for dataset in fileset.values())}/{len(fileset)} have an index")
+
+    #Written under a temporary name and renamed, so that the fileset is never left partial
+    output = Path(args.output or args.fileset)
+    tmp_output = output.with_name(f"{output.name}.{os.getpid()}.tmp")
+    with gzip.open(tmp_output, "wt") as file:
+        json.dump(fileset, file)
+    os.replace(tmp_output, output)
+    print(f"Wrote {output}")
+
+if __name__ == "__main__":
+    main()
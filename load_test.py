@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import datetime
+from pathlib import Path
+
+import utils
+import xcache_test
+
+def main():
+    loadgen_config = utils.config["loadgen"]
+    parser = argparse.ArgumentParser(
+        description="XRootD/XCache load generator, reading the benchmark fileset without coffea or dask"
+    )
+    parser.add_argument("--mode", choices=["closed", "open"], default=loadgen_config["MODE"], help="Closed loop (fixed number of concurrent readers) or open loop (fixed request rate)")
+    parser.add_argument("--concurrency", type=int, default=loadgen_config["CONCURRENCY"], help="Number of concurrent readers in closed loop")
+    parser.add_argument("--rate", type=float, default=loadgen_config["RATE"], help="Requests per second in open loop")
+    parser.add_argument("--duration", type=float, default=loadgen_config["DURATION"], help="Seconds to keep sending requests (default: read everything once)")
+    parser.add_argument("--read", choices=["branches", "ranges"], default=loadgen_config["READ"], help="Read the baskets of the IO branches, or whole files in blocks")
+    parser.add_argument("--block-size", type=int, default=loadgen_config["BLOCK_SIZE"], help="Bytes per request when reading whole files")
+    parser.add_argument("--interval", type=float, default=loadgen_config["INTERVAL"], help="Seconds per bin of the throughput over time")
+    parser.add_argument("--server", nargs="+", default=xcache_test.XRD_CHOICE, help="XRootD server, as in XROOTD_CHOICE (several to spread the files over them)")
+    args = parser.parse_args()
+    server = args.server[0] if isinstance(args.server, list) and len(args.server) == 1 else args.server
+
+    #Same files and chunks as xcache_test.py
+    fileset_ready, _ = xcache_test.get_fileset(server, xcache_test.N_FILES_MAX_PER_SAMPLE, xcache_test.N_CHUNKS_MAX_PER_FILE)
+    branches = utils.branchsizes.io_branches(fileset_ready) if args.read == "branches" else None
+    requests = asyncio.run(utils.loadgen.plan_requests(fileset_ready, args.read, branches=branches, block_size=args.block_size))
+    print(f"Planned {len(requests)} requests")
+
+    generator = utils.loadgen.LoadGenerator(requests, mode=args.mode, concurrency=args.concurrency, rate=args.rate, duration=args.duration)
+    table = asyncio.run(generator.run())
+    summary = utils.loadgen.summarize(table, generator.t_start, generator.t_stop, interval=args.interval)
+
+    print("LOAD TEST:\n----------------------------------------------------")
+    print(f"Requests: {summary['requests']} ({summary['failed_requests']} failed) in {summary['elapsed']:.2f} seconds")
+    print(f"Request rate: {summary['request_rate']:.1f} requests/s")
+    print(f"Data rate: {summary['bandwidth']:.2f} MB/s")
+    for name, val in summary["latency"].items():
+        print(f"Latency {name}: {1000*val:.1f} ms")
+
+    Path(f"reports/{utils.reports.server_label(xcache_test.server_name(server))}").mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    out_name = f"reports/{utils.reports.server_label(xcache_test.server_name(server))}/loadgen_{args.mode}_{timestamp}.parquet"
+    run_info = {
+        "server": xcache_test.server_name(server),
+        "xrd_base": str(xcache_test.get_xrd_base(server)),
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "duration": args.duration,
+        "read": args.read,
+        "branches": branches,
+        "block_size": args.block_size if args.read == "ranges" else None,
+        "timestamp": timestamp,
+        **summary,
+    }
+    utils.loadgen.write_requests(table, out_name, run_info)
+    print(f"Wrote per-request latencies to {out_name}")
+
+if __name__ == "__main__":
+    main()
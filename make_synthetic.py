@@ -0,0 +1,39 @@
+import argparse
+
+import utils
+
+def add_size_arguments(parser):
+    parser.add_argument("--files-per-dataset", type=int, default=2, help="Files written for each dataset")
+    parser.add_argument("--events-per-file", type=int, default=50000, help="Events in each file")
+    parser.add_argument("--step-size", type=int, default=10000, help="Events per chunk in the fileset")
+    parser.add_argument("--basket-entries", type=int, default=10000, help="Events per basket in the files")
+    parser.add_argument("--no-io-branches", action="store_true", help="Only write the branches used by the processor, not the other IO_BRANCHES")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random values")
+
+def size_options(args):
+    """
+    Keyword arguments of utils.synthetic.make_fileset from the arguments of add_size_arguments.
+    """
+    return {
+        "files_per_dataset": args.files_per_dataset,
+        "events_per_file": args.events_per_file,
+        "step_size": args.step_size,
+        "basket_entries": args.basket_entries,
+        "io_branches": not args.no_io_branches,
+        "seed": args.seed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write synthetic NanoAOD-like files and the matching fileset"
+    )
+    parser.add_argument("--output", default=".synthetic", help="Directory to write the files and fileset.json.gz to")
+    add_size_arguments(parser)
+    args = parser.parse_args()
+
+    fileset_path = utils.synthetic.make_fileset(args.output, **size_options(args))
+    print(f"Wrote synthetic files under {args.output}/store and the fileset to {fileset_path}")
+    print(f"To use them, set FILESET_LOC in xcache_test.py to {fileset_path} and XROOTD_CHOICE to the absolute path of {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,34 @@
 import argparse
-import awkward as ak
-import pickle as pkl
+from concurrent.futures import ProcessPoolExecutor
+import glob
+from pathlib import Path
+import re
 import matplotlib.pyplot as plt
 import hist
+import numpy as np
+from scipy import stats
+
+import utils
 
 class ParsedReport:
+    #Only these columns are read from the report file
+    COLUMNS = ["dataset", "file", "site", "start", "stop", "message", "duration",
+               "requested_bytes", "received_bytes", "num_requests", *utils.reports.PHASES, "prefetch_lead",
+               "speculated_requests", "speculation_wins", "attempt", "final"]
+
     def __init__(self,rep):
-        with open(rep,"rb") as f:
-            reports_plus = pkl.load(f)
-        self.reports = {}
-        for dset, infos in reports_plus.items():
-            if dset != "TotalTime":
-                self.reports[dset] = infos
+        self.path = rep
+        self.attempts, self.run_info = utils.reports.read_report(rep, columns=self.COLUMNS)
+        #Chunks read again by retry passes count once, with the result of their last attempt
+        self.table = utils.reports.final_chunks(self.attempts)
         #The total time, if available
-        self.TotalTime = reports_plus.get("TotalTime",None)
-        self.errors = {}
-        for dset in self.reports.keys():
-            self.errors[dset] = self.reports[dset][~ak.is_none(self.reports[dset].message)]
-
-        #Calculate some aggregate metrics
-        self._chunk_fail_rate()
-        self._count_chunks()
-        self._file_fail_rate()
-        self._count_files()
-        self._count_sites()
-        self._count_messages()
+        self.TotalTime = self.run_info.get("TotalTime",None)
+
+        #Calculate all aggregate metrics in one pass
+        self.tables = utils.reports.aggregate(self.table)
+        self._dataset_metrics()
+        self._site_metrics()
+        self._message_metrics()
 
     def print_metrics(self,sites=False):
         print("AGGREGATE INFO:\n----------------------------------------------------")
@@ -34,17 +38,37 @@ class ParsedReport:
         print(f"Total chunk read error rate: {100*self.tot_chunk_fail_rate}%")
         if self.TotalTime is not None:
             print(f"Total time of test: {self.TotalTime:.2f} seconds")
+            print(f"Throughput: {self.throughput:.1f} events/s ({self.num_events} events read)")
+            if self.received_bytes:
+                print(f"Data rate from {self.run_info.get('xrd_base', 'server')}: {self.bandwidth:.2f} MB/s")
         else:
             print("Total time of test unavailable for this report")
+        if self.received_bytes:
+            print(f"Data received: {self.received_bytes/1e6:.1f} MB ({self.requested_bytes/1e6:.1f} MB requested in {self.num_requests} requests)")
+        else:
+            print("Byte counts unavailable for this report")
+        if self.run_info.get("task_duration_tasks"):
+            print(f"Read task durations: {self.run_info['task_duration_mean']:.2f} +- {self.run_info['task_duration_std']:.2f} seconds, "
+                  f"p99 {self.run_info['task_duration_p99']:.2f}, longest {self.run_info['task_duration_max']:.2f} "
+                  f"({self.run_info['task_duration_tasks']} tasks)")
+        if self.run_info.get("rechunk_target") is not None:
+            print(f"Fileset re-chunked to {self.run_info['rechunk_target']:g} {self.run_info['rechunk_by']} per task")
+        if "io_read_pattern" in self.run_info:
+            print(f"I/O only, read pattern: {self.run_info['io_read_pattern']} ({self.run_info['io_requests']} requests)")
+            if self.run_info.get("io_target_bytes") is not None:
+                print(f"Bytes read: {self.run_info['io_bytes_read']/1e6:.1f} MB, for a target of {self.run_info['io_target_bytes']/1e6:.1f} MB "
+                      f"({100*self.run_info['io_target_fraction']:g}% of the files)")
         
         print("\n========================================================\n")
         print("PER-DATASET INFO:\n----------------------------------------------------")
-        for dset in self.reports.keys():
+        for dset in self.datasets:
             print(f"Dataset: {dset}")
-            print(f"\tNumber of files: {len(set(self.reports[dset].args[:,0]))}")
+            print(f"\tNumber of files: {self.dataset_files[dset]}")
             print(f"\tFile read error rate: {100*self.file_fail_rates[dset]}%")
-            print(f"\tNumber of chunks: {ak.num(self.reports[dset],axis=0)}")
+            print(f"\tNumber of chunks: {self.dataset_chunks[dset]}")
             print(f"\tChunk read error rate: {100*self.chunk_fail_rates[dset]}%")
+            if self.received_bytes:
+                print(f"\tData received: {self.dataset_received_bytes[dset]/1e6:.1f} MB")
         print("\n========================================================\n")
         print("ERROR MESSAGES:\n----------------------------------------------------")
         for msg in self.messages:
@@ -58,64 +82,238 @@ class ParsedReport:
             print(f"Site: {site}")
             print(f"\tNumber of files: {self.site_counts[site]}")
             print(f"\tFile read failure rate at this site: {100*self.site_error_counts[site]/self.site_counts[site]}%")
+            if self.site_received_bytes[site]:
+                print(f"\tData received from this site: {self.site_received_bytes[site]/1e6:.1f} MB")
+                if self.TotalTime:
+                    print(f"\tData rate over the run: {self.site_received_bytes[site]/1e6/self.TotalTime:.2f} MB/s")
+                print(f"\tData rate per task: {self.site_received_bytes[site]/1e6/self.site_read_time[site]:.2f} MB/s")
+                print(f"\tMean file open latency: {1000*self.site_open_time[site]/self.site_read_chunks[site]:.1f} ms")
 
-    def _chunk_fail_rate(self):
-        self.chunk_fail_rates = {}
-        for dset in self.reports.keys():
-            self.chunk_fail_rates[dset] = ak.num(self.errors[dset],axis=0)/ak.num(self.reports[dset],axis=0)
-
-    def _count_chunks(self):
-        self.num_chunks = 0
-        self.num_error_chunks = 0
-        for dset in self.reports.keys():
-            self.num_chunks += ak.num(self.reports[dset],axis=0)
-            self.num_error_chunks += ak.num(self.errors[dset],axis=0)
-        self.tot_chunk_fail_rate = self.num_error_chunks/self.num_chunks
+    def print_phases(self):
+        """
+        Print p50/p95/p99 of the time spent in each phase of a chunk, per dataset and per server.
+        """
+        for by, title in [("dataset", "PER-DATASET"), ("site", "PER-SERVER")]:
+            percentiles = utils.reports.phase_percentiles(self.table, by).to_pylist()
+            print("\n========================================================\n")
+            print(f"{title} PHASE TIMES [s]:\n----------------------------------------------------")
+            if not percentiles:
+                print("Phase times unavailable for this report")
+                continue
+            current = None
+            for row in percentiles:
+                if row[by] != current:
+                    current = row[by]
+                    print(f"{'Dataset' if by == 'dataset' else 'Server'}: {current}")
+                print(f"\t{row['phase']:<12}p50 {row['p50']:8.3f}  p95 {row['p95']:8.3f}  p99 {row['p99']:8.3f}  ({row['chunks']} chunks)")
+
+    def print_prefetch(self):
+        """
+        Print how many chunks were staged ahead of their read, if the run used prefetching.
+        """
+        stats = utils.reports.prefetch_stats(self.table)
+        if stats is None:
+            return
+        print("\n========================================================\n")
+        print("PREFETCH INFO:\n----------------------------------------------------")
+        print(f"Staged branches: {', '.join(self.run_info.get('prefetch_branches', []))}")
+        print(f"Data staged: {self.run_info.get('prefetch_staged_bytes', 0)/1e6:.1f} MB")
+        print(f"Chunks staged before being read (hits): {100*stats['hits']/stats['chunks']:.1f}%")
+        print(f"Chunks staged after their read started: {100*stats['late']/stats['chunks']:.1f}%")
+        print(f"Chunks not staged (misses): {100*stats['misses']/stats['chunks']:.1f}%")
+        print(f"Median time between staging and read: {stats['median_lead']:.2f} seconds")
+
+    def print_speculation(self):
+        """
+        Print how often straggling chunks were read from the fallback server too, and how often it
+        answered first, per server, if the run used speculation.
+        """
+        if "speculation_percentile" not in self.run_info:
+            return
+        print("\n========================================================\n")
+        print("SPECULATION INFO:\n----------------------------------------------------")
+        print(f"Fallback server: {self.run_info['speculation_fallback']}")
+        threshold = self.run_info["speculation_threshold"]
+        print(f"Threshold: p{self.run_info['speculation_percentile']:g} of the completed chunk reads, at least "
+              f"{self.run_info['speculation_min_seconds']:g} seconds ({f'{threshold:.2f} seconds' if threshold is not None else 'never reached'})")
+        if self.run_info.get("speculation_error") is not None:
+            print(f"The threshold stopped being updated during the run: {self.run_info['speculation_error']}")
+        for row in utils.reports.speculation_stats(self.table).to_pylist():
+            print(f"Server: {row['site']}")
+            print(f"\tChunks read from the fallback too: {row['speculated_chunks']} of {row['chunks']} "
+                  f"({100*row['speculated_chunks']/row['chunks']:.2f}%, {row['speculated_requests']} requests)")
+            if row["speculated_chunks"]:
+                print(f"\tChunks where the fallback answered first: {row['won_chunks']} "
+                      f"({100*row['won_chunks']/row['speculated_chunks']:.1f}%, {row['won_requests']} requests)")
+
+    def print_retries(self):
+        """
+        Print how many of the chunks that failed were read successfully by the retry passes, if the
+        run had any.
+        """
+        stats = utils.reports.retry_stats(self.attempts)
+        if stats is None:
+            return
+        print("\n========================================================\n")
+        print("RETRY INFO:\n----------------------------------------------------")
+        if self.run_info.get("retry_xrd_base") is not None:
+            print(f"Retried from: {self.run_info['retry_xrd_base']}")
+        rows = stats.to_pylist()
+        print(f"First pass: {rows[0]['failed_chunks']} of {rows[0]['chunks']} chunks failed "
+              f"({100*self.first_try_fail_rate:.2f}%)")
+        for row in rows[1:]:
+            print(f"Retry pass {row['attempt']}: {row['recovered_chunks']} of {row['chunks']} chunks recovered")
+        print(f"Chunks that failed permanently: {self.num_error_chunks} ({100*self.tot_chunk_fail_rate:.2f}%)")
+        if self.run_info.get("retry_time") is not None:
+            print(f"Time spent retrying: {self.run_info['retry_time']:.2f} seconds "
+                  f"(first pass {self.run_info['first_pass_time']:.2f} seconds)")
+        if self.run_info.get("retry_backoff_time"):
+            print(f"Backoff before the retry passes, not counted in the total time: {self.run_info['retry_backoff_time']:.2f} seconds")
+
+    def print_endpoints(self):
+        """
+        Print the share of the files, events and data of every endpoint, and how unevenly they
+        were loaded, if the run was spread over several servers.
+        """
+        if not self.endpoints:
+            return
+        print("\n========================================================\n")
+        print("ENDPOINTS INFO:\n----------------------------------------------------")
+        weights = self.run_info.get("endpoint_weights")
+        print(f"Files spread over {len(self.endpoints)} endpoints by {self.run_info.get('endpoint_strategy')}"
+              + (f" (weights {', '.join(f'{w:g}' for w in weights)})" if weights else ""))
+        if self.TotalTime:
+            line = f"Aggregate throughput: {self.throughput:.1f} events/s"
+            if self.received_bytes:
+                line += f", {self.bandwidth:.2f} MB/s"
+            print(line)
+        for row in self.endpoint_rows:
+            print(f"Endpoint: {row['site']}")
+            if not row.get("chunks"):
+                print("\tNo files")
+                continue
+            print(f"\tFiles: {row['files']} ({100*row['files']/self.num_files:.1f}%), "
+                  f"chunks: {row['chunks']} ({100*(row['chunks'] - row['read_chunks'])/row['chunks']:.2f}% failed)")
+            print(f"\tEvents read: {row['events']} ({100*row['events']/max(self.num_events, 1):.1f}%)")
+            if self.TotalTime:
+                print(f"\tThroughput over the run: {row['events']/self.TotalTime:.1f} events/s")
+            if row["received_bytes"]:
+                print(f"\tData received: {row['received_bytes']/1e6:.1f} MB ({100*row['received_bytes']/self.received_bytes:.1f}%)")
+                if self.TotalTime:
+                    print(f"\tData rate over the run: {row['received_bytes']/1e6/self.TotalTime:.2f} MB/s")
+                print(f"\tData rate per task: {row['received_bytes']/1e6/row['read_time']:.2f} MB/s")
+        if self.endpoint_imbalance is not None:
+            print(f"Imbalance (largest share of the events over its expected share): {self.endpoint_imbalance:.2f}")
 
-    def _file_fail_rate(self):
+    def load_timeline(self):
+        """
+        Read the task stream saved next to the report, if any. Returns whether there is one.
+        """
+        path = utils.timeline.tasks_path(self.path)
+        if not Path(path).is_file():
+            self.tasks = None
+            return False
+        self.tasks, self.tasks_info = utils.timeline.read_tasks(path)
+        return True
+
+    def print_timeline(self, tail_fraction=0.95, min_gap=1.0):
+        """
+        Print the ramp-up of the workers, their idle gaps, the concurrency and the tail of the run,
+        from the task stream saved next to the report.
+        """
+        print("\n========================================================\n")
+        print("TIMELINE INFO (seconds since the start of the run):\n----------------------------------------------------")
+        if not self.load_timeline():
+            print("Task stream unavailable for this report")
+            return
+        stats = utils.timeline.timeline_stats(self.tasks, self.tasks_info, tail_fraction, min_gap)
+        if not stats["tasks"]:
+            print("No tasks in the task stream of this report")
+            return
+        requested = self.tasks_info.get("max_workers")
+        print(f"Workers that ran tasks: {stats['workers']}" + (f" (of {requested} requested)" if requested else ""))
+        print(f"First task started at: {stats['first_task_start']:.2f}")
+        print(f"Half of the workers had started a task at: {stats['half_workers_start']:.2f}")
+        print(f"All of the workers had started a task at: {stats['all_workers_start']:.2f}")
+        print(f"Concurrency: mean {stats['mean_concurrency']:.1f} tasks, peak {stats['peak_concurrency']}")
+        print(f"Worker idle gaps of at least {min_gap:g} seconds: {stats['worker_idle_gaps']}, "
+              f"{stats['worker_idle_time']:.1f} worker-seconds in total, longest {stats['longest_worker_idle_gap']:.2f}")
+        print(f"Time with no task running: {stats['run_idle_time']:.1f}, longest gap {stats['longest_run_idle_gap']:.2f}")
+        if stats["read_tasks"]:
+            print(f"{100*tail_fraction:g}% of the {stats['read_tasks']} read tasks completed at: {stats['tail_start']:.2f}, "
+                  f"followed by a tail of {stats['tail_duration']:.2f}")
+
+    def timeline_plot(self, interval=None):
+        """
+        Plot the tasks and reads running, the active workers and the event throughput over the run.
+        """
+        timeline = utils.timeline.curves(self.tasks, self.tasks_info, interval).to_pydict()
+        fig, (ax_tasks, ax_rate) = plt.subplots(2, 1, sharex=True, figsize=(8, 6))
+        ax_tasks.step(timeline["time"], timeline["running_tasks"], where="post", label="Running tasks")
+        ax_tasks.step(timeline["time"], timeline["running_reads"], where="post", label="Running reads")
+        ax_tasks.step(timeline["time"], timeline["active_workers"], where="post", label="Workers started")
+        ax_tasks.set_ylabel("Count")
+        ax_tasks.legend()
+        ax_rate.step(timeline["time"], timeline["events_per_second"], where="post")
+        ax_rate.set_ylabel("Throughput [evt/s]")
+        ax_rate.set_xlabel("Time since the start of the run [s]")
+
+    def _dataset_metrics(self):
+        dsets = self.tables["datasets"].to_pydict()
+        self.datasets = dsets["dataset"]
+        self.dataset_chunks = dict(zip(self.datasets, dsets["chunks"]))
+        self.dataset_files = dict(zip(self.datasets, dsets["files"]))
+        self.dataset_received_bytes = dict(zip(self.datasets, dsets["received_bytes"]))
+        self.chunk_fail_rates = {}
         self.file_fail_rates = {}
-        for dset in self.reports.keys():
-            num_files = len(set(self.reports[dset].args[:,0]))
-            num_error_files = len(set(self.errors[dset].args[:,0]))
-            self.file_fail_rates[dset] = num_error_files/num_files
-
-    def _count_files(self):
-        self.num_files = 0
-        self.num_error_files = 0
-        for dset in self.reports.keys():
-            self.num_files += len(set(self.reports[dset].args[:,0]))
-            self.num_error_files += len(set(self.errors[dset].args[:,0]))
+        for i, dset in enumerate(self.datasets):
+            self.chunk_fail_rates[dset] = dsets["failed_chunks"][i]/dsets["chunks"][i]
+            self.file_fail_rates[dset] = dsets["failed_files"][i]/dsets["files"][i]
+        self.num_chunks = sum(dsets["chunks"])
+        self.num_error_chunks = sum(dsets["failed_chunks"])
+        self.num_files = sum(dsets["files"])
+        self.num_error_files = sum(dsets["failed_files"])
+        self.num_events = sum(dsets["events"])
+        self.tot_chunk_fail_rate = self.num_error_chunks/self.num_chunks
+        #Chunks that failed in the first pass, whether or not a retry pass read them later
+        first_pass = np.ones(len(self.attempts), dtype=bool)
+        if "attempt" in self.attempts.column_names:
+            first_pass = self.attempts["attempt"].to_numpy() == 0
+        failed = self.attempts["message"].is_valid().to_numpy(zero_copy_only=False)
+        self.first_try_fail_rate = np.sum(failed & first_pass)/np.sum(first_pass)
         self.tot_file_fail_rate = self.num_error_files/self.num_files
+        self.requested_bytes = sum(dsets["requested_bytes"])
+        self.received_bytes = sum(dsets["received_bytes"])
+        self.num_requests = int(sum(dsets["num_requests"]))
+        #Events and MB read successfully per second of wall-clock time
+        self.throughput = self.num_events/self.TotalTime if self.TotalTime else None
+        self.bandwidth = self.received_bytes/1e6/self.TotalTime if self.TotalTime else None
 
-    def _count_sites(self):
-        self.site_counts = {}
-        self.site_error_counts = {}
-        for dset in self.reports.keys():
-            files = set(self.reports[dset].args[:,0])
-            for f in files:
-                file_count = ak.sum((self.reports[dset].args[:,0] == f) & (self.reports[dset].args[:,2] == "0"))
-                error_file_count = ak.sum((self.errors[dset].args[:,0] == f) & (self.errors[dset].args[:,2] == "0"))
-                site = f.split('/store')[0]
-                self.site_counts[site] = self.site_counts.get(site,0) + file_count
-                self.site_error_counts[site] = self.site_error_counts.get(site,0) + error_file_count
-                
-
-    def _count_messages(self):
-        _messages_list = []
-        for dset in self.errors.keys():
-            _messages_list += list(set(self.errors[dset].message))
-        _messages_set = set(_messages_list)
-        self.messages = ak.str.trim(ak.Array(_messages_set),'\n')
-        self.messages_count = {}
-        for dset in self.errors.keys():
-            if ak.num(self.errors[dset].message,axis=0) == 0:
-                continue
-            for msg in _messages_set:
-                if msg[-1] == '\n':
-                    msg_clean = msg[:-1]
-                else:
-                    msg_clean = msg
-                self.messages_count[msg_clean] = self.messages_count.get(msg_clean,0) + ak.sum(self.errors[dset].message == msg)
+    def _site_metrics(self):
+        sites = self.tables["sites"].to_pydict()
+        self.site_counts = dict(zip(sites["site"], sites["files"]))
+        self.site_error_counts = dict(zip(sites["site"], sites["failed_files"]))
+        self.site_received_bytes = dict(zip(sites["site"], sites["received_bytes"]))
+        self.site_read_time = dict(zip(sites["site"], sites["read_time"]))
+        self.site_open_time = dict(zip(sites["site"], sites["open_time"]))
+        self.site_read_chunks = dict(zip(sites["site"], sites["read_chunks"]))
+        #Runs spread over several servers (see utils.endpoints): the site of a chunk is its endpoint,
+        #and endpoints that read nothing count as zero
+        self.endpoints = self.run_info.get("endpoints")
+        self.endpoint_imbalance = None
+        if self.endpoints:
+            rows = {row["site"]: row for row in self.tables["sites"].to_pylist()}
+            self.endpoint_rows = [rows.get(base, {"site": base}) for base in self.endpoints]
+            events = np.array([row.get("events", 0) for row in self.endpoint_rows])
+            weights = np.array(self.run_info.get("endpoint_weights") or [1]*len(self.endpoints), dtype=np.float64)
+            #Largest share of the events over the share expected from the weights, 1 for a perfectly even spread
+            if events.sum():
+                self.endpoint_imbalance = float(np.max((events/events.sum())/(weights/weights.sum())))
+
+    def _message_metrics(self):
+        msgs = self.tables["messages"].to_pydict()
+        self.messages = msgs["message"]
+        self.messages_count = dict(zip(msgs["message"], msgs["chunks"]))
 
     def sites_piechart(self,group_small=False):
         """
@@ -141,48 +339,216 @@ class ParsedReport:
         ax.pie(counts,labels=sites)
 
     def msg_hist(self):
-        messages = []
-        sites = []
-        for infos in self.errors.values():
-            messages += list(infos.message)
-            sites += list(ak.str.split_pattern(infos.args[:,0],'/store')[:,0])
-
-        site_axis = hist.axis.StrCategory(set(sites),growth=False,name="sites")
-        msg_axis = hist.axis.StrCategory(set(messages),growth=False,name="msg")
+        site_msgs = self.tables["site_messages"].to_pydict()
+        site_axis = hist.axis.StrCategory(sorted(set(site_msgs["site"])),growth=False,name="sites")
+        msg_axis = hist.axis.StrCategory(self.messages,growth=False,name="msg")
         h = hist.Hist(site_axis,msg_axis)
-        h.fill(sites=sites,msg=messages)
+        h.fill(sites=site_msgs["site"],msg=site_msgs["message"],weight=site_msgs["chunks"])
         fig,ax = plt.subplots()
         ax.tick_params(axis='x',labelrotation=90)
         h.plot()
 
+#Report names are <HTC|local>_<workers>_<files>_<chunks>, optionally followed by _<timestamp>
+REPORT_NAME = re.compile(r"^(?P<config>(?:HTC|local)_[^_]+_[^_]+_[^_]+)(?:_(?P<timestamp>\d{8}_\d{6}))?$")
+#Metrics shown by the compare subcommand: (attribute of summarize_report output, column title, format)
+COMPARE_METRICS = [
+    ("throughput", "Throughput [evt/s]", ".1f"),
+    ("bandwidth", "Data rate [MB/s]", ".2f"),
+    ("first_try_fail_rate", "First-try chunk fail [%]", ".2f"),
+    ("chunk_fail_rate", "Chunk fail [%]", ".2f"),
+    ("file_fail_rate", "File fail [%]", ".2f"),
+    ("time", "Time [s]", ".1f"),
+    ("task_std", "Task std [s]", ".2f"),
+    ("task_max", "Longest task [s]", ".1f"),
+    ("speculated", "Speculated [%]", ".2f"),
+    ("speculation_won", "Fallback won [%]", ".1f"),
+    ("ramp_up", "Worker ramp-up [s]", ".1f"),
+    ("tail", "Tail after 95% [s]", ".1f"),
+    ("endpoint_imbalance", "Endpoint imbalance", ".2f"),
+]
+
+def find_reports(patterns):
+    """
+    Expand directories (searched recursively) and glob patterns into a sorted list of report files,
+    i.e. of the files whose names follow the report naming convention (see REPORT_NAME).
+    """
+    paths = set()
+    for pattern in patterns:
+        if Path(pattern).is_dir():
+            candidates = Path(pattern).rglob("*")
+        else:
+            candidates = (Path(p) for p in glob.glob(pattern, recursive=True))
+        #Task streams, load tests and warm-cache file tables are saved next to the reports, so
+        #only files named like reports are kept
+        paths.update(str(p) for p in candidates if p.suffix in (".parquet", ".pkl") and p.is_file()
+                     and REPORT_NAME.match(p.stem))
+    return sorted(paths)
+
+def summarize_report(path, rep=None):
+    """
+    Parse one report (unless it is given, as a ParsedReport) and return its server, configuration
+    and scalar metrics. The server and configuration come from the report metadata when available,
+    and otherwise from the reports/<server>/<config>[_<timestamp>] naming convention. Server names
+    use the directory form (see utils.reports.server_label).
+    """
+    rep = rep or ParsedReport(path)
+    match = REPORT_NAME.match(Path(path).stem)
+    if match is None:
+        raise ValueError(f"Report name {path} does not follow the <HTC|local>_<workers>_<files>_<chunks> convention")
+    config = match.group("config")
+    #Runs with re-chunked filesets are compared separately
+    if rep.run_info.get("rechunk_target") is not None:
+        config += f" rechunked to {rep.run_info['rechunk_target']:g} {rep.run_info['rechunk_by']}"
+    #Runs spread over several servers are compared per strategy
+    if rep.endpoints:
+        config += f" spread by {rep.run_info.get('endpoint_strategy')}"
+    speculated, speculation_won = None, None
+    if "speculation_percentile" in rep.run_info:
+        config += f" speculating against {utils.reports.server_label(rep.run_info['speculation_fallback'])}"
+        speculated = 100*rep.run_info["speculation_chunks"]/rep.num_chunks
+        if rep.run_info["speculation_chunks"]:
+            speculation_won = 100*rep.run_info["speculation_wins"]/rep.run_info["speculation_chunks"]
+    #Time taken by the batch system to start the workers, and by the slowest reads
+    ramp_up, tail = None, None
+    if rep.load_timeline():
+        timeline = utils.timeline.timeline_stats(rep.tasks, rep.tasks_info)
+        ramp_up = timeline.get("all_workers_start")
+        tail = timeline.get("tail_duration")
+    return {
+        "path": path,
+        "server": utils.reports.server_label(rep.run_info.get("server", Path(path).parent.name)),
+        "config": config,
+        "timestamp": rep.run_info.get("timestamp", match.group("timestamp")),
+        "throughput": rep.throughput,
+        "bandwidth": rep.bandwidth if rep.received_bytes else None,
+        "first_try_fail_rate": 100*rep.first_try_fail_rate,
+        "chunk_fail_rate": 100*rep.tot_chunk_fail_rate,
+        "file_fail_rate": 100*rep.tot_file_fail_rate,
+        "time": rep.TotalTime,
+        "task_std": rep.run_info.get("task_duration_std"),
+        "task_max": rep.run_info.get("task_duration_max"),
+        "speculated": speculated,
+        "speculation_won": speculation_won,
+        "ramp_up": ramp_up,
+        "tail": tail,
+        "endpoint_imbalance": rep.endpoint_imbalance,
+    }
+
+def mean_ci(values, confidence=0.95):
+    """
+    Mean and half-width of the Student-t confidence interval of the mean. The half-width is nan
+    for fewer than two values.
+    """
+    values = np.asarray([v for v in values if v is not None], dtype=float)
+    if len(values) == 0:
+        return np.nan, np.nan
+    if len(values) < 2:
+        return values.mean(), np.nan
+    sem = values.std(ddof=1)/np.sqrt(len(values))
+    return values.mean(), sem*stats.t.ppf(0.5 + confidence/2, len(values) - 1)
+
+def welch_pvalue(values, reference):
+    """
+    Two-sided p-value of Welch's t-test for a difference in means, or nan if either sample has
+    fewer than two values.
+    """
+    values = [v for v in values if v is not None]
+    reference = [v for v in reference if v is not None]
+    if len(values) < 2 or len(reference) < 2:
+        return np.nan
+    return stats.ttest_ind(values, reference, equal_var=False).pvalue
+
+def compare_reports(paths, reference="cmsxrootd.fnal.gov", confidence=0.95, workers=None):
+    """
+    Parse reports in parallel, group them by configuration and server, and print a side-by-side
+    table of mean metrics with confidence intervals. The throughput of each server is tested
+    against the reference server with the same configuration.
+    """
+    reference = utils.reports.server_label(reference)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        summaries = list(pool.map(summarize_report, paths))
+    groups = {}
+    for summary in summaries:
+        groups.setdefault(summary["config"], {}).setdefault(summary["server"], []).append(summary)
+
+    header = f"{'Server':<22}{'Runs':>5}" + "".join(f"{title:>26}" for _, title, _ in COMPARE_METRICS)
+    header += f"{'p(throughput) vs ' + reference:>36}"
+    for config in sorted(groups):
+        print(f"\nCONFIG: {config} (mean +- {100*confidence:g}% CI)\n" + "-"*len(header))
+        print(header)
+        ref_throughput = [s["throughput"] for s in groups[config].get(reference, [])]
+        for server in sorted(groups[config]):
+            runs = groups[config][server]
+            line = f"{server:<22}{len(runs):>5}"
+            for metric, _, fmt in COMPARE_METRICS:
+                mean, ci = mean_ci([s[metric] for s in runs], confidence)
+                line += f"{f'{mean:{fmt}} +- {ci:{fmt}}':>26}"
+            if server == reference:
+                line += f"{'(reference)':>36}"
+            else:
+                line += f"{welch_pvalue([s['throughput'] for s in runs], ref_throughput):>36.3g}"
+            print(line)
+    return summaries
+
 def main():
     parser = argparse.ArgumentParser(
         description="Report parser"
     )
-    parser.add_argument("--report", type=str, default="_unset_", help="Where the report to be read is")
+    parser.add_argument("--report", type=str, default="_unset_", help="Where the report to be read is (.parquet, or .pkl for older reports)")
     parser.add_argument("--messages", action="store_true", help="Save a histogram figure of the different error messages")
     parser.add_argument("--sites", action="store_true", help="Save a pie chart showing the sites that files were drawn from")
+    parser.add_argument("--phases", action="store_true", help="Print percentiles of the time spent opening, fetching, decompressing, computing and filling each chunk")
+    parser.add_argument("--timeline", action="store_true", help="Print the worker ramp-up, idle gaps, concurrency and tail of the run from its task stream, and save a figure of them over time")
+    parser.add_argument("--timeline-interval", type=float, default=None, help="Seconds per bin of the timeline figure (default: 100 bins over the run)")
+    subparsers = parser.add_subparsers(dest="command")
+    compare = subparsers.add_parser("compare", help="Compare servers across many reports, grouped by configuration")
+    compare.add_argument("paths", nargs="*", default=["reports"], help="Report files, directories or glob patterns (default: reports/)")
+    compare.add_argument("--reference", type=str, default="cmsxrootd.fnal.gov", help="Server that the others are tested against")
+    compare.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    compare.add_argument("--workers", type=int, default=None, help="Number of processes used to parse reports")
 
     args = parser.parse_args()
 
+    if args.command == "compare":
+        paths = find_reports(args.paths)
+        if not paths:
+            print(f"No reports found in {args.paths}")
+            return
+        print(f"Comparing {len(paths)} reports")
+        compare_reports(paths, reference=args.reference, confidence=args.confidence, workers=args.workers)
+        return
+
     if args.report == "_unset_":
-        print("Please indicate a report to be read with `python3 parse_reports.py --report path/to/report.pkl`")
+        print("Please indicate a report to be read with `python3 parse_reports.py --report path/to/report.parquet`")
         return
     print(f"Reading report from {args.report}")
 
     rep = ParsedReport(args.report)
     rep.print_metrics(sites=True)
+    rep.print_prefetch()
+    rep.print_speculation()
+    rep.print_retries()
+    rep.print_endpoints()
+    if args.phases:
+        rep.print_phases()
+    if args.timeline:
+        rep.print_timeline()
+        if rep.tasks is not None and len(rep.tasks):
+            output_name = Path(args.report).stem+"_timeline.png"
+            rep.timeline_plot(args.timeline_interval)
+            plt.savefig(output_name)
+            print(f"Saved timeline figure to {output_name}")
 
     if args.messages:
         if rep.tot_file_fail_rate == 0.0:
             print("Unable to generate a figure of error messages, since there were no file read errors")
         else:
-            output_name = args.report.split("/")[-1].strip(".pkl")+"_messages.png"
+            output_name = Path(args.report).stem+"_messages.png"
             rep.msg_hist()
             plt.savefig(output_name)
             print(f"Saved messages figure to {output_name}")
     if args.sites:
-        output_name = args.report.split("/")[-1].strip(".pkl")+"_sites.png"
+        output_name = Path(args.report).stem+"_sites.png"
         rep.sites_piechart()
         plt.savefig(output_name)
         print(f"Saved sites figure to {output_name}")
@@ -0,0 +1,347 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import json
+from pathlib import Path
+import re
+import sqlite3
+
+# Run-history database. Answering questions across many runs (e.g. how the throughput of a server
+# has changed over a month at 250 workers) would otherwise mean parsing every report again. Each
+# report is ingested once: its configuration, time and aggregate metrics go to one row of the
+# runs table, and its per-site and per-dataset metrics to the sites and datasets tables, in a
+# local SQLite file indexed by server, configuration and time. Queries only need the standard
+# library, so that they take milliseconds: parse_reports and utils (which import dask and
+# coffea) are only imported to ingest reports.
+
+DEFAULT_DB = "reports/history.sqlite"
+SCHEMA_VERSION = 1
+# Columns of each table, after the id (runs) or run_id (sites and datasets)
+RUN_COLUMNS = {
+    "path": "TEXT NOT NULL UNIQUE",
+    # Modification time of the report when it was ingested, to ingest it again if it changes
+    "mtime": "REAL",
+    "server": "TEXT",
+    "config": "TEXT",
+    "htc_label": "TEXT",
+    "max_workers": "INTEGER",
+    "max_files": "INTEGER",
+    "max_chunks": "INTEGER",
+    # Start of the run, as YYYY-MM-DD HH:MM:SS
+    "time": "TEXT",
+    "total_time": "REAL",
+    "events": "INTEGER",
+    "files": "INTEGER",
+    "failed_files": "INTEGER",
+    "chunks": "INTEGER",
+    "failed_chunks": "INTEGER",
+    "received_bytes": "REAL",
+    "requested_bytes": "REAL",
+    "num_requests": "INTEGER",
+    "throughput": "REAL",
+    "bandwidth": "REAL",
+    "chunk_fail_rate": "REAL",
+    "first_try_fail_rate": "REAL",
+    "file_fail_rate": "REAL",
+    "task_mean": "REAL",
+    "task_std": "REAL",
+    "task_max": "REAL",
+    "speculated": "REAL",
+    "speculation_won": "REAL",
+    "ramp_up": "REAL",
+    "tail": "REAL",
+    # Everything in the report metadata, as JSON
+    "run_info": "TEXT",
+}
+SITE_COLUMNS = {
+    "site": "TEXT",
+    "files": "INTEGER",
+    "failed_files": "INTEGER",
+    "read_chunks": "INTEGER",
+    "received_bytes": "REAL",
+    "requested_bytes": "REAL",
+    "num_requests": "INTEGER",
+    "read_time": "REAL",
+    "open_time": "REAL",
+}
+DATASET_COLUMNS = {
+    "dataset": "TEXT",
+    "chunks": "INTEGER",
+    "failed_chunks": "INTEGER",
+    "files": "INTEGER",
+    "failed_files": "INTEGER",
+    "events": "INTEGER",
+    "received_bytes": "REAL",
+    "requested_bytes": "REAL",
+    "num_requests": "INTEGER",
+    "read_time": "REAL",
+    "open_time": "REAL",
+}
+# Numeric columns of the runs that trends can be computed for
+TREND_METRICS = [name for name, typ in RUN_COLUMNS.items() if typ in ("REAL", "INTEGER") and name != "mtime"]
+# strftime format of the time periods that trends are grouped by (None for one row per run)
+PERIODS = {"run": None, "day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m"}
+
+def _create_table(name, columns, parent=None):
+    key = "id INTEGER PRIMARY KEY" if parent is None else f"run_id INTEGER NOT NULL REFERENCES {parent}(id) ON DELETE CASCADE"
+    return f"CREATE TABLE IF NOT EXISTS {name} ({key}, {', '.join(f'{col} {typ}' for col, typ in columns.items())})"
+
+def connect(path):
+    """
+    Open the run-history database at path, creating its tables and indexes if needed.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version not in (0, SCHEMA_VERSION):
+        raise ValueError(f"Run-history database {path} has schema version {version}, expected {SCHEMA_VERSION}")
+    with conn:
+        conn.execute(_create_table("runs", RUN_COLUMNS))
+        conn.execute(_create_table("sites", SITE_COLUMNS, "runs"))
+        conn.execute(_create_table("datasets", DATASET_COLUMNS, "runs"))
+        conn.execute("CREATE INDEX IF NOT EXISTS runs_server_config_time ON runs (server, config, time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS runs_config_time ON runs (config, time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS runs_time ON runs (time)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sites_site ON sites (site, run_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sites_run ON sites (run_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS datasets_dataset ON datasets (dataset, run_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS datasets_run ON datasets (run_id)")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+def stored(conn):
+    """
+    Map the path of every ingested report to its modification time when it was ingested.
+    """
+    return dict(conn.execute("SELECT path, mtime FROM runs"))
+
+def _insert(conn, table, columns, row):
+    names = [name for name in columns if name in row]
+    cursor = conn.execute(f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?'*len(names))})",
+                          [row[name] for name in names])
+    return cursor.lastrowid
+
+def insert_run(conn, record):
+    """
+    Store the metrics of one report, replacing those stored for the same path.
+
+    Inputs:
+        conn: sqlite3.Connection
+            Database opened with connect
+        record: dict
+            "run": dict of RUN_COLUMNS (run_info may be a dict), "sites": list of dicts of
+            SITE_COLUMNS, "datasets": list of dicts of DATASET_COLUMNS
+    """
+    run = dict(record["run"])
+    if not isinstance(run.get("run_info"), (str, type(None))):
+        run["run_info"] = json.dumps(run["run_info"])
+    with conn:
+        conn.execute("DELETE FROM runs WHERE path = ?", (run["path"],))
+        run_id = _insert(conn, "runs", RUN_COLUMNS, run)
+        for site in record.get("sites", []):
+            _insert(conn, "sites", {"run_id": None, **SITE_COLUMNS}, {"run_id": run_id, **site})
+        for dataset in record.get("datasets", []):
+            _insert(conn, "datasets", {"run_id": None, **DATASET_COLUMNS}, {"run_id": run_id, **dataset})
+
+def _filters(server=None, config=None, workers=None, since=None, until=None):
+    """
+    WHERE clause (possibly empty) and its parameters for the runs that match every given filter.
+    config is a SQL LIKE pattern, since and until are dates or times (YYYY-MM-DD[ HH:MM:SS]).
+    """
+    clauses, params = [], []
+    for clause, value in [("runs.server = ?", server), ("runs.config LIKE ?", config), ("runs.max_workers = ?", workers),
+                          ("runs.time >= ?", since), ("runs.time < date(?, '+1 day')", until)]:
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def trend(conn, metric, period="day", site=None, **filters):
+    """
+    Trend of a metric over the runs that match the filters (see _filters), oldest first: its mean,
+    minimum and maximum and the number of runs per server, configuration and period, or its value
+    for every run. Returns (column names, rows).
+
+    Inputs:
+        conn: sqlite3.Connection
+            Database opened with connect
+        metric: str
+            One of TREND_METRICS, or of the numeric SITE_COLUMNS if site is given
+        period: str
+            One of PERIODS
+        site: str
+            Site to take the metric from (in the sites table), or None for the metrics of the runs
+    """
+    columns = SITE_COLUMNS if site is not None else RUN_COLUMNS
+    if metric not in columns or columns[metric] not in ("REAL", "INTEGER"):
+        raise ValueError(f"Unknown metric {metric}")
+    if period not in PERIODS:
+        raise ValueError(f"Unknown period {period}, should be one of {', '.join(PERIODS)}")
+    where, params = _filters(**filters)
+    source = "runs"
+    value = f"runs.{metric}"
+    if site is not None:
+        source = "runs JOIN sites ON sites.run_id = runs.id"
+        value = f"sites.{metric}"
+        where += (" AND " if where else " WHERE ") + "sites.site = ?"
+        params.append(site)
+    if PERIODS[period] is None:
+        query = f"SELECT runs.time, runs.server, runs.config, {value} FROM {source}{where} ORDER BY runs.time"
+        return ["time", "server", "config", metric], conn.execute(query, params).fetchall()
+    group = f"strftime('{PERIODS[period]}', runs.time)"
+    query = (f"SELECT {group} AS period, runs.server, runs.config, COUNT({value}), AVG({value}), MIN({value}), MAX({value}) "
+             f"FROM {source}{where} GROUP BY period, runs.server, runs.config ORDER BY period, runs.server, runs.config")
+    return [period, "server", "config", "runs", "mean", "min", "max"], conn.execute(query, params).fetchall()
+
+def list_runs(conn, **filters):
+    """
+    Time, server, configuration, throughput and path of the runs that match the filters (see
+    _filters), oldest first. Returns (column names, rows).
+    """
+    where, params = _filters(**filters)
+    query = f"SELECT time, server, config, throughput, chunk_fail_rate, path FROM runs{where} ORDER BY time"
+    return ["time", "server", "config", "throughput", "chunk_fail_rate", "path"], conn.execute(query, params).fetchall()
+
+def _int_or_none(value):
+    return int(value) if value not in (None, "None") else None
+
+def server_label(server):
+    """
+    Directory form of a server name, as utils.reports.server_label (not imported, to keep queries
+    fast).
+    """
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", server).strip("_")
+
+def run_record(path):
+    """
+    Metrics of one report, as stored by insert_run.
+    """
+    from parse_reports import REPORT_NAME, ParsedReport, summarize_report
+    rep = ParsedReport(path)
+    summary = summarize_report(path, rep)
+    #<HTC|local>_<workers>_<files>_<chunks>, for reports without the values in their metadata
+    htc_label, workers, files, chunks = REPORT_NAME.match(Path(path).stem).group("config").split("_")
+    timestamp = summary["timestamp"]
+    if timestamp is not None:
+        time = datetime.datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+    else:
+        time = datetime.datetime.fromtimestamp(Path(path).stat().st_mtime)
+    run_info = rep.run_info
+    run = {
+        **{key: summary[key] for key in ["server", "config", "throughput", "bandwidth", "chunk_fail_rate", "first_try_fail_rate",
+                                         "file_fail_rate", "task_std", "task_max", "speculated", "speculation_won", "ramp_up", "tail"]},
+        "path": str(Path(path).resolve()),
+        "mtime": Path(path).stat().st_mtime,
+        "htc_label": run_info.get("htc_label", htc_label),
+        "max_workers": run_info.get("max_workers", _int_or_none(workers)),
+        "max_files": run_info.get("max_files", _int_or_none(files)),
+        "max_chunks": run_info.get("max_chunks", _int_or_none(chunks)),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "total_time": rep.TotalTime,
+        "events": int(rep.num_events),
+        "files": int(rep.num_files),
+        "failed_files": int(rep.num_error_files),
+        "chunks": int(rep.num_chunks),
+        "failed_chunks": int(rep.num_error_chunks),
+        "received_bytes": float(rep.received_bytes),
+        "requested_bytes": float(rep.requested_bytes),
+        "num_requests": rep.num_requests,
+        "task_mean": run_info.get("task_duration_mean"),
+        "run_info": run_info,
+    }
+    sites = [{key: row[key] for key in SITE_COLUMNS} for row in rep.tables["sites"].to_pylist()]
+    datasets = [{key: row[key] for key in DATASET_COLUMNS} for row in rep.tables["datasets"].to_pylist()]
+    return {"run": run, "sites": sites, "datasets": datasets}
+
+def _try_run_record(path):
+    try:
+        return run_record(path)
+    except Exception as err:
+        return f"{type(err).__name__}: {err}"
+
+def ingest(db, patterns, workers=None, rebuild=False):
+    """
+    Store the reports found in patterns (see parse_reports.find_reports) in the database, skipping
+    those stored already unless they changed since (or rebuild).
+    """
+    from parse_reports import find_reports
+    conn = connect(db)
+    known = {} if rebuild else stored(conn)
+    paths = [path for path in find_reports(patterns) if known.get(str(Path(path).resolve())) != Path(path).stat().st_mtime]
+    print(f"Ingesting {len(paths)} new or changed reports into {db}")
+    n_stored = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, record in zip(paths, pool.map(_try_run_record, paths)):
+            if isinstance(record, str):
+                print(f"Skipping {path}: {record}")
+                continue
+            insert_run(conn, record)
+            n_stored += 1
+    print(f"Stored {n_stored} reports, {len(stored(conn))} in total")
+    conn.close()
+
+def print_table(columns, rows):
+    """
+    Print rows as a table, with floats to 4 significant digits.
+    """
+    cells = [[f"{val:.4g}" if isinstance(val, float) else str(val) for val in row] for row in rows]
+    widths = [max([len(col), *[len(row[i]) for row in cells]]) for i, col in enumerate(columns)]
+    print("  ".join(f"{col:>{width}}" for col, width in zip(columns, widths)))
+    print("-"*(sum(widths) + 2*(len(widths) - 1)))
+    for row in cells:
+        print("  ".join(f"{val:>{width}}" for val, width in zip(row, widths)))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run-history database of the benchmark reports"
+    )
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"SQLite database (default: {DEFAULT_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Store the reports that are not in the database yet")
+    ingest_parser.add_argument("paths", nargs="*", default=["reports"], help="Report files, directories or glob patterns (default: reports/)")
+    ingest_parser.add_argument("--workers", type=int, default=None, help="Number of processes used to parse reports")
+    ingest_parser.add_argument("--rebuild", action="store_true", help="Store every report again, even if it has not changed")
+    for name, help_text in [("trend", "Print the trend of a metric over time"), ("runs", "List the stored runs")]:
+        query_parser = subparsers.add_parser(name, help=help_text)
+        query_parser.add_argument("--server", default=None, help="Only runs of this server (as in XROOTD_CHOICE)")
+        query_parser.add_argument("--config", default=None, help="Only runs of configurations matching this SQL LIKE pattern, e.g. 'HTC_250_%%'")
+        query_parser.add_argument("--workers", type=int, default=None, help="Only runs with this number of workers")
+        query_parser.add_argument("--since", default=None, help="Only runs from this date on (YYYY-MM-DD)")
+        query_parser.add_argument("--until", default=None, help="Only runs up to this date, included (YYYY-MM-DD)")
+        query_parser.add_argument("--last-days", type=int, default=None, help="Only runs of the last days (instead of --since)")
+        if name == "trend":
+            query_parser.add_argument("--metric", default="throughput", help=f"Metric of the runs: {', '.join(TREND_METRICS)}; "
+                                      "or of a site with --site")
+            query_parser.add_argument("--site", default=None, help="Take the metric from the per-site metrics of this site")
+            query_parser.add_argument("--by", choices=list(PERIODS), default="day", help="Period to average over, or 'run' for every run")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        Path(args.db).parent.mkdir(parents=True, exist_ok=True)
+        ingest(args.db, args.paths, workers=args.workers, rebuild=args.rebuild)
+        return
+    if not Path(args.db).is_file():
+        print(f"No run-history database at {args.db}, create it with `python3 run_history.py ingest`")
+        return
+    conn = connect(args.db)
+    since = args.since
+    if args.last_days is not None:
+        since = (datetime.date.today() - datetime.timedelta(days=args.last_days)).isoformat()
+    filters = {
+        "server": server_label(args.server) if args.server is not None else None,
+        "config": args.config,
+        "workers": args.workers,
+        "since": since,
+        "until": args.until,
+    }
+    if args.command == "trend":
+        try:
+            print_table(*trend(conn, args.metric, args.by, site=args.site, **filters))
+        except ValueError as err:
+            parser.error(str(err))
+    else:
+        print_table(*list_runs(conn, **filters))
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,54 @@
 import awkward as ak
 from coffea import processor
 from coffea.analysis_tools import PackedSelection
-import correctionlib
 import hist
-import hist.dask as hda
 
 import utils # contains code for bookkeeping and cosmetics, as well as some boilerplate
 
+CORRECTIONS_FILE = "corrections.json"
+# Systematic variations of nominal samples: jet kinematics, and event weights with up/down variations
+JET_KINEMATIC_SYSTS = ["pt_scale_up", "pt_res_up"]
+EVENT_SYSTS = [f"btag_var_{i}" for i in range(4)] + ["scale_var"] # scale_var is only for wjets
+
+def fileset_categories(fileset):
+    """
+    Processes and variations to declare as the categories of the histograms: those of the
+    datasets of the fileset, and the systematic variations filled for nominal samples.
+    """
+    processes = []
+    variations = ["nominal", *JET_KINEMATIC_SYSTS, *[f"{syst}_{direction}" for syst in EVENT_SYSTS for direction in ["up", "down"]]]
+    for dataset in fileset.values():
+        if dataset["metadata"]["process"] not in processes:
+            processes.append(dataset["metadata"]["process"])
+        if dataset["metadata"]["variation"] not in variations:
+            variations.append(dataset["metadata"]["variation"])
+    return processes, variations
+
 class TtbarAnalysis(processor.ProcessorABC):
-    def __init__(self):
+    def __init__(self, processes, variations):
 
         # NOTE: START VERSION MIGRATION REGION (VMR), which has been migrated
         # initialize dictionary of hists for signal and control region
+        # categories are declared up front (see fileset_categories), so that weight variations
+        # can be filled together
         self.hist_dict = {}
         for region in ["4j1b", "4j2b"]:
             self.hist_dict[region] = (
-                hda.Hist(hist.axis.Regular(utils.config["global"]["NUM_BINS"], 
+                utils.histograms.VariationHist(hist.axis.Regular(utils.config["global"]["NUM_BINS"], 
                                   utils.config["global"]["BIN_LOW"], 
                                   utils.config["global"]["BIN_HIGH"], 
                                   name="observable", 
                                   label="observable [GeV]"),
-                    hist.axis.StrCategory([], name="process", label="Process", growth=True),
-                    hist.axis.StrCategory([], name="variation", label="Systematic variation", growth=True),
+                    hist.axis.StrCategory(processes, name="process", label="Process"),
+                    hist.axis.StrCategory(variations, name="variation", label="Systematic variation"),
                     storage=hist.storage.Weight()
                 )
             )
         
-        self.cset = correctionlib.CorrectionSet.from_file("corrections.json")
-
-    def only_do_IO(self, events):
-        for branch in utils.config["benchmarking"]["IO_BRANCHES"][
-            utils.config["benchmarking"]["IO_FILE_PERCENT"]
-        ]:
-            if "_" in branch:
-                split = branch.split("_")
-                object_type = split[0]
-                property_name = "_".join(split[1:])
-                ak.materialized(events[object_type][property_name])
-            else:
-                ak.materialized(events[branch])
-        return {"hist": {}}
+        # Only a handle is kept (and shipped with the tasks), workers use their cached copy
+        self.cset = utils.corrections.correction_file(CORRECTIONS_FILE)
 
     def process(self, events):
-        if utils.config["benchmarking"]["DISABLE_PROCESSING"]:
-            # IO testing with no subsequent processing
-            return self.only_do_IO(events)
-
         process = events.metadata["process"]  # "ttbar" etc.
         variation = events.metadata["variation"]  # "nominal" etc.
 
@@ -66,19 +69,22 @@ class TtbarAnalysis(processor.ProcessorABC):
         events["pt_scale_up"] = 1.03
         events["pt_res_up"] = utils.systematics.jet_pt_resolution(events.Jet.pt,events.Jet.phi)
 
-        syst_variations = ["nominal"]
-        jet_kinematic_systs = ["pt_scale_up", "pt_res_up"]
-        event_systs = [f"btag_var_{i}" for i in range(4)]
-        if process == "wjets":
-            event_systs.append("scale_var")
+        jet_kinematic_systs = JET_KINEMATIC_SYSTS
+        event_systs = [syst for syst in EVENT_SYSTS if syst != "scale_var" or process == "wjets"]
 
+        # Selection and observable only change with the jet kinematics, so they are computed once
+        # per kinematic variation. Event weight systematics reuse those of the nominal variation.
         # Only do systematics for nominal samples, e.g. ttbar__nominal
+        kinematic_variations = ["nominal"]
         if variation == "nominal":
-            syst_variations.extend(jet_kinematic_systs)
-            syst_variations.extend(event_systs)
+            kinematic_variations.extend(jet_kinematic_systs)
+        else:
+            event_systs = []
 
-        # for pt_var in pt_variations:
-        for syst_var in syst_variations:
+        # Histogram fills are collected as (region, fill arguments) and done after all variations.
+        # Each fill holds the weights of every variation that shares its observable.
+        fills = []
+        for syst_var in kinematic_variations:
             ### event selection
             # very very loosely based on https://arxiv.org/abs/2006.13076
 
@@ -126,48 +132,43 @@ class TtbarAnalysis(processor.ProcessorABC):
 
                 elif region == "4j2b":
 
-                    # reconstruct hadronic top as bjj system with largest pT
-                    trijet = ak.combinations(region_jets, 3, fields=["j1", "j2", "j3"])  # trijet candidates
-                    trijet["p4"] = trijet.j1 + trijet.j2 + trijet.j3  # calculate four-momentum of tri-jet system
-                    max_btag23 = ak.where(trijet.j2.btagPNetB > trijet.j3.btagPNetB, trijet.j2.btagPNetB, trijet.j3.btagPNetB)
-                    trijet["max_btag"] = ak.where(trijet.j1.btagPNetB > max_btag23, trijet.j1.btagPNetB, max_btag23)
-                    btag_filt = (trijet.j1.btagPNetB > B_TAG_THRESHOLD) | (trijet.j2.btagPNetB > B_TAG_THRESHOLD) | (trijet.j3.btagPNetB > B_TAG_THRESHOLD)
-                    trijet = trijet[btag_filt]  # at least one-btag in trijet candidates
-                    # pick trijet candidate with largest pT and calculate mass of system
-                    trijet_mass = trijet["p4"][ak.argmax(trijet.p4.pt, axis=1, keepdims=True)].mass
-                    observable = ak.flatten(trijet_mass)
+                    # reconstruct hadronic top as bjj system with largest pT, among trijet candidates
+                    # with at least one b-tag, without building all the combinations
+                    observable = utils.trijet.top_trijet_mass(region_jets, B_TAG_THRESHOLD)
 
                     if ak.sum(region_selection)==0:
                         continue
 
+                # Should either be 'nominal' or an object variation systematic
                 syst_var_name = f"{syst_var}"
-                # Break up the filling into event weight systematics and object variation systematics
-                if syst_var in event_systs:
-                    for i_dir, direction in enumerate(["up", "down"]):
-                        # Should be an event weight systematic with an up/down variation
-                        if syst_var.startswith("btag_var"):
-                            i_jet = int(syst_var.rsplit("_",1)[-1])   # Kind of fragile
-                            wgt_variation = self.cset["event_systematics"].evaluate("btag_var", direction, region_jets.pt[:,i_jet])
-                        elif syst_var == "scale_var":
-                            # The pt array is only used to make sure the output array has the correct shape
-                            wgt_variation = self.cset["event_systematics"].evaluate("scale_var", direction, region_jets.pt[:,0])
-                        syst_var_name = f"{syst_var}_{direction}"
-                        self.hist_dict[region].fill(
-                            observable=observable, process=process,
-                            variation=syst_var_name, weight=region_weights * wgt_variation
-                        )
-                else:
-                    # Should either be 'nominal' or an object variation systematic
-                    if variation != "nominal":
-                        # This is a 2-point systematic, e.g. ttbar__scaledown, ttbar__ME_var, etc.
-                        syst_var_name = variation
-                    self.hist_dict[region].fill(
-                        observable=observable, process=process,
-                        variation=syst_var_name, weight=region_weights
-                    )
-
+                if variation != "nominal":
+                    # This is a 2-point systematic, e.g. ttbar__scaledown, ttbar__ME_var, etc.
+                    syst_var_name = variation
+                weights = {syst_var_name: region_weights}
+
+                if syst_var == "nominal":
+                    # Event weight systematics with an up/down variation, on the nominal selection
+                    for event_syst in event_systs:
+                        for i_dir, direction in enumerate(["up", "down"]):
+                            if event_syst.startswith("btag_var"):
+                                i_jet = int(event_syst.rsplit("_",1)[-1])   # Kind of fragile
+                                wgt_variation = self.cset["event_systematics"].evaluate("btag_var", direction, region_jets.pt[:,i_jet])
+                            elif event_syst == "scale_var":
+                                # The pt array is only used to make sure the output array has the correct shape
+                                wgt_variation = self.cset["event_systematics"].evaluate("scale_var", direction, region_jets.pt[:,0])
+                            weights[f"{event_syst}_{direction}"] = region_weights * wgt_variation
+                fills.append((region, dict(observable=observable, process=process, weights=weights)))
+
+        for region, fill_args in fills:
+            self.hist_dict[region].fill_variations(**fill_args)
 
         output = {"nevents": {events.metadata["dataset"]: ak.num(events,axis=0)}, "hist_dict": self.hist_dict}
+        if utils.config["benchmarking"]["PHASE_TIMING"]:
+            t_compute = utils.phases.stamp(events.Jet.pt, *[fill_args["observable"] for _, fill_args in fills],
+                                           *[weight for _, fill_args in fills for weight in fill_args["weights"].values()])
+            fill_durations = [utils.phases.fill_duration(t_compute, self.hist_dict[region], **fill_args)
+                              for region, fill_args in fills]
+            output["phase_times"] = utils.phases.phase_times(t_compute, fill_durations)
 
         return output
 
@@ -0,0 +1,135 @@
+import asyncio
+import json
+
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+from aiohttp import web
+
+import utils
+
+FILE_SIZE = 10_000
+BLOCK_SIZE = 1024
+N_BLOCKS = 10
+
+# The load generator against a local HTTP server with range support, which counts the requests
+# and bytes it answers
+
+async def _run_against_server(tmp_path, generator_kwargs, files=("data.bin",)):
+    """
+    Serve a file of FILE_SIZE random bytes, plan block reads of files (files that do not exist
+    fail with a 404), and run a LoadGenerator on them.
+    Returns the generator, its table and the range requests and bytes served, per file.
+    """
+    (tmp_path / "data.bin").write_bytes(np.random.default_rng(0).bytes(FILE_SIZE))
+    served = {"requests": {}, "bytes": {}}
+
+    async def serve(request):
+        path = tmp_path / request.match_info["name"]
+        if not path.exists():
+            raise web.HTTPNotFound()
+        data = path.read_bytes()
+        if "Range" not in request.headers:
+            return web.Response(body=data)
+        start, stop = (int(val) for val in request.headers["Range"].removeprefix("bytes=").split("-"))
+        body = data[start:stop + 1]
+        if request.method == "GET":
+            served["requests"][path.name] = served["requests"].get(path.name, 0) + 1
+            served["bytes"][path.name] = served["bytes"].get(path.name, 0) + len(body)
+        return web.Response(status=206, body=body, headers={"Content-Range": f"bytes {start}-{start + len(body) - 1}/{len(data)}"})
+
+    app = web.Application()
+    app.router.add_get("/{name}", serve)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    try:
+        port = runner.addresses[0][1]
+        base = f"http://127.0.0.1:{port}"
+        requests = await asyncio.to_thread(utils.loadgen.file_ranges, f"{base}/data.bin", BLOCK_SIZE)
+        requests += [(f"{base}/{fname}", start, stop) for fname in files if fname != "data.bin" for _, start, stop in requests[:2]]
+        generator = utils.loadgen.LoadGenerator(requests, **generator_kwargs)
+        table = await generator.run()
+    finally:
+        await runner.cleanup()
+    return generator, table, served
+
+def run(tmp_path, **kwargs):
+    return asyncio.run(_run_against_server(tmp_path, kwargs))
+
+def test_closed_loop(tmp_path):
+    generator, table, served = run(tmp_path, mode="closed", concurrency=3)
+    assert len(table) == N_BLOCKS
+    assert served["requests"] == {"data.bin": N_BLOCKS}
+    assert table["error"].null_count == N_BLOCKS
+    #Every byte of the file, once
+    assert sum(table["received_bytes"].to_pylist()) == FILE_SIZE == served["bytes"]["data.bin"]
+    assert sorted(zip(table["start"].to_pylist(), table["stop"].to_pylist())) == [
+        (start, min(start + BLOCK_SIZE, FILE_SIZE)) for start in range(0, FILE_SIZE, BLOCK_SIZE)
+    ]
+    sent = np.array(table["sent"].to_pylist())
+    latency = np.array(table["latency"].to_pylist())
+    assert np.all(sent >= generator.t_start) and np.all(sent + latency <= generator.t_stop)
+    assert np.all(latency > 0)
+
+def test_open_loop(tmp_path):
+    rate = 50.0
+    generator, table, served = run(tmp_path, mode="open", rate=rate)
+    assert len(table) == N_BLOCKS
+    assert served["requests"] == {"data.bin": N_BLOCKS}
+    assert sum(table["received_bytes"].to_pylist()) == FILE_SIZE == served["bytes"]["data.bin"]
+    #Requests are due at a fixed rate, and latencies are measured from when they were due
+    sent = np.sort(np.array(table["sent"].to_pylist()))
+    assert sent == pytest.approx(generator.t_start + np.arange(N_BLOCKS)/rate)
+    assert generator.t_stop - generator.t_start >= (N_BLOCKS - 1)/rate
+
+def test_duration_cycles_requests(tmp_path):
+    generator, table, served = run(tmp_path, mode="closed", concurrency=2, duration=0.5)
+    assert len(table) > N_BLOCKS
+    assert served["requests"]["data.bin"] == len(table)
+    assert sum(table["received_bytes"].to_pylist()) == served["bytes"]["data.bin"]
+    assert max(table["sent"].to_pylist()) - generator.t_start < 0.5
+
+def test_failed_requests(tmp_path):
+    generator, table, served = asyncio.run(_run_against_server(tmp_path, {"mode": "closed"}, files=("data.bin", "missing.bin")))
+    assert len(table) == N_BLOCKS + 2
+    errors = [err for err in table["error"].to_pylist() if err is not None]
+    assert len(errors) == 2 and all("missing.bin" in err for err in errors)
+    summary = utils.loadgen.summarize(table, generator.t_start, generator.t_stop)
+    assert summary["requests"] == N_BLOCKS + 2
+    assert summary["failed_requests"] == 2
+    #Only the successful requests count towards the throughput
+    assert sum(summary["request_rate_over_time"])*summary["interval"] == N_BLOCKS
+
+def test_summarize(tmp_path):
+    generator, table, _ = run(tmp_path, mode="open", rate=100.0)
+    interval = 0.05
+    summary = utils.loadgen.summarize(table, generator.t_start, generator.t_stop, interval=interval, percentiles=(50, 100))
+    elapsed = generator.t_stop - generator.t_start
+    assert summary["requests"] == N_BLOCKS
+    assert summary["failed_requests"] == 0
+    assert summary["elapsed"] == pytest.approx(elapsed)
+    assert summary["request_rate"] == pytest.approx(N_BLOCKS/elapsed)
+    assert summary["bandwidth"] == pytest.approx(FILE_SIZE/1e6/elapsed)
+    latency = table["latency"].to_pylist()
+    assert summary["latency"] == {"p50": pytest.approx(np.median(latency)), "p100": max(latency)}
+    n_bins = int(np.ceil(elapsed/interval))
+    assert len(summary["bandwidth_over_time"]) == len(summary["request_rate_over_time"]) == n_bins
+    assert sum(summary["bandwidth_over_time"])*interval == pytest.approx(FILE_SIZE/1e6)
+    assert sum(summary["request_rate_over_time"])*interval == pytest.approx(N_BLOCKS)
+
+def test_write_requests(tmp_path):
+    generator, table, _ = run(tmp_path, mode="closed", concurrency=4)
+    summary = utils.loadgen.summarize(table, generator.t_start, generator.t_stop)
+    path = tmp_path / "loadgen.parquet"
+    utils.loadgen.write_requests(table, path, {"mode": "closed", "concurrency": 4, **summary})
+
+    written = pq.read_table(path)
+    assert written.schema.remove_metadata() == utils.loadgen.REQUEST_SCHEMA
+    assert written.to_pylist() == table.to_pylist()
+    run_info = json.loads(written.schema.metadata[utils.reports.RUN_INFO_KEY])
+    assert run_info["mode"] == "closed" and run_info["concurrency"] == 4
+    assert run_info["requests"] == N_BLOCKS and run_info["failed_requests"] == 0
+    assert run_info["latency"] == pytest.approx(summary["latency"])
+    assert run_info["bandwidth_over_time"] == pytest.approx(summary["bandwidth_over_time"])
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+import parse_reports
+import utils
+
+DATASETS = ["ttbar__nominal", "wjets__nominal", "ttbar__scaledown"]
+SITES = ["http://a.example", "http://b.example"]
+
+def _phase_table(n_chunks=30):
+    """
+    Report-like table with the phase times of n_chunks chunks, spread over DATASETS and SITES.
+    The decompress phase is not recorded for the last dataset.
+    """
+    rng = np.random.default_rng(0)
+    datasets = [DATASETS[i % len(DATASETS)] for i in range(n_chunks)]
+    columns = {
+        "dataset": pa.array(datasets).dictionary_encode(),
+        "site": pa.array([SITES[i % len(SITES)] for i in range(n_chunks)]).dictionary_encode(),
+    }
+    for phase in utils.reports.PHASES:
+        values = rng.random(n_chunks)
+        columns[phase] = pa.array([None if phase == "decompress_time" and dset == DATASETS[-1] else val
+                                   for dset, val in zip(datasets, values)], pa.float64())
+    return pa.table(columns)
+
+@pytest.mark.parametrize("by, groups", [("dataset", DATASETS), ("site", SITES)])
+def test_phase_percentiles_grouped(by, groups):
+    table = _phase_table()
+    rows = utils.reports.phase_percentiles(table, by).to_pylist()
+    #The rows of each group are together, with the phases in order
+    assert [row[by] for row in rows] == sorted((row[by] for row in rows), key=groups.index)
+    for name in groups:
+        phases = [row["phase"] for row in rows if row[by] == name]
+        expected = [phase.removesuffix("_time") for phase in utils.reports.PHASES]
+        if name == DATASETS[-1]:
+            expected.remove("decompress")
+        assert phases == expected
+    first = rows[0]
+    vals = table.filter(pc.equal(pc.cast(table[by], pa.string()), first[by]))[utils.reports.PHASES[0]].to_numpy()
+    assert first["chunks"] == len(vals)
+    assert [first["p50"], first["p95"], first["p99"]] == pytest.approx(np.percentile(vals, [50, 95, 99]))
+
+def test_print_phases_headers_once(capsys):
+    parse_reports.ParsedReport.print_phases(SimpleNamespace(table=_phase_table()))
+    lines = capsys.readouterr().out.splitlines()
+    headers = [line for line in lines if line.startswith(("Dataset: ", "Server: "))]
+    assert headers == [f"Dataset: {name}" for name in DATASETS] + [f"Server: {name}" for name in SITES]
+    #Every phase line follows the header of its group
+    assert sum(line.startswith("\topen") for line in lines) == len(DATASETS) + len(SITES)
@@ -1,2 +1,20 @@
 from .config import config as config
-from . import systematics as systematics
\ No newline at end of file
+from . import corrections as corrections
+from . import systematics as systematics
+from . import reports as reports
+from . import iostats as iostats
+from . import phases as phases
+from . import histograms as histograms
+from . import filesets as filesets
+from . import prefetch as prefetch
+from . import loadgen as loadgen
+from . import synthetic as synthetic
+from . import trijet as trijet
+from . import readpatterns as readpatterns
+from . import branchsizes as branchsizes
+from . import rechunk as rechunk
+from . import speculation as speculation
+from . import livemetrics as livemetrics
+from . import timeline as timeline
+from . import retry as retry
+from . import endpoints as endpoints
@@ -0,0 +1,182 @@
+import concurrent.futures
+
+import uproot
+
+from .config import config
+from .endpoints import Endpoints
+
+# Branch-size index of the datasets of a fileset. The compressed and uncompressed bytes of every
+# branch of (a few files of) each dataset are stored in the fileset under SIZES_KEY, next to its
+# form, so that the branches read by the I/O-only mode can be chosen to make up a given fraction
+# of the bytes of the files, instead of relying on hand-written lists.
+
+# Dataset key holding the index: {"num_entries": entries of the indexed files,
+# "branches": {branch: [compressed bytes, uncompressed bytes]}}
+SIZES_KEY = "branch_sizes"
+# Position of each size in the lists of the index
+SIZES = {"compressed": 0, "uncompressed": 1}
+
+def index_files(files, timeout=None):
+    """
+    Branch-size index of some files, summed over them.
+
+    Inputs:
+        files: list of (file, object_path)
+        timeout: float
+            uproot timeout
+    """
+    index = {"num_entries": 0, "branches": {}}
+    for fname, object_path in files:
+        with uproot.open(fname, timeout=timeout) as file:
+            tree = file[object_path]
+            index["num_entries"] += tree.num_entries
+            for branch in tree.branches:
+                sizes = index["branches"].setdefault(branch.name, [0, 0])
+                sizes[0] += int(branch.compressed_bytes)
+                sizes[1] += int(branch.uncompressed_bytes)
+    return index
+
+def index_fileset(fileset, xrd_base=None, files_per_dataset=1, rebuild=False, workers=8, timeout=None):
+    """
+    Add the branch-size index of the first files of each dataset to a fileset (as loaded from the
+    .json.gz files), in place. Datasets that already have one are skipped unless rebuild, and
+    datasets whose files cannot be read are left without one.
+    Returns the names of the datasets that were indexed.
+
+    Inputs:
+        fileset: dict
+            Fileset to index
+        xrd_base: str, utils.endpoints.Endpoints or None
+            If given, replaces the server prefix (everything before /store) of the file paths (with
+            that of the endpoint of each file, numbered in the order of the fileset)
+        files_per_dataset: int
+            Number of files of each dataset to index
+        rebuild: bool
+            Index datasets that already have an index again
+        workers: int
+            Number of datasets indexed at once
+        timeout: float
+            uproot timeout
+    """
+    #Number of the first file of each dataset, for the endpoint of each file
+    first_file = {}
+    n_files = 0
+    for name, dataset in fileset.items():
+        first_file[name] = n_files
+        n_files += len(dataset["files"])
+
+    def dataset_files(name):
+        files = []
+        for i, (fname, finfo) in enumerate(list(fileset[name]["files"].items())[:files_per_dataset]):
+            store_path = "/store" + fname.split("/store")[-1]
+            if isinstance(xrd_base, Endpoints):
+                fname = xrd_base.base(first_file[name] + i, store_path) + store_path
+            elif xrd_base is not None:
+                fname = xrd_base + store_path
+            files.append((fname, finfo["object_path"]))
+        return files
+
+    todo = [name for name, dataset in fileset.items() if rebuild or SIZES_KEY not in dataset]
+    indexed = []
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(index_files, dataset_files(name), timeout): name for name in todo}
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            try:
+                fileset[name][SIZES_KEY] = future.result()
+            except Exception as err:
+                print(f"Could not index dataset {name}: {type(err).__name__}: {err}")
+                continue
+            indexed.append(name)
+    return indexed
+
+def select_branches(index, fraction, size="compressed"):
+    """
+    Branches whose bytes add up to as close to a fraction of the bytes of all branches as
+    possible: largest first, adding each branch that does not overshoot the target, then the
+    smallest remaining branch if it brings the total closer.
+
+    Inputs:
+        index: dict
+            Branch-size index of a dataset
+        fraction: float
+            Fraction of the bytes to select, between 0 and 1
+        size: "compressed" or "uncompressed"
+            Which bytes to count
+    """
+    sizes = {name: sizes[SIZES[size]] for name, sizes in index["branches"].items()}
+    target = fraction*sum(sizes.values())
+    selected = []
+    total = 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        if total + sizes[name] <= target:
+            selected.append(name)
+            total += sizes[name]
+    rest = [name for name in sizes if name not in selected]
+    if rest:
+        smallest = min(rest, key=lambda name: (sizes[name], name))
+        if abs(total + sizes[smallest] - target) < abs(total - target):
+            selected.append(smallest)
+    return sorted(selected)
+
+def branch_fraction(index, branches, size="compressed"):
+    """
+    Fraction of the bytes of all branches held by some branches.
+    """
+    sizes = index["branches"]
+    total = sum(val[SIZES[size]] for val in sizes.values())
+    return sum(sizes[name][SIZES[size]] for name in branches if name in sizes)/total if total else 0.0
+
+def io_branches(fileset):
+    """
+    Branches read by the I/O-only mode for each dataset of a fileset: chosen from the branch-size
+    index to make up IO_FILE_PERCENT % of the compressed bytes, or the IO_BRANCHES for
+    IO_FILE_PERCENT for datasets without an index.
+    """
+    benchmarking = config["benchmarking"]
+    percent = benchmarking["IO_FILE_PERCENT"]
+    branches = {}
+    for name, dataset in fileset.items():
+        if SIZES_KEY in dataset:
+            branches[name] = select_branches(dataset[SIZES_KEY], float(percent)/100)
+        elif percent in benchmarking["IO_BRANCHES"]:
+            branches[name] = list(benchmarking["IO_BRANCHES"][percent])
+        else:
+            raise ValueError(f"Dataset {name} has no branch-size index, so IO_FILE_PERCENT must be one of "
+                             f"{', '.join(benchmarking['IO_BRANCHES'])} (or index the fileset with index_branches.py)")
+    return branches
+
+def byte_targets(fileset, branches, entries_read, bytes_read, fraction):
+    """
+    Bytes read by each dataset compared with the bytes that a fraction of the files would be,
+    for the entries read, as estimated from the branch-size index. Datasets without an index
+    have no target.
+    Returns a dict of dataset name to a dict of the target fraction and bytes, the fraction of
+    the bytes of the selected branches, and the bytes and fraction actually read.
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset
+        branches: dict
+            Branches read for each dataset
+        entries_read, bytes_read: dict
+            Entries and bytes read for each dataset
+        fraction: float
+            Target fraction of the compressed bytes
+    """
+    targets = {}
+    for name, n_bytes in bytes_read.items():
+        index = fileset[name].get(SIZES_KEY)
+        if index is None or not index["num_entries"]:
+            targets[name] = {"target_fraction": fraction, "target_bytes": None, "selected_fraction": None,
+                             "bytes_read": n_bytes, "read_fraction": None}
+            continue
+        total = sum(sizes[0] for sizes in index["branches"].values())*entries_read[name]/index["num_entries"]
+        targets[name] = {
+            "target_fraction": fraction,
+            "target_bytes": fraction*total,
+            "selected_fraction": branch_fraction(index, branches[name]),
+            "bytes_read": n_bytes,
+            "read_fraction": n_bytes/total if total else None,
+        }
+    return targets
@@ -15,10 +15,22 @@ config = {
         #Which XRootD server to use
         #For Wisconsin, options are "xcache" for the full server, or
         #"xcache01" - "xcache05" for the individual disks
+        #A base URL (e.g. "root://host:1094/") or local directory can also be given
+        #A list of choices (e.g. ["xcache01", ..., "xcache05"]) spreads the files of the run over these servers
         "XROOTD_CHOICE": "cmsxrootd.fnal.gov",
+        #With a list of servers, how the files are spread over them (see utils/endpoints.py): "round-robin", "weighted"
+        #(in proportion to ENDPOINT_WEIGHTS) or "hash" (consistent hashing of the /store path, as cache placement does)
+        "ENDPOINT_STRATEGY": "round-robin",
+        #Relative weights of the servers, in the order of XROOTD_CHOICE (None for equal weights)
+        "ENDPOINT_WEIGHTS": None,
         #If None, there is no max
         "N_FILES_MAX_PER_SAMPLE": None,
         "N_CHUNKS_MAX_PER_FILE": None,
+        #Rebalance the steps of the fileset (after the limits above) toward RECHUNK_TARGET per task, see utils/rechunk.py
+        "RECHUNK": False,
+        #Unit of RECHUNK_TARGET: "events", or "bytes" (compressed, needs the branch-size index of index_branches.py)
+        "RECHUNK_BY": "events",
+        "RECHUNK_TARGET": 50000,
         #Number of seconds before giving up on file reading
         "TIMEOUT": 300,
         #Number of distributed workers to request
@@ -32,12 +44,53 @@ config = {
         "CORES_PER_WORKER": 1,
         # scaling for local setups with FuturesExecutor
         "NUM_CORES": 4,
+        # record per-chunk compute and histogram filling time in the report (fills are repeated once to time them)
+        "PHASE_TIMING": False,
+        # stage the branches read by the processor for upcoming chunks while the computation runs (see utils/prefetch.py)
+        "PREFETCH": False,
+        # maximum number of chunks that staging may run ahead of the chunks being read
+        "PREFETCH_LOOKAHEAD": 500,
+        # maximum number of chunks being staged at once
+        "PREFETCH_CONCURRENCY": 50,
+        # send the requests of straggling chunks again to a fallback server, and use whichever answers first (see utils/speculation.py)
+        "SPECULATION": False,
+        # fallback server, as for XROOTD_CHOICE
+        "SPECULATION_FALLBACK": "cmsxrootd.fnal.gov",
+        # a chunk is a straggler once it has been read for longer than this percentile of the completed chunk reads...
+        "SPECULATION_PERCENTILE": 95,
+        # ...once at least this many chunks have been read...
+        "SPECULATION_MIN_CHUNKS": 20,
+        # ...and for at least this many seconds
+        "SPECULATION_MIN_SECONDS": 10,
+        # read the chunks that failed again after the computation, in up to RETRY_PASSES passes, and merge them into the
+        # outputs and the report (see utils/retry.py)
+        "RETRY_FAILED": False,
+        "RETRY_PASSES": 1,
+        # seconds to wait before the first retry pass, doubled for every further pass
+        "RETRY_BACKOFF": 30,
+        # server to read the failed chunks from, as for XROOTD_CHOICE (a single server), or None for the server under test
+        "RETRY_XROOTD_CHOICE": None,
+        # stream the metrics of the runs (tasks completed, events/s, bytes/s per server, failing chunks, workers and their memory)
+        # to reports/live_<timestamp>.csv (or .prom) while they compute (see utils/livemetrics.py)
+        "LIVE_METRICS": False,
+        # "csv" (one row per metric and server) or "prometheus" (text format, with timestamps)
+        "LIVE_METRICS_FORMAT": "csv",
+        # seconds between writes
+        "LIVE_METRICS_INTERVAL": 5,
         # only I/O, all other processing disabled
         "DISABLE_PROCESSING": False,
         ### read additional branches (only with DISABLE_PROCESSING = True) ###
-        # acceptable values are 4.1, 15, 25, 50 (corresponding to % of file read), 4.1% corresponds to the standard branches used in the notebook
+        # % of the (compressed) bytes of the files to read. If the fileset has a branch-size index (see index_branches.py),
+        # any value works and the branches are chosen from it, otherwise acceptable values are 4.1, 15, 25, 50, the keys of
+        # IO_BRANCHES. 4.1% corresponds to the standard branches used in the notebook
         "IO_FILE_PERCENT": "4.1",
-        # nanoAOD branches that correspond to different values of IO_FILE_PERCENT
+        # order in which the baskets of each chunk are requested in the I/O-only mode (see utils/readpatterns.py):
+        # "coalesced" (one vector read of all branches), "sequential" (branch by branch), "interleaved" (cluster by
+        # cluster, all branches at once) or "sparse" (random single entries)
+        "IO_READ_PATTERN": "coalesced",
+        # fraction of the entries of each chunk read by the "sparse" pattern
+        "IO_SPARSE_FRACTION": 0.01,
+        # nanoAOD branches that correspond to different values of IO_FILE_PERCENT, for filesets without a branch-size index
         "IO_BRANCHES": {
             "4.1": [
                 "Jet_pt",
@@ -88,6 +141,43 @@ config = {
             ],
         },
     },
+    "sweep": {
+        # used by `python3 xcache_test.py --sweep`: every combination of the values below is run
+        # REPEATS times, in random order, reusing one cluster
+        "XROOTD_CHOICE": ["xcache01", "xcache02", "xcache03", "xcache04", "xcache05", "xcache", "cmsxrootd.fnal.gov"],
+        "MAX_WORKERS": [250],
+        "N_FILES_MAX_PER_SAMPLE": [None],
+        "N_CHUNKS_MAX_PER_FILE": [None],
+        "REPEATS": 3,
+        # seed for shuffling the run order, None for a different order every sweep
+        "SEED": None,
+        # seconds to wait for the cluster to reach the requested number of workers before each run (0 to not wait)
+        "WORKER_WAIT_TIMEOUT": 600,
+    },
+    "warm_cache": {
+        # used by `python3 xcache_test.py --warm-cache`: the fileset is run PASSES times in a row on
+        # the same client, to compare cold reads with cache hits
+        "PASSES": 2,
+        # fraction of the files of each dataset read once before the first pass (0 for no priming)
+        "PRIME_FRACTION": 0.0,
+        # seed for choosing the files to prime, None for a different choice every time
+        "SEED": None,
+    },
+    "loadgen": {
+        # used by `python3 load_test.py`: "closed" for CONCURRENCY readers sending requests back to
+        # back, "open" for requests sent at a fixed RATE per second
+        "MODE": "closed",
+        "CONCURRENCY": 64,
+        "RATE": 100,
+        # seconds to keep sending requests (cycling through the fileset), None to read everything once
+        "DURATION": None,
+        # "branches" to read the baskets of the IO_BRANCHES for IO_FILE_PERCENT, "ranges" to read whole
+        # files in blocks of BLOCK_SIZE bytes
+        "READ": "branches",
+        "BLOCK_SIZE": 1000000,
+        # seconds per bin of the throughput over time
+        "INTERVAL": 1.0,
+    },
     "preservation": {
         "HEPData": False
     }
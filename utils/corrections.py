@@ -0,0 +1,153 @@
+import hashlib
+import threading
+import time
+
+import correctionlib
+import correctionlib.schemav2
+import dask_awkward as dak
+from distributed.diagnostics.plugin import WorkerPlugin
+
+from .filesets import file_checksum
+
+# Worker-resident corrections. A correctionlib CorrectionSet pickles as its whole JSON, which is
+# parsed again wherever it is unpickled, so a CorrectionSet used in the processor is shipped with
+# (and re-parsed for) the tasks that use it. Instead, the processor holds small handles that name
+# a correction set by the checksum of its file, or by the hash of its JSON. The correction sets
+# themselves are loaded once per process into a module-level cache, which CorrectionCachePlugin
+# fills as each worker starts, and which hands out the evaluators to the tasks.
+
+# key -> (correctionlib.CorrectionSet, seconds taken to load it)
+_cache = {}
+_lock = threading.Lock()
+# Counters of this process since the last reset_stats
+_stats = {"hits": 0, "misses": 0, "load_time": 0.0, "time_saved": 0.0}
+
+def _get(key, load):
+    """
+    Correction set cached under key, loaded with load() on a miss. On a hit, the time it took to
+    load it is counted as saved.
+    """
+    with _lock:
+        if key in _cache:
+            cset, load_time = _cache[key]
+            _stats["hits"] += 1
+            _stats["time_saved"] += load_time
+            return cset
+        t0 = time.perf_counter()
+        cset = load()
+        load_time = time.perf_counter() - t0
+        _cache[key] = (cset, load_time)
+        _stats["misses"] += 1
+        _stats["load_time"] += load_time
+        return cset
+
+def stats():
+    """
+    Cache counters of this process: hits, misses, seconds spent loading and seconds saved by hits.
+    """
+    with _lock:
+        return dict(_stats)
+
+def reset_stats():
+    with _lock:
+        _stats.update(hits=0, misses=0, load_time=0.0, time_saved=0.0)
+
+def worker_stats(client):
+    """
+    Cache counters summed over the workers of a client.
+    """
+    total = {"hits": 0, "misses": 0, "load_time": 0.0, "time_saved": 0.0}
+    for worker_stats in client.run(stats).values():
+        for key, val in worker_stats.items():
+            total[key] += val
+    return total
+
+class CorrectionSetHandle:
+    """
+    Picklable stand-in for a correctionlib CorrectionSet, used like one: handle[name].evaluate(...)
+    evaluates the named correction with the cached correction set of the process it runs in.
+
+    Inputs:
+        key: str
+            Cache key of the correction set
+        path: str or None
+            File to load the correction set from on a miss
+        data: str or None
+            JSON of the correction set, to load it from on a miss if there is no file
+    """
+    def __init__(self, key, path=None, data=None):
+        self.key = key
+        self.path = path
+        self.data = data
+
+    def load(self):
+        if self.data is not None:
+            return correctionlib.CorrectionSet.from_string(self.data)
+        if file_checksum(self.path) != self.key:
+            raise ValueError(f"Correction file {self.path} differs from the one the processor was set up with")
+        return correctionlib.CorrectionSet.from_file(self.path)
+
+    def resolve(self):
+        return _get(self.key, self.load)
+
+    def __getitem__(self, name):
+        return CachedCorrection(self, name)
+
+class CachedCorrection:
+    """
+    One correction of a CorrectionSetHandle. Evaluating it on dask-awkward arrays makes one task
+    per partition that looks the correction up in the cache of the worker, instead of carrying it.
+    """
+    def __init__(self, handle, name):
+        self.handle = handle
+        self.name = name
+
+    def evaluate(self, *args):
+        if any(isinstance(arg, dak.Array) for arg in args):
+            return dak.map_partitions(_evaluate, self, *args, label=self.name)
+        return _evaluate(self, *args)
+
+def _evaluate(correction, *args):
+    return correction.handle.resolve()[correction.name].evaluate(*args)
+
+def correction_file(path):
+    """
+    Handle for the correction set in a JSON file, keyed by the checksum of the file. The file is
+    loaded (once) in the calling process to check it.
+    """
+    handle = CorrectionSetHandle(file_checksum(path), path=str(path))
+    handle.resolve()
+    return handle
+
+def correction_model(correction):
+    """
+    Handle for a correction set made of one correctionlib.schemav2.Correction built in code,
+    keyed by the hash of its JSON. The JSON is small and travels with the handle.
+    """
+    cset = correctionlib.schemav2.CorrectionSet(schema_version=2, corrections=[correction])
+    data = cset.model_dump_json(exclude_unset=True)
+    return CorrectionSetHandle(hashlib.sha256(data.encode()).hexdigest(), data=data)
+
+class CorrectionCachePlugin(WorkerPlugin):
+    """
+    Loads correction files into the cache of each worker as it starts, so that tasks never load
+    them. The contents of the files are sent with the plugin, so workers do not need the files.
+
+    Inputs:
+        paths: list of str
+            Correction files
+    """
+    name = "correction-cache"
+
+    def __init__(self, paths):
+        self.files = []
+        for path in paths:
+            with open(path) as f:
+                self.files.append((file_checksum(path), f.read()))
+
+    def setup(self, worker):
+        for key, data in self.files:
+            _get(key, lambda: correctionlib.CorrectionSet.from_string(data))
+        #The counters are reset at the start of each run (see run_point in xcache_test.py), not here,
+        #since setting up a worker during a run (one that joins, or the plugin registered again on the
+        #workers of a shared process) would wipe the counts of the run so far
@@ -0,0 +1,84 @@
+import bisect
+import hashlib
+
+# Multi-endpoint runs. Instead of rewriting every file of the fileset to one server, the files are
+# spread over several (e.g. the five disks xcache01 - xcache05 behind xcache), so that the aggregate
+# throughput and the imbalance between them can be measured in one run. Every chunk of the report
+# keeps the server it was read from in its site column (the prefix before /store).
+
+STRATEGIES = ("round-robin", "weighted", "hash")
+# Points of each server on the hash ring, for an even spread of the paths
+RING_POINTS = 200
+# Fractional part of the golden ratio, for a low-discrepancy sequence of the files
+_GOLDEN = 0.6180339887498949
+
+def _hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+class Endpoints:
+    """
+    Servers to spread the files of a fileset over, and the rule that picks the server of each
+    file. Files are numbered in the order of the fileset, across datasets.
+        "round-robin": file i goes to server i % n
+        "weighted": files go to the servers in proportion to their weights, evenly along the fileset
+        "hash": consistent hashing of the /store path of the file, as cache placement does, so that
+                a file always goes to the same server whatever else is in the fileset (servers get
+                ring points in proportion to their weights)
+
+    Inputs:
+        bases: list of str
+            XRootD bases of the servers (see get_xrd_base in xcache_test.py)
+        strategy: str
+            One of STRATEGIES
+        weights: list of float or None
+            Relative weights of the servers, None for equal weights
+    """
+    def __init__(self, bases, strategy="round-robin", weights=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown endpoint strategy {strategy}, should be one of {', '.join(STRATEGIES)}")
+        if not bases:
+            raise ValueError("At least one endpoint is needed")
+        if weights is not None and (len(weights) != len(bases) or min(weights) <= 0):
+            raise ValueError(f"Need one positive weight per endpoint, got {weights} for {len(bases)} endpoints")
+        self.bases = list(bases)
+        self.strategy = strategy
+        self.weights = list(weights) if weights is not None else None
+        weights = self.weights or [1]*len(self.bases)
+        total = 0
+        self._cumulative = []
+        for weight in weights:
+            total += weight
+            self._cumulative.append(total/sum(weights))
+        if strategy == "hash":
+            points = []
+            for i, (base, weight) in enumerate(zip(self.bases, weights)):
+                n_points = max(1, round(RING_POINTS*len(self.bases)*weight/sum(weights)))
+                points.extend((_hash(f"{base}#{k}"), i) for k in range(n_points))
+            points.sort()
+            self._ring = [point for point, _ in points]
+            self._owners = [i for _, i in points]
+
+    def __str__(self):
+        return "+".join(self.bases)
+
+    def index(self, i, store_path):
+        """
+        Index of the server of file number i, whose path starts at /store with store_path.
+        """
+        if self.strategy == "round-robin":
+            return i % len(self.bases)
+        if self.strategy == "weighted":
+            return min(bisect.bisect(self._cumulative, ((i + 0.5)*_GOLDEN) % 1), len(self.bases) - 1)
+        return self._owners[bisect.bisect(self._ring, _hash(store_path)) % len(self._ring)]
+
+    def base(self, i, store_path):
+        """
+        XRootD base of the server of file number i (see index).
+        """
+        return self.bases[self.index(i, store_path)]
+
+    def info(self):
+        """
+        JSON-serializable description, for cache keys and the report metadata.
+        """
+        return {"endpoints": self.bases, "endpoint_strategy": self.strategy, "endpoint_weights": self.weights}
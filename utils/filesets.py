@@ -0,0 +1,227 @@
+import collections.abc
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import pickle
+
+import pyarrow as pa
+
+# Directory for prepared (run-ready) filesets, keyed by a hash of everything that went into them
+CACHE_DIR = Path(".fileset_cache")
+
+def file_checksum(path):
+    """
+    sha256 of the contents of a file.
+    """
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(**params):
+    """
+    Hash of JSON-serializable parameters, used as the file name of a cached fileset.
+    """
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def load_cached(key):
+    """
+    Return the prepared fileset stored under key, or None if there is none.
+    """
+    path = CACHE_DIR / f"{key}.pkl"
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def store_cached(key, fileset):
+    """
+    Store a prepared fileset under key. The file is written under a temporary name and then
+    renamed, so that concurrent runs never read a partial file.
+    """
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = CACHE_DIR / f"{key}.pkl"
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(fileset, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+# Binary filesets. A fileset is stored as an Arrow IPC file with one record batch per dataset
+# and one row per file. Steps are a list column, i.e. a single contiguous integer array with
+# offsets, and the server prefix of each file path (everything before "/store") is a
+# dictionary-encoded column, so that each prefix is stored once. The dataset names, metadata
+# and forms are kept in the schema metadata, with each distinct form stored only once.
+BINARY_SUFFIX = ".arrow"
+FILESET_SCHEMA = pa.schema([
+    ("prefix", pa.dictionary(pa.int32(), pa.string())),
+    ("path", pa.string()),
+    ("object_path", pa.dictionary(pa.int32(), pa.string())),
+    ("num_entries", pa.int64()),
+    ("uuid", pa.string()),
+    ("steps", pa.list_(pa.list_(pa.int64(), 2))),
+])
+# Key in the schema metadata holding the dataset index and the forms
+FILESET_INDEX_KEY = b"xcache_test.fileset_index"
+# Dataset keys holding a (possibly compressed) form
+FORM_KEYS = ("form", "compressed_form")
+
+def _split_prefix(fname):
+    """
+    Split a file path into the server prefix and the path starting at /store. Paths that do
+    not contain /store exactly once get a null prefix.
+    """
+    fparts = fname.split("/store")
+    if len(fparts) != 2:
+        return None, fname
+    return fparts[0], fname[len(fparts[0]):]
+
+def write_binary(fileset, path):
+    """
+    Write a coffea fileset (as loaded from the .json.gz files) in the binary format.
+
+    Inputs:
+        fileset: dict
+            Datasets keyed by name, each with "files" and optionally "metadata" and a form
+        path: str or Path
+            Output file
+    """
+    forms = {}
+    index = []
+    rows = {name: [] for name in FILESET_SCHEMA.names}
+    for name, dataset in fileset.items():
+        entry = {"name": name, "fields": {}, "forms": {}, "num_files": len(dataset["files"])}
+        for key, val in dataset.items():
+            if key in FORM_KEYS:
+                entry["forms"][key] = forms.setdefault(val, len(forms))
+            elif key != "files":
+                entry["fields"][key] = val
+        index.append(entry)
+        for fname, finfo in dataset["files"].items():
+            prefix, fpath = _split_prefix(fname)
+            rows["prefix"].append(prefix)
+            rows["path"].append(fpath)
+            rows["object_path"].append(finfo["object_path"])
+            rows["num_entries"].append(finfo.get("num_entries"))
+            rows["uuid"].append(finfo.get("uuid"))
+            rows["steps"].append(finfo.get("steps"))
+
+    metadata = {FILESET_INDEX_KEY: json.dumps({"datasets": index, "forms": list(forms)})}
+    table = pa.Table.from_pydict(rows, schema=FILESET_SCHEMA.with_metadata(metadata))
+    #Batches in an IPC file must all use the same dictionaries
+    table = table.unify_dictionaries().combine_chunks()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_file(str(path), table.schema, options=options) as writer:
+        start = 0
+        for entry in index:
+            writer.write_batch(table.slice(start, entry["num_files"]).to_batches()[0])
+            start += entry["num_files"]
+
+def convert(json_path, path=None):
+    """
+    Convert a .json.gz fileset to the binary format. By default, the output is written next
+    to the input with the .json.gz suffix replaced by BINARY_SUFFIX.
+    Returns the path of the output.
+    """
+    json_path = Path(json_path)
+    if path is None:
+        path = json_path.parent / (json_path.name.removesuffix(".gz").removesuffix(".json") + BINARY_SUFFIX)
+    with gzip.open(json_path, "rt") as file:
+        write_binary(json.load(file), path)
+    return path
+
+def is_binary(path):
+    return Path(path).suffix == BINARY_SUFFIX
+
+class BinaryFileset(collections.abc.Mapping):
+    """
+    Fileset read from the binary format. It behaves like the usual dict of datasets, so that
+    it can be passed to coffea's apply_to_fileset directly, but each dataset is only read
+    from the (memory-mapped) file when it is first used.
+
+    Inputs:
+        path: str or Path
+            Binary fileset, see write_binary
+        xrd_base: str, utils.endpoints.Endpoints or None
+            If given, replaces the server prefix of every file path (with that of one of the
+            endpoints for each file, numbered in the order of the fileset)
+        max_files: int or None
+            Only keep the first max_files files of each dataset
+        max_chunks: int or None
+            Only keep the first max_chunks steps of each file
+    """
+    def __init__(self, path, xrd_base=None, max_files=None, max_chunks=None):
+        self.path = str(path)
+        self.xrd_base = xrd_base
+        self.max_files = max_files
+        self.max_chunks = max_chunks
+        self._reader = pa.ipc.open_file(pa.memory_map(self.path))
+        index = json.loads(self._reader.schema.metadata[FILESET_INDEX_KEY])
+        self._entries = {entry["name"]: (i, entry) for i, entry in enumerate(index["datasets"])}
+        #Number of the first file of each dataset, after the max_files limit
+        self._first_file = {}
+        n_files = 0
+        for entry in index["datasets"]:
+            self._first_file[entry["name"]] = n_files
+            n_files += min(entry["num_files"], max_files) if max_files else entry["num_files"]
+        self._forms = index["forms"]
+        self._loaded = {}
+
+    def __reduce__(self):
+        return (type(self), (self.path, self.xrd_base, self.max_files, self.max_chunks))
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, name):
+        if name not in self._loaded:
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def _load(self, name):
+        i, entry = self._entries[name]
+        batch = self._reader.get_batch(i)
+        if self.max_files:
+            batch = batch.slice(0, self.max_files)
+
+        paths = batch.column("path").to_pylist()
+        prefixes = batch.column("prefix").to_pylist()
+        if self.xrd_base is None:
+            fnames = [(prefix or "") + fpath for prefix, fpath in zip(prefixes, paths)]
+        else:
+            fnames = []
+            for j, (prefix, fpath) in enumerate(zip(prefixes, paths)):
+                if prefix is None:
+                    raise ValueError(f"Filepath {fpath} in dataset {name} does not fit pattern (splittable on '/store'")
+                if isinstance(self.xrd_base, str):
+                    fnames.append(self.xrd_base + fpath)
+                else:
+                    fnames.append(self.xrd_base.base(self._first_file[name] + j, fpath) + fpath)
+
+        steps = batch.column("steps")
+        offsets = steps.offsets.to_numpy()
+        #The values of a sliced list array are not sliced, so offsets index into all of them
+        pairs = steps.values.flatten().to_numpy().reshape(-1, 2)
+        steps_valid = steps.is_valid().to_numpy(zero_copy_only=False)
+        files = {}
+        for j, (fname, object_path, num_entries, uuid) in enumerate(zip(
+            fnames,
+            batch.column("object_path").to_pylist(),
+            batch.column("num_entries").to_pylist(),
+            batch.column("uuid").to_pylist(),
+        )):
+            if steps_valid[j]:
+                file_steps = pairs[offsets[j]:offsets[j + 1]][:self.max_chunks].tolist()
+            else:
+                file_steps = None
+            files[fname] = {"object_path": object_path, "steps": file_steps, "num_entries": num_entries, "uuid": uuid}
+
+        dataset = {"files": files, **entry["fields"]}
+        for key, form in entry["forms"].items():
+            dataset[key] = self._forms[form]
+        return dataset
@@ -0,0 +1,222 @@
+import functools
+
+import awkward as ak
+from dask.base import DaskMethodsMixin, tokenize
+from dask.highlevelgraph import HighLevelGraph
+import dask_awkward as dak
+import dask_histogram
+import hist
+import numba
+import numpy as np
+
+# Batched filling of weight variations. Event weight systematics fill the same values with
+# different weights, so instead of one fill per variation (each binning the values again), the
+# values are binned once and the weights of all variations are summed into their bins together,
+# in a single pass.
+
+@numba.njit(cache=True)
+def _accumulate(bins, weights, sum_w, sum_w2):
+    """
+    Add each weight (and its square) to the bin of its value, for every variation. The values of
+    each variation are added in order, like boost-histogram does, so that the sums are the same
+    to the last bit. Bins outside of the axis (without flow bins) are skipped.
+    """
+    n_bins = sum_w.shape[1]
+    for i in range(len(bins)):
+        b = bins[i]
+        if b < 0 or b >= n_bins:
+            continue
+        for i_var in range(len(weights)):
+            w = weights[i_var][i]
+            sum_w[i_var, b] += w
+            sum_w2[i_var, b] += w*w
+
+def _category_index(ax, value):
+    """
+    Index of a category in the flow view, or None if it would not be filled. Unknown
+    categories go to the overflow bin, if the axis has one.
+    """
+    try:
+        return ax.index(value)
+    except KeyError:
+        return len(ax) if ax.traits.overflow else None
+
+def fill_variations(h, weights, axis="variation", **values):
+    """
+    Fill a histogram with the same values once per weight variation, binning them only once.
+    The result is the same as h.fill(**values, **{axis: name}, weight=weight) for each
+    name, weight in weights, done one after the other.
+
+    Inputs:
+        h: hist.Hist with Weight storage
+            Histogram to fill, with exactly one axis that is filled with an array
+        weights: dict
+            Name of each variation (a category of axis) to its weights
+        axis: str
+            Category axis holding the variations
+        values: arrays or constants
+            Values for every other axis, by axis name. Constants are single categories.
+    """
+    view = h.view(flow=True)
+    index = []
+    binned = None
+    for ax in h.axes:
+        if ax.name == axis:
+            index.append(None)
+            continue
+        offset = 1 if ax.traits.underflow else 0
+        val = values[ax.name]
+        if isinstance(val, (str, int, float)):
+            category = _category_index(ax, val)
+            if category is None:
+                return h
+            index.append(category + offset)
+        else:
+            index.append(slice(None))
+            binned = ax
+            bins = ax.index(np.asarray(val)) + offset
+    #numba needs arrays of a single type, scalar weights are expanded
+    weight_arrays = tuple(
+        np.full(bins.shape, weight, dtype=np.float64) if np.ndim(weight) == 0
+        else np.require(np.asarray(weight), np.float64, ["C", "W"]) for weight in weights.values()
+    )
+    sum_w = np.zeros((len(weights), binned.extent))
+    sum_w2 = np.zeros((len(weights), binned.extent))
+    _accumulate(bins, weight_arrays, sum_w, sum_w2)
+
+    pos = [ax.name for ax in h.axes].index(axis)
+    for i, name in enumerate(weights):
+        index[pos] = _category_index(h.axes[pos], name)
+        if index[pos] is None:
+            continue
+        view.value[tuple(index)] += sum_w[i]
+        view.variance[tuple(index)] += sum_w2[i]
+    return h
+
+def _arrays(staged):
+    """
+    Arrays of the staged fills, values and weights.
+    """
+    for entry in staged:
+        for val in (*entry["values"].values(), *entry.get("weights", {}).values(), entry.get("weight")):
+            if isinstance(val, ak.Array):
+                yield val
+
+def _fill_partition(axes, storage, metadata, staged):
+    """
+    Histogram of one partition, with all the staged fills of a VariationHist.
+    """
+    thehist = hist.Hist(*axes, storage=storage, metadata=metadata)
+    arrays = list(_arrays(staged))
+    if ak.backend(*arrays) == "typetracer":
+        for array in arrays:
+            ak.typetracer.touch_data(array)
+        return thehist
+    for entry in staged:
+        if "weights" in entry:
+            fill_variations(thehist, entry["weights"], axis=entry["axis"], **entry["values"])
+        else:
+            thehist.fill(**entry["values"], weight=entry["weight"])
+    return thehist
+
+def _meta():
+    return ak.Array(ak.Array(np.zeros(1)).layout.to_typetracer(forget_length=True))
+
+class VariationHist(DaskMethodsMixin):
+    """
+    Lazy histogram that stages batched fills of several weight variations, see fill_variations,
+    and computes to a hist.Hist. All the fills of a partition run in one task, whose histograms
+    are then summed by dask-histogram, like the fills of hist.dask.Hist.
+
+    Inputs:
+        axes: hist axes
+            Axes of the histogram
+        storage: hist storage
+            Storage of the histogram
+        metadata: any
+            Metadata of the histogram
+        split_every: int or None
+            Number of partition histograms summed together at each step of the reduction
+    """
+    def __init__(self, *axes, storage=hist.storage.Double(), metadata=None, split_every=None):
+        self.axes = hist.Hist(*axes, storage=storage, metadata=metadata).axes
+        self.storage = storage
+        self.metadata = metadata
+        self.split_every = split_every
+        self.staged = []
+        self._summed = None
+
+    def fill(self, weight=None, **values):
+        """
+        Stage an ordinary fill, with values by axis name.
+        """
+        self.staged.append({"values": values, "weight": weight})
+        self._summed = None
+        return self
+
+    def fill_variations(self, weights, axis="variation", **values):
+        """
+        Stage a fill of the same values once per weight variation.
+
+        Inputs:
+            weights: dict
+                Name of each variation (a category of axis) to its dask-awkward weights
+            axis: str
+                Category axis holding the variations
+            values: dask-awkward arrays or constants
+                Values for every other axis, by axis name
+        """
+        self.staged.append({"values": values, "weights": weights, "axis": axis})
+        self._summed = None
+        return self
+
+    def to_dask(self):
+        """
+        dask_histogram.AggHistogram with all the fills staged so far.
+        """
+        if self._summed is not None:
+            return self._summed
+        empty = hist.Hist(*self.axes, storage=self.storage, metadata=self.metadata)
+        if not self.staged:
+            name = f"empty-histogram-{tokenize(*self.axes, self.storage, self.metadata)}"
+            graph = HighLevelGraph.from_collections(name, {(name, 0): empty}, dependencies=())
+            self._summed = dask_histogram.AggHistogram(graph, name, histref=empty)
+            return self._summed
+        partials = dak.map_partitions(
+            functools.partial(_fill_partition, tuple(self.axes), self.storage, self.metadata),
+            self.staged,
+            label="hist-on-block",
+            meta=_meta(),
+        )
+        #Each partition of partials is a histogram (meta is only a placeholder), summed by
+        #dask-histogram's reduction
+        fills = dask_histogram.PartitionedHistogram(partials.dask, partials.name, partials.npartitions, histref=empty)
+        self._summed = fills.collapse(self.split_every)
+        return self._summed
+
+    #Dask collection interface, that of the summed histogram
+    def __dask_graph__(self):
+        return self.to_dask().__dask_graph__()
+
+    def __dask_keys__(self):
+        return self.to_dask().__dask_keys__()
+
+    def __dask_layers__(self):
+        return self.to_dask().__dask_layers__()
+
+    def __dask_tokenize__(self):
+        return self.to_dask().__dask_tokenize__()
+
+    def __dask_postcompute__(self):
+        return self.to_dask().__dask_postcompute__()
+
+    def __dask_postpersist__(self):
+        return self.to_dask().__dask_postpersist__()
+
+    @property
+    def __dask_optimize__(self):
+        return self.to_dask().__dask_optimize__
+
+    @property
+    def __dask_scheduler__(self):
+        return self.to_dask().__dask_scheduler__
@@ -0,0 +1,122 @@
+import dataclasses
+import time
+
+import uproot
+
+# uproot puts the performance counters of the source into the report of every chunk that
+# was read successfully. The source below adds more counters to them.
+
+@dataclasses.dataclass
+class IOCounters(uproot.source.chunk.SourcePerformanceCounters):
+    """
+    The uproot performance counters, plus the number of bytes actually received, the time
+    taken to open the file and read its header, the wall-clock time spent waiting for data
+    to arrive, the number of bytes in each vector (multi-range) read, the time (epoch
+    seconds) at which uproot finished reading the chunk, and the number of requests that were
+    sent again to a fallback server and that it answered first (see utils.speculation).
+    """
+    num_received_bytes: int
+    open_time: float
+    fetch_time: float
+    vector_read_bytes: list
+    read_done: float
+    speculated_requests: int
+    speculation_wins: int
+
+def _busy_time(intervals):
+    """
+    Total length of the union of (start, stop) time intervals, so that overlapping requests
+    are only counted once.
+    """
+    total = 0.0
+    current_start, current_stop = None, None
+    for start, stop in sorted(intervals):
+        if current_stop is None or start > current_stop:
+            if current_stop is not None:
+                total += current_stop - current_start
+            current_start, current_stop = start, stop
+        else:
+            current_stop = max(current_stop, stop)
+    if current_stop is not None:
+        total += current_stop - current_start
+    return total
+
+def _received_bytes(chunk):
+    """
+    Number of bytes in a filled chunk. Short reads are not an error here, uproot checks the
+    length itself when it uses the chunk.
+    """
+    chunk.wait(insist=False)
+    return len(chunk._raw_data)
+
+class _CountingQueue:
+    """
+    Stands in for the notifications queue of Source.chunks, counting the bytes and arrival
+    time of each chunk as it gets filled before passing it on.
+    """
+    def __init__(self, source, notifications):
+        self._source = source
+        self._notifications = notifications
+        self._t_request = time.monotonic()
+
+    def put(self, chunk, *args, **kwargs):
+        self._source._fetches.append((self._t_request, time.monotonic()))
+        try:
+            self._source._received.append(_received_bytes(chunk))
+        except Exception:
+            # Failed reads are reported by uproot when the chunk is used
+            pass
+        self._notifications.put(chunk, *args, **kwargs)
+
+class CountingSource(uproot.source.fsspec.FSSpecSource):
+    """
+    The default uproot source (fsspec, used for root://, http:// and local files), with byte-level
+    I/O accounting. Pass it as the "handler" uproot option.
+    """
+    def __init__(self, file_path, **options):
+        # Received bytes and (request, arrival) times are appended from reader threads, so they
+        # are kept in lists
+        self._received = []
+        self._fetches = []
+        self._vector_read_bytes = []
+        # fsspec connects lazily, so opening lasts until the first chunk (the file header) arrives
+        self._t_open = time.monotonic()
+        self._open_time = None
+        # Requests duplicated against a fallback server, and those it won, see utils.speculation
+        self._speculated_requests = 0
+        self._speculation_wins = 0
+        #coffea passes its own skipbadfiles option on to uproot, which would hand it to fsspec as
+        #a storage option (breaking HTTP, whose client rejects unknown options)
+        options.pop("skipbadfiles", None)
+        super().__init__(file_path, **options)
+
+    def chunk(self, start, stop):
+        t0 = time.monotonic()
+        chunk = super().chunk(start, stop)
+        self._received.append(_received_bytes(chunk))
+        # The header read counts towards opening the file, later reads towards fetching
+        if self._open_time is None:
+            self._open_time = time.monotonic() - self._t_open
+        else:
+            self._fetches.append((t0, time.monotonic()))
+        return chunk
+
+    def chunks(self, ranges, notifications):
+        self._vector_read_bytes.append(sum(stop - start for start, stop in ranges))
+        return super().chunks(ranges, _CountingQueue(self, notifications))
+
+    @property
+    def performance_counters(self):
+        # uproot asks for the counters as soon as it has finished reading the chunk
+        return IOCounters(
+            self._num_requested_bytes,
+            self._num_requests,
+            self._num_requested_chunks,
+            sum(self._received),
+            self._open_time,
+            _busy_time(self._fetches),
+            list(self._vector_read_bytes),
+            time.time(),
+            self._speculated_requests,
+            self._speculation_wins,
+        )
@@ -0,0 +1,187 @@
+import csv
+import time
+
+import awkward as ak
+from dask.utils import key_split
+from distributed.compatibility import PeriodicCallback
+from distributed.diagnostics.plugin import SchedulerPlugin, WorkerPlugin
+
+from .prefetch import READ_PREFIX
+from .readpatterns import PATTERNS
+
+# Live metrics of the runs of a client, streamed to a file while they compute (the performance
+# report is only written at the end). ChunkReportPlugin summarizes the report of every chunk read
+# as soon as its task finishes on a worker, and logs the summary as a scheduler event.
+# LiveMetricsPlugin collects these on the scheduler and, every few seconds, appends the metrics
+# below to a CSV file (one row per metric and server) or to a file in the Prometheus text format.
+
+# Event topics of the chunk summaries and of the start of each run
+CHUNKS_TOPIC = "xcache-chunks"
+RUN_TOPIC = "xcache-run"
+# Task prefixes of the chunk reads, of the processor and of the I/O-only mode
+READ_PREFIXES = (READ_PREFIX, *[f"io-{pattern}" for pattern in PATTERNS])
+FORMATS = ("csv", "prometheus")
+# Metric name -> Prometheus type and help
+METRICS = {
+    "tasks_completed": ("counter", "Tasks completed in this run"),
+    "chunks_completed": ("counter", "Chunks read in this run"),
+    "failed_chunks": ("counter", "Chunks that could not be read in this run"),
+    "events_per_second": ("gauge", "Events of the chunks read successfully per second"),
+    "bytes_per_second": ("gauge", "Bytes received per second"),
+    "active_workers": ("gauge", "Workers connected to the scheduler"),
+    "worker_memory_bytes": ("gauge", "Memory of the worker processes, summed over the workers"),
+    "worker_memory_max_bytes": ("gauge", "Memory of the largest worker process"),
+}
+
+def _task_report(result):
+    """
+    Report of the chunks of a chunk-read task: the report of uproot.dask, returned with the
+    array, or the report field of the reads of the I/O-only mode (see utils.readpatterns).
+    """
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], ak.Array):
+        return result[1]
+    if isinstance(result, ak.Array) and "report" in result.fields:
+        return result["report"]
+    return None
+
+def summarize_report(report):
+    """
+    [events, received bytes, chunks, failed chunks] of the chunks of a report, per site (the
+    server prefix of the file paths, everything before /store). Events are counted for the chunks
+    that were read successfully.
+    """
+    sites = {}
+    args = ak.to_list(report.args)
+    failed = ak.to_list(~ak.is_none(report.message))
+    received = [None]*len(report)
+    if "performance_counters" in report.fields and "num_received_bytes" in ak.fields(report.performance_counters):
+        received = ak.to_list(report.performance_counters.num_received_bytes)
+    for (fname, _, start, stop, *_), chunk_failed, n_bytes in zip(args, failed, received):
+        counts = sites.setdefault(fname.strip("'").split("/store")[0], [0, 0, 0, 0])
+        counts[0] += 0 if chunk_failed else int(stop) - int(start)
+        counts[1] += n_bytes or 0
+        counts[2] += 1
+        counts[3] += int(chunk_failed)
+    return sites
+
+class ChunkReportPlugin(WorkerPlugin):
+    """
+    Logs the summary of the report of every chunk-read task (see summarize_report) to the
+    scheduler, under CHUNKS_TOPIC, as soon as the task finishes.
+    """
+    name = "xcache-chunk-reports"
+    idempotent = True
+
+    def setup(self, worker):
+        self.worker = worker
+
+    def transition(self, key, start, finish, **kwargs):
+        #Results fetched from other workers also go to memory
+        if start not in ("executing", "long-running") or finish != "memory" or key_split(key) not in READ_PREFIXES:
+            return
+        report = _task_report(self.worker.data.get(key))
+        if report is not None and len(report):
+            #The scheduler adds the worker address to the message
+            self.worker.log_event(CHUNKS_TOPIC, {"sites": summarize_report(report)})
+
+class LiveMetricsPlugin(SchedulerPlugin):
+    """
+    Appends the metrics of the current run to a file every interval seconds. Counters start from
+    zero at the start of each run, which is announced by logging its name under RUN_TOPIC. Rates
+    are averaged over the last interval.
+
+    Inputs:
+        path: str
+            File to write, on the machine of the scheduler
+        fmt: str
+            One of FORMATS
+        interval: float
+            Seconds between writes
+    """
+    name = "xcache-live-metrics"
+
+    def __init__(self, path, fmt="csv", interval=5.0):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown live metrics format {fmt}, should be one of {', '.join(FORMATS)}")
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.run = None
+        self._reset()
+
+    def _reset(self):
+        self._tasks = 0
+        #site -> [events, received bytes, chunks, failed chunks], in total and since the last write
+        self._totals = {}
+        self._recent = {}
+        self._t_last = time.time()
+
+    async def start(self, scheduler):
+        self.scheduler = scheduler
+        self._file = open(self.path, "a", newline="")
+        if self._file.tell() == 0:
+            if self.fmt == "csv":
+                csv.writer(self._file).writerow(["time", "run", "metric", "server", "value"])
+            else:
+                for metric, (typ, doc) in METRICS.items():
+                    self._file.write(f"# HELP xcache_{metric} {doc}\n# TYPE xcache_{metric} {typ}\n")
+        self._callback = PeriodicCallback(self.write, self.interval*1000)
+        self._callback.start()
+
+    def transition(self, key, start, finish, *args, **kwargs):
+        if start == "processing" and finish == "memory":
+            self._tasks += 1
+
+    def log_event(self, topic, msg):
+        if topic == RUN_TOPIC:
+            if self.run is not None:
+                self.write()
+            self.run = msg
+            self._reset()
+        elif topic == CHUNKS_TOPIC:
+            for site, counts in msg["sites"].items():
+                for totals in (self._totals, self._recent):
+                    site_totals = totals.setdefault(site, [0, 0, 0, 0])
+                    for i, count in enumerate(counts):
+                        site_totals[i] += count
+
+    def metrics(self):
+        """
+        (metric, server or None, value) of the current run, with rates since the last call.
+        """
+        now = time.time()
+        elapsed = max(now - self._t_last, 1e-9)
+        memory = [ws.memory.process for ws in self.scheduler.workers.values()]
+        rows = [
+            ("tasks_completed", None, self._tasks),
+            ("chunks_completed", None, sum(counts[2] for counts in self._totals.values())),
+            ("events_per_second", None, sum(counts[0] for counts in self._recent.values())/elapsed),
+            ("active_workers", None, len(self.scheduler.workers)),
+            ("worker_memory_bytes", None, sum(memory)),
+            ("worker_memory_max_bytes", None, max(memory, default=0)),
+        ]
+        for site in sorted(self._totals):
+            rows.append(("failed_chunks", site, self._totals[site][3]))
+            rows.append(("bytes_per_second", site, self._recent.get(site, [0, 0, 0, 0])[1]/elapsed))
+        self._recent = {}
+        self._t_last = now
+        return rows
+
+    def write(self):
+        now = time.time()
+        rows = self.metrics()
+        if self.fmt == "csv":
+            writer = csv.writer(self._file)
+            for metric, server, value in rows:
+                writer.writerow([f"{now:.3f}", self.run or "", metric, server or "", value])
+        else:
+            for metric, server, value in rows:
+                labels = {"run": self.run or "", **({"server": server} if server is not None else {})}
+                label_str = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                self._file.write(f"xcache_{metric}{{{label_str}}} {value} {int(1000*now)}\n")
+        self._file.flush()
+
+    async def close(self):
+        self._callback.stop()
+        self.write()
+        self._file.close()
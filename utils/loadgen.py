@@ -0,0 +1,226 @@
+import asyncio
+import json
+import time
+
+import fsspec
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import uproot
+
+from .prefetch import basket_ranges
+from .reports import RUN_INFO_KEY
+
+# Load generation against XRootD/XCache (or HTTP, or local) endpoints without coffea or dask:
+# requests are byte ranges read directly through fsspec from an asyncio event loop. Filesystems
+# with async support (XRootD, HTTP) are used natively, others are read in threads.
+
+# One row per request
+REQUEST_SCHEMA = pa.schema([
+    ("file", pa.dictionary(pa.int32(), pa.string())),
+    ("start", pa.int64()),
+    ("stop", pa.int64()),
+    # epoch time at which the request was due to be sent (open loop) or was sent (closed loop)
+    ("sent", pa.float64()),
+    ("latency", pa.float64()),
+    ("received_bytes", pa.int64()),
+    ("error", pa.dictionary(pa.int32(), pa.string())),
+])
+
+def file_ranges(fname, block_size):
+    """
+    Split a whole file into byte ranges of block_size bytes.
+    """
+    fs, path = fsspec.core.url_to_fs(fname)
+    size = fs.size(path)
+    return [(fname, start, min(start + block_size, size)) for start in range(0, size, block_size)]
+
+def branch_ranges(fname, object_path, steps, branches):
+    """
+    Byte ranges of the baskets of the given branches holding each step of a file, in the order
+    that the steps would be read.
+    """
+    requests = []
+    with uproot.open(fname) as file:
+        tree = file[object_path]
+        for start, stop in steps:
+            requests.extend((fname, range_start, range_stop) for range_start, range_stop in basket_ranges(tree, branches, start, stop))
+    return requests
+
+async def plan_requests(fileset, read, branches=None, block_size=None, concurrency=16):
+    """
+    List the (file, start, stop) byte ranges to read for a fileset. Files are opened concurrently
+    in threads, since finding the baskets of a branch means reading the file metadata.
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset
+        read: "branches" or "ranges"
+            Read the baskets of the given branches for every step of every file, or every file
+            in blocks of block_size bytes
+        branches: list of str, or dict
+            Branches to read, or a dict of the branches to read for each dataset
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    async def plan_file(name, fname, finfo):
+        async with semaphore:
+            if read == "branches":
+                file_branches = branches[name] if isinstance(branches, dict) else branches
+                return await asyncio.to_thread(branch_ranges, fname, finfo["object_path"], finfo["steps"] or [], file_branches)
+            return await asyncio.to_thread(file_ranges, fname, block_size)
+    plans = await asyncio.gather(*(
+        plan_file(name, fname, finfo) for name, dataset in fileset.items() for fname, finfo in dataset["files"].items()
+    ), return_exceptions=True)
+    requests = []
+    for plan in plans:
+        if isinstance(plan, Exception):
+            print(f"Skipping a file that could not be planned: {type(plan).__name__}: {plan}")
+            continue
+        requests.extend(plan)
+    return requests
+
+class RangeReader:
+    """
+    Reads byte ranges of files given by URL, keeping one filesystem per protocol and host.
+    """
+    def __init__(self):
+        self._filesystems = {}
+
+    def _filesystem(self, fname):
+        protocol = fsspec.core.split_protocol(fname)[0] or "file"
+        cls = fsspec.get_filesystem_class(protocol)
+        options = cls._get_kwargs_from_urls(fname)
+        key = (protocol, tuple(sorted(options.items())))
+        if key not in self._filesystems:
+            if cls.async_impl:
+                #Async filesystems connect (e.g. open their HTTP session) on first use
+                self._filesystems[key] = cls(asynchronous=True, loop=asyncio.get_running_loop(), skip_instance_cache=True, **options)
+            else:
+                self._filesystems[key] = cls(**options)
+        return self._filesystems[key], cls._strip_protocol(fname)
+
+    async def read(self, fname, start, stop):
+        """
+        Read bytes start to stop of a file. Returns the number of bytes received.
+        """
+        fs, path = self._filesystem(fname)
+        if fs.async_impl:
+            data = await fs._cat_file(path, start=start, end=stop)
+        else:
+            data = await asyncio.to_thread(fs.cat_file, path, start=start, end=stop)
+        return len(data)
+
+    async def close(self):
+        for fs in self._filesystems.values():
+            session = getattr(fs, "_session", None)
+            if session is not None:
+                await session.close()
+
+class LoadGenerator:
+    """
+    Drives reads of a list of byte ranges against the endpoints, in one of two modes:
+        closed: concurrency readers each send their next request as soon as the previous one
+            has been answered, so the request rate adapts to the server
+        open: requests are sent at a fixed rate, whether or not earlier ones have been answered,
+            and latencies are measured from when each request was due (so a slow server does not
+            hide its own queueing delay)
+    The list of requests is cycled until duration seconds have passed, or read once if duration
+    is None.
+    """
+    def __init__(self, requests, mode="closed", concurrency=64, rate=100.0, duration=None):
+        if mode not in ("closed", "open"):
+            raise ValueError(f"Unknown load generator mode {mode}, should be 'closed' or 'open'")
+        self.requests = requests
+        self.mode = mode
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.results = []
+
+    def _next_requests(self):
+        i = 0
+        while self.requests:
+            if self.duration is None and i == len(self.requests):
+                return
+            if self.duration is not None and time.time() - self.t_start >= self.duration:
+                return
+            yield self.requests[i % len(self.requests)]
+            i += 1
+
+    async def _send(self, reader, request, sent):
+        fname, start, stop = request
+        error = None
+        received = None
+        try:
+            received = await reader.read(fname, start, stop)
+        except Exception as err:
+            error = f"{type(err).__name__}: {err}"
+        self.results.append((fname, start, stop, sent, time.time() - sent, received, error))
+
+    async def _closed_loop(self, reader):
+        requests = self._next_requests()
+        async def worker():
+            for request in requests:
+                await self._send(reader, request, time.time())
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def _open_loop(self, reader):
+        tasks = set()
+        for i, request in enumerate(self._next_requests()):
+            due = self.t_start + i/self.rate
+            await asyncio.sleep(max(0.0, due - time.time()))
+            task = asyncio.create_task(self._send(reader, request, due))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+
+    async def run(self):
+        reader = RangeReader()
+        self.t_start = time.time()
+        try:
+            if self.mode == "closed":
+                await self._closed_loop(reader)
+            else:
+                await self._open_loop(reader)
+        finally:
+            await reader.close()
+        self.t_stop = time.time()
+        return self.table()
+
+    def table(self):
+        columns = list(zip(*self.results)) if self.results else [[] for _ in REQUEST_SCHEMA.names]
+        arrays = [pa.array(col, pa.string()).dictionary_encode().cast(field.type) if pa.types.is_dictionary(field.type)
+                  else pa.array(col, field.type) for col, field in zip(columns, REQUEST_SCHEMA)]
+        return pa.table(arrays, schema=REQUEST_SCHEMA)
+
+def summarize(table, t_start, t_stop, interval=1.0, percentiles=(50, 90, 99)):
+    """
+    Latency percentiles of the successful requests, aggregate throughput, and throughput in
+    intervals of interval seconds since t_start (by the time each request was answered).
+    """
+    ok = table["error"].is_null().to_numpy(zero_copy_only=False)
+    latency = table["latency"].to_numpy()[ok]
+    received = table["received_bytes"].to_numpy(zero_copy_only=False)[ok].astype(np.float64)
+    done = table["sent"].to_numpy()[ok] + latency - t_start
+    elapsed = t_stop - t_start
+    n_bins = max(1, int(np.ceil(elapsed/interval)))
+    bins = np.minimum((done/interval).astype(np.int64), n_bins - 1)
+    return {
+        "requests": len(table),
+        "failed_requests": int(np.sum(~ok)),
+        "elapsed": elapsed,
+        "request_rate": int(np.sum(ok))/elapsed if elapsed else None,
+        "bandwidth": received.sum()/1e6/elapsed if elapsed else None,
+        "latency": {f"p{p:g}": float(val) for p, val in zip(percentiles, np.percentile(latency, percentiles))} if len(latency) else {},
+        "interval": interval,
+        "bandwidth_over_time": (np.bincount(bins, weights=received, minlength=n_bins)/1e6/interval).tolist(),
+        "request_rate_over_time": (np.bincount(bins, minlength=n_bins)/interval).tolist(),
+    }
+
+def write_requests(table, path, run_info):
+    """
+    Write the per-request table to a parquet file, with the run information and summary in its
+    metadata (under the same key as the chunk reports).
+    """
+    table = table.replace_schema_metadata({RUN_INFO_KEY: json.dumps(run_info)})
+    pq.write_table(table, path, compression="zstd")
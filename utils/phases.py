@@ -0,0 +1,91 @@
+import functools
+import time
+
+import awkward as ak
+import dask_awkward as dak
+import hist
+import numpy as np
+
+from .histograms import fill_variations
+
+# Per-chunk timing of the processor. The processor only builds a dask graph, so time is measured
+# by small tasks inserted in the graph: each runs once per chunk, after the arrays it is given
+# have been computed, and returns a one-entry array. Stamps are epoch seconds, to be compared
+# with the time at which the chunk was read (read_done, see utils.iostats).
+
+def _is_typetracer(arrays):
+    """
+    dask-awkward runs every task on typetracers to find which columns need to be read. The
+    inputs are then marked as needed, so that the timed task waits for them.
+    """
+    if ak.backend(*arrays) != "typetracer":
+        return False
+    for array in arrays:
+        ak.typetracer.touch_data(array)
+    return True
+
+def _timestamp(*arrays):
+    if _is_typetracer(arrays):
+        return _meta()
+    return ak.Array(np.array([time.time()]))
+
+def stamp(*arrays):
+    """
+    Time at which all of the given dask-awkward arrays have been computed, one entry per chunk.
+
+    Inputs:
+        arrays: dask-awkward arrays with the partitioning of the events
+    """
+    return dak.map_partitions(_timestamp, *arrays, label="phase-stamp", meta=_meta())
+
+def _fill_duration(axes, constants, keys, weight_names, after, *values):
+    if _is_typetracer((after, *values)):
+        return _meta()
+    values = [ak.to_numpy(ak.fill_none(val, np.nan)) for val in values]
+    arrays = dict(zip(keys, values))
+    h = hist.Hist(*axes, storage=hist.storage.Weight())
+    t0 = time.monotonic()
+    if weight_names is None:
+        h.fill(**constants, **arrays)
+    else:
+        fill_variations(h, dict(zip(weight_names, values[len(keys):])), **constants, **arrays)
+    return ak.Array(np.array([time.monotonic() - t0]))
+
+def fill_duration(after, dask_hist, weights=None, **fill_kwargs):
+    """
+    Time taken to fill a copy of a histogram with the given values, one entry per chunk.
+    The dask histogram is filled elsewhere in the graph with the same values, so this repeats
+    the same work.
+
+    Inputs:
+        after: dask-awkward array
+            Stamp that the fill waits for, so that it does not overlap with the computation
+        dask_hist: utils.histograms.VariationHist
+            Histogram whose axes are copied
+        weights: dict of dask-awkward arrays or None
+            Weight variations, for a batched fill (see utils.histograms.fill_variations)
+        fill_kwargs: dask-awkward arrays or constants
+            Same arguments as for dask_hist.fill
+    """
+    collections = {key: val for key, val in fill_kwargs.items() if isinstance(val, dak.Array)}
+    constants = {key: val for key, val in fill_kwargs.items() if key not in collections}
+    return dak.map_partitions(
+        functools.partial(_fill_duration, list(dask_hist.axes), constants, list(collections),
+                          None if weights is None else list(weights)),
+        after,
+        *collections.values(),
+        *(weights or {}).values(),
+        label="phase-fill",
+        meta=_meta(),
+    )
+
+def _meta():
+    return ak.Array(ak.Array(np.zeros(1)).layout.to_typetracer(forget_length=True))
+
+def phase_times(t_compute, fill_durations):
+    """
+    Combine the stamp taken once everything to be filled has been computed ("compute_done") and
+    the fill durations, summed over all fills ("fill"), into one record per chunk.
+    """
+    fill = sum(fill_durations[1:], fill_durations[0]) if fill_durations else t_compute - t_compute
+    return dak.zip({"compute_done": t_compute, "fill": fill})
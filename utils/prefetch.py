@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+
+import dask
+import dask_awkward as dak
+from distributed import wait
+import uproot
+
+from .config import config
+
+# Staging of upcoming chunks ahead of the computation. Each chunk is read by a task that fuses
+# the read with the processing, so the time taken by the server to fetch a file (e.g. an XCache
+# filling from the origin) delays every task. The prefetcher submits separate tasks that only
+# read the compressed baskets of the needed branches, so that the server has them by the time
+# the computation reads them. Nothing is decompressed or kept.
+
+# Scheduler task prefix of the tasks that read (and process) one chunk each
+READ_PREFIX = "from-uproot"
+
+def needed_branches(*collections):
+    """
+    Branches read by the computation of the given dask collections, as found by dask-awkward's
+    column optimization. If none are found, the IO_BRANCHES for IO_FILE_PERCENT are used.
+    """
+    flat, _ = dask.base.unpack_collections(*collections)
+    branches = set()
+    for columns in dak.report_necessary_columns(*flat).values():
+        branches.update(columns)
+    if not branches:
+        benchmarking = config["benchmarking"]
+        branches.update(benchmarking["IO_BRANCHES"][benchmarking["IO_FILE_PERCENT"]])
+    return sorted(branches)
+
+def fileset_chunks(fileset):
+    """
+    (file, object_path, start, stop) of every chunk of a fileset, in the order in which coffea
+    makes the partitions.
+    """
+    chunks = []
+    for dataset in fileset.values():
+        for fname, finfo in dataset["files"].items():
+            for start, stop in finfo["steps"] or []:
+                chunks.append((fname, finfo["object_path"], start, stop))
+    return chunks
+
+def basket_ranges(tree, branches, start, stop):
+    """
+    Sorted byte ranges of the baskets of the branches that hold entries start to stop of a tree.
+    Branches missing from the tree are skipped.
+    """
+    ranges = []
+    for branch in branches:
+        if branch not in tree:
+            continue
+        for _, byte_range in tree[branch].entries_to_ranges_or_baskets(start, stop):
+            #Baskets stored in the TBranch itself are read with the tree
+            if isinstance(byte_range, tuple):
+                ranges.append((int(byte_range[0]), int(byte_range[1])))
+    return sorted(ranges)
+
+def stage_chunk(fname, object_path, start, stop, branches, timeout=None):
+    """
+    Read the compressed baskets of the branches that hold entries start to stop of a tree.
+    Returns (epoch time when staging started, epoch time when it was done, bytes read).
+    """
+    t_start = time.time()
+    with uproot.open(fname, timeout=timeout) as file:
+        ranges = basket_ranges(file[object_path], branches, start, stop)
+        chunks = file.file.source.chunks(ranges, queue.Queue())
+        for chunk in chunks:
+            chunk.wait()
+    return t_start, time.time(), sum(range_stop - range_start for range_start, range_stop in ranges)
+
+def _started_reads(prefix=READ_PREFIX, dask_scheduler=None):
+    """
+    Number of tasks with the prefix that have started (or finished) on the scheduler. Finished reads
+    are released once their results have been used. The counts of a prefix are kept for as long as
+    the scheduler runs, so they include the reads of earlier runs on the same cluster.
+    """
+    states = dask_scheduler.task_prefixes[prefix].states if prefix in dask_scheduler.task_prefixes else {}
+    return sum(states.get(state, 0) for state in ("processing", "memory", "released", "erred", "forgotten"))
+
+class Prefetcher:
+    """
+    Stages the chunks of a fileset in the order in which they will be read, in a background thread
+    of the client, while the computation runs.
+
+    Inputs:
+        client: distributed.Client
+            Client the staging tasks are submitted to
+        fileset: dict
+            Run-ready fileset
+        branches: list of str
+            Branches to stage, see needed_branches
+        lookahead: int
+            Maximum number of chunks that staging may be ahead of the chunk reads of the computation
+        concurrency: int
+            Maximum number of staging tasks at once
+        timeout: float
+            uproot timeout for staging reads
+        read_prefix: str
+            Task prefix of the chunk reads of the computation (READ_PREFIX, or that of the I/O-only
+            mode, see utils.readpatterns)
+    """
+    def __init__(self, client, fileset, branches, lookahead, concurrency, timeout=None, read_prefix=READ_PREFIX):
+        self.client = client
+        self.read_prefix = read_prefix
+        self.chunks = fileset_chunks(fileset)
+        self.branches = branches
+        self.lookahead = lookahead
+        self.concurrency = concurrency
+        self.timeout = timeout
+        #(file, start, stop) -> epoch time when the chunk was staged
+        self.staged = {}
+        self.staged_bytes = 0
+        self.failed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+
+    def start(self):
+        """
+        Start staging. Call before the computation is submitted: reads are counted from here.
+        """
+        self._baseline = self.client.run_on_scheduler(_started_reads, self.read_prefix)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop staging (once the computation is done), cancelling the staging tasks still running.
+        """
+        self._stop.set()
+        self._thread.join()
+
+    def _collect(self, futures):
+        for future in futures:
+            fname, start, stop = self._keys.pop(future)
+            if future.status == "finished":
+                _, t_done, nbytes = future.result()
+                self.staged[(fname, start, stop)] = t_done
+                self.staged_bytes += nbytes
+            else:
+                self.failed += 1
+
+    def _wait(self, in_flight):
+        """
+        Wait (up to a second) for a staging task to finish, and collect the finished ones.
+        Returns the ones still running.
+        """
+        if not in_flight:
+            time.sleep(1)
+            return in_flight
+        try:
+            wait(list(in_flight), timeout=1, return_when="FIRST_COMPLETED")
+        except TimeoutError:
+            pass
+        done = {future for future in in_flight if future.done()}
+        self._collect(done)
+        return in_flight - done
+
+    def _ahead(self, i):
+        """
+        Whether chunk i is more than lookahead chunks ahead of the reads. The scheduler is only
+        asked again when the last answer says so.
+        """
+        if i - self._consumed < self.lookahead:
+            return False
+        self._consumed = self.client.run_on_scheduler(_started_reads, self.read_prefix) - self._baseline
+        return i - self._consumed >= self.lookahead
+
+    def _run(self):
+        self._keys = {}
+        self._consumed = 0
+        in_flight = set()
+        for i, (fname, object_path, start, stop) in enumerate(self.chunks):
+            while not self._stop.is_set() and (len(in_flight) >= self.concurrency or self._ahead(i)):
+                in_flight = self._wait(in_flight)
+            if self._stop.is_set():
+                break
+            future = self.client.submit(stage_chunk, fname, object_path, start, stop, self.branches, self.timeout,
+                                        pure=False, priority=10)
+            self._keys[future] = (fname, start, stop)
+            in_flight.add(future)
+        while in_flight and not self._stop.is_set():
+            in_flight = self._wait(in_flight)
+        #Staging that has not finished by the end of the computation is of no use
+        self.client.cancel(list(in_flight))
+
+    def summary(self):
+        """
+        Run-level staging statistics, stored in the report.
+        """
+        return {
+            "prefetch_branches": self.branches,
+            "prefetch_lookahead": self.lookahead,
+            "prefetch_concurrency": self.concurrency,
+            "prefetch_chunks": len(self.chunks),
+            "prefetch_staged_chunks": len(self.staged),
+            "prefetch_failed_chunks": self.failed,
+            "prefetch_staged_bytes": self.staged_bytes,
+        }
@@ -0,0 +1,198 @@
+import random
+import socket
+import time
+
+import awkward as ak
+import dask_awkward as dak
+import uproot
+
+from .prefetch import fileset_chunks
+from .rechunk import group_chunks, target_entries
+
+# Reads of the I/O-only mode (DISABLE_PROCESSING). Each chunk reads its whole branch set directly
+# with uproot, without building events or running the processor, and the requests for its baskets
+# are made in one of the access patterns below:
+#   coalesced: the baskets of every branch in one vector read, as uproot does for an analysis
+#   sequential: one vector read per branch, each one after the previous has arrived
+#   interleaved: one vector read per cluster of entries (with the baskets of every branch for
+#       those entries), in entry order
+#   sparse: one read per randomly chosen entry, in random order, as in a pick-event skim. There
+#       is no basket cache, so baskets holding several of the entries are fetched again
+# The reports have the same format as those of uproot, so the requests, bytes and times of the
+# chunks end up in the parquet report as usual.
+
+PATTERNS = ("coalesced", "sequential", "interleaved", "sparse")
+
+def _cluster_ranges(tree, branches, start, stop):
+    """
+    (start, stop) of the entries of each cluster of the branches (where they all start a new
+    basket) between entries start and stop.
+    """
+    offsets = tree.common_entry_offsets(filter_name=branches)
+    return [(max(a, start), min(b, stop)) for a, b in zip(offsets[:-1], offsets[1:]) if a < stop and b > start]
+
+def read_chunk(tree, branches, start, stop, pattern="coalesced", sparse_fraction=0.01, seed=None):
+    """
+    Read (and decompress) entries start to stop of the branches of a tree with an access pattern,
+    and return the number of entries read. Branches missing from the tree are skipped.
+
+    Inputs:
+        tree: uproot TTree
+        branches: list of str
+            Branches to read
+        start, stop: int
+            Entry range of the chunk
+        pattern: str
+            One of PATTERNS
+        sparse_fraction: float
+            Fraction of the entries read by the "sparse" pattern (at least one)
+        seed: int, str or None
+            Seed of the choice of entries of the "sparse" pattern
+    """
+    branches = [branch for branch in branches if branch in tree]
+    if pattern == "coalesced":
+        tree.arrays(branches, entry_start=start, entry_stop=stop)
+    elif pattern == "sequential":
+        for branch in branches:
+            tree[branch].array(entry_start=start, entry_stop=stop)
+    elif pattern == "interleaved":
+        for cluster_start, cluster_stop in _cluster_ranges(tree, branches, start, stop):
+            tree.arrays(branches, entry_start=cluster_start, entry_stop=cluster_stop)
+    elif pattern == "sparse":
+        n_entries = min(stop - start, max(1, round(sparse_fraction*(stop - start))))
+        for entry in random.Random(seed).sample(range(start, stop), n_entries):
+            tree.arrays(branches, entry_start=entry, entry_stop=entry + 1)
+        return n_entries
+    else:
+        raise ValueError(f"Unknown read pattern {pattern}, should be one of {', '.join(PATTERNS)}")
+    return stop - start
+
+def _read(entries_read, num_requests, report):
+    """
+    Output of one chunk: the number of entries read and of requests made, and its report record,
+    with the fields of the reports of uproot.dask.
+    """
+    return ak.Array([{"entries_read": entries_read, "num_requests": num_requests, "report": report}])
+
+def _report(args, call_time=None, duration=None, counters=None, exception=None):
+    """
+    Report record of one chunk, with the fields of the reports of uproot.dask.
+    """
+    return {
+        "call_time": call_time,
+        "duration": duration,
+        "performance_counters": counters.asdict() if counters is not None else None,
+        "args": [repr(arg) for arg in args],
+        "kwargs": [],
+        "exception": type(exception).__name__ if exception is not None else None,
+        "message": str(exception) if exception is not None else None,
+        "fqdn": socket.getfqdn() if exception is not None else None,
+        "hostname": socket.gethostname() if exception is not None else None,
+    }
+
+class ChunkReader:
+    """
+    dask-awkward from_map function reading the chunks of one task, each given as (file,
+    object_path, start, stop), one after the other with read_chunk. Returns one record per chunk,
+    with the number of entries read and requests made, and its report. Failed reads (OSError,
+    like uproot) are reported instead of raised, and read no entries.
+    The reports are a field of the output rather than a second output (return_report), so that
+    the reads are the only tasks labelled io-<pattern> in the task stream.
+
+    Inputs:
+        branches: list of str
+            Branches to read
+        pattern: str
+            One of PATTERNS
+        sparse_fraction: float
+            Fraction of the entries read by the "sparse" pattern
+        uproot_options: dict
+            Options of uproot.open, e.g. the handler and timeout
+    """
+    def __init__(self, branches, pattern, sparse_fraction, uproot_options):
+        self.branches = list(branches)
+        self.pattern = pattern
+        self.sparse_fraction = sparse_fraction
+        self.uproot_options = uproot_options
+
+    def mock(self):
+        failed = _read(0, 0, _report((), call_time=0, exception=OSError()))
+        return ak.Array(failed.layout.to_typetracer(forget_length=True))
+
+    def read(self, fname, object_path, start, stop):
+        args = (fname, object_path, start, stop, True)
+        call_time = time.time_ns()
+        t0 = time.monotonic()
+        try:
+            #Nothing is kept, so that each pattern makes all of its own requests
+            with uproot.open(fname, array_cache=None, **self.uproot_options) as file:
+                entries_read = read_chunk(file[object_path], self.branches, start, stop, self.pattern,
+                                          self.sparse_fraction, seed=f"{fname}:{start}:{stop}")
+                counters = file.file.source.performance_counters
+        except OSError as err:
+            return _read(0, 0, _report(args, call_time=call_time, exception=err))
+        return _read(entries_read, counters.num_requests, _report(args, duration=time.monotonic() - t0, counters=counters))
+
+    def __call__(self, chunks):
+        return ak.concatenate([self.read(*chunk) for chunk in chunks])
+
+def fileset_tasks(fileset, task_target=None, task_by="events"):
+    """
+    Chunks read by each task of every dataset of a fileset, in the order of the partitions: one
+    chunk per task, as coffea makes them, or groups of consecutive chunks (of any files) of up to
+    task_target. Returns a dict that maps each dataset with chunks to a list of lists of (file,
+    object_path, start, stop).
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset
+        task_target: float or None
+            Events or compressed bytes per task (see utils.rechunk), or None for one task per chunk
+        task_by: "events" or "bytes"
+            Unit of task_target
+    """
+    tasks = {}
+    for name, dataset in fileset.items():
+        chunks = fileset_chunks({name: dataset})
+        if not chunks:
+            continue
+        max_entries = target_entries(dataset, task_target, task_by) if task_target else None
+        tasks[name] = group_chunks(chunks, max_entries) if max_entries else [[chunk] for chunk in chunks]
+    return tasks
+
+def read_fileset(fileset, branches, pattern="coalesced", sparse_fraction=0.01, uproot_options=None,
+                 task_target=None, task_by="events"):
+    """
+    Lazily read the branches of every chunk of a fileset with an access pattern, with one task per
+    chunk, or per group of consecutive chunks (of any files) of up to task_target. Returns
+    (out, report) like coffea's apply_to_fileset with reports: dicts that map each dataset
+    to {"io_reads": one record per chunk} and to its report.
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset
+        branches: list of str, or dict
+            Branches to read, or a dict of the branches to read for each dataset
+        pattern: str
+            One of PATTERNS
+        sparse_fraction: float
+            Fraction of the entries of each chunk read by the "sparse" pattern
+        uproot_options: dict
+            Options as passed to apply_to_fileset. The handler and timeout are used to open the files
+        task_target: float or None
+            Events or compressed bytes per task (see utils.rechunk), or None for one task per chunk
+        task_by: "events" or "bytes"
+            Unit of task_target
+    """
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown read pattern {pattern}, should be one of {', '.join(PATTERNS)}")
+    #Read errors are always reported, and skipbadfiles is a coffea option
+    uproot_options = {key: val for key, val in (uproot_options or {}).items()
+                      if key not in ("allow_read_errors_with_report", "skipbadfiles")}
+    out, report = {}, {}
+    for name, tasks in fileset_tasks(fileset, task_target, task_by).items():
+        reader = ChunkReader(branches[name] if isinstance(branches, dict) else branches, pattern, sparse_fraction, uproot_options)
+        reads = dak.from_map(reader, tasks, label=f"io-{pattern}")
+        out[name] = {"io_reads": reads[["entries_read", "num_requests"]]}
+        report[name] = reads["report"]
+    return out, report
@@ -0,0 +1,163 @@
+import concurrent.futures
+import math
+
+import numpy as np
+import uproot
+
+from .branchsizes import SIZES_KEY
+
+# Size-aware re-chunking of run-ready filesets. The steps of the filesets were made with a fixed
+# step size aligned to the clusters of each file, so a file may have one small step or many
+# large ones, and the end of a run waits on the largest tasks. Steps are rebalanced toward a
+# target number of events, or of compressed bytes (from the branch-size index), per task:
+# consecutive small steps of a file are merged, and steps larger than the target are split on
+# cluster boundaries of the file. coffea makes one task per step of one file, so small files are
+# only grouped into multi-file tasks by the reads of the I/O-only mode (see group_chunks).
+
+def bytes_per_entry(dataset):
+    """
+    Compressed bytes per entry of the files of a dataset, from its branch-size index, or None if
+    it has none.
+    """
+    index = dataset.get(SIZES_KEY)
+    if not index or not index["num_entries"]:
+        return None
+    return sum(sizes[0] for sizes in index["branches"].values())/index["num_entries"]
+
+def target_entries(dataset, target, by="events"):
+    """
+    Entries per task of a dataset for a target size, or None if the size of its entries is not
+    known.
+    """
+    if by == "events":
+        return target
+    if by != "bytes":
+        raise ValueError(f"Unknown re-chunking size {by}, should be 'events' or 'bytes'")
+    entry_bytes = bytes_per_entry(dataset)
+    return target/entry_bytes if entry_bytes else None
+
+def cluster_offsets(fname, object_path, timeout=None):
+    """
+    Entries at which all branches of a tree start a new cluster, including 0 and the number of
+    entries.
+    """
+    with uproot.open(fname, timeout=timeout) as file:
+        return [int(offset) for offset in file[object_path].common_entry_offsets()]
+
+def split_step(start, stop, n_parts, offsets):
+    """
+    Split the entries start to stop into up to n_parts steps of similar size, at the cluster
+    offsets closest to even splits. Returns the list of steps.
+    """
+    inner = np.array([offset for offset in offsets if start < offset < stop], dtype=np.int64)
+    if len(inner) == 0:
+        return [[start, stop]]
+    ideal = start + np.arange(1, n_parts)*(stop - start)/n_parts
+    cuts = np.unique(inner[np.abs(inner[None, :] - ideal[:, None]).argmin(axis=1)])
+    bounds = [start, *cuts.tolist(), stop]
+    return [[a, b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+def merge_steps(steps, max_entries):
+    """
+    Merge consecutive contiguous steps for as long as the merged step has at most max_entries.
+    """
+    merged = []
+    for start, stop in steps:
+        if merged and merged[-1][1] == start and stop - merged[-1][0] <= max_entries:
+            merged[-1][1] = stop
+        else:
+            merged.append([start, stop])
+    return merged
+
+def rechunk(fileset, target, by="events", workers=8, timeout=None):
+    """
+    Rebalance the steps of a run-ready fileset toward a target size per task. Steps are merged
+    within each file, and files with steps larger than the target are opened (concurrently) to
+    split those on cluster boundaries. Datasets whose size per entry is not known (by "bytes"
+    without a branch-size index) are left as they are. Returns a new fileset.
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset
+        target: float
+            Events or compressed bytes per task
+        by: "events" or "bytes"
+            Unit of the target
+        workers: int
+            Number of files opened at once
+        timeout: float
+            uproot timeout
+    """
+    out = {}
+    to_split = []
+    for name, dataset in fileset.items():
+        out[name] = {**dataset, "files": {fname: dict(finfo) for fname, finfo in dataset["files"].items()}}
+        max_entries = target_entries(dataset, target, by)
+        if max_entries is None:
+            print(f"Not re-chunking dataset {name}, which has no branch-size index")
+            continue
+        for fname, finfo in out[name]["files"].items():
+            if not finfo["steps"]:
+                continue
+            finfo["steps"] = merge_steps(finfo["steps"], max_entries)
+            if any(stop - start > max_entries for start, stop in finfo["steps"]):
+                to_split.append((finfo, fname, max_entries))
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(cluster_offsets, fname, finfo["object_path"], timeout): (finfo, fname, max_entries)
+                   for finfo, fname, max_entries in to_split}
+        for future in concurrent.futures.as_completed(futures):
+            finfo, fname, max_entries = futures[future]
+            try:
+                offsets = future.result()
+            except Exception as err:
+                print(f"Not splitting the steps of {fname}, whose clusters could not be read: {type(err).__name__}: {err}")
+                continue
+            steps = []
+            for start, stop in finfo["steps"]:
+                steps.extend(split_step(start, stop, math.ceil((stop - start)/max_entries), offsets))
+            finfo["steps"] = steps
+    return out
+
+def task_sizes(fileset, by="events"):
+    """
+    Size of every step of a fileset, in events or compressed bytes (nan for datasets without a
+    branch-size index).
+    """
+    sizes = []
+    for dataset in fileset.values():
+        scale = 1 if by == "events" else (bytes_per_entry(dataset) or np.nan)
+        for finfo in dataset["files"].values():
+            sizes.extend((stop - start)*scale for start, stop in finfo["steps"] or [])
+    return np.asarray(sizes, dtype=np.float64)
+
+def size_stats(sizes):
+    """
+    Number of tasks and mean, standard deviation and maximum of their sizes.
+    """
+    sizes = sizes[~np.isnan(sizes)]
+    if len(sizes) == 0:
+        return {"tasks": 0, "mean": None, "std": None, "max": None}
+    return {"tasks": len(sizes), "mean": float(sizes.mean()), "std": float(sizes.std()), "max": float(sizes.max())}
+
+def group_chunks(chunks, max_entries):
+    """
+    Group consecutive chunks (of one dataset, possibly of different files) into tasks of at most
+    max_entries. Chunks larger than that are tasks of their own.
+
+    Inputs:
+        chunks: list of (file, object_path, start, stop)
+        max_entries: float
+            Maximum number of entries of a task
+    """
+    tasks = []
+    task_entries = 0
+    for chunk in chunks:
+        entries = chunk[3] - chunk[2]
+        if tasks and task_entries + entries <= max_entries:
+            tasks[-1].append(chunk)
+            task_entries += entries
+        else:
+            tasks.append([chunk])
+            task_entries = entries
+    return tasks
@@ -0,0 +1,555 @@
+import json
+import pickle
+import re
+
+import awkward as ak
+from dask.utils import key_split
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Columns written for every chunk. String columns that repeat heavily are dictionary-encoded.
+REPORT_SCHEMA = pa.schema([
+    ("dataset", pa.dictionary(pa.int32(), pa.string())),
+    ("file", pa.dictionary(pa.int32(), pa.string())),
+    ("site", pa.dictionary(pa.int32(), pa.string())),
+    ("object_path", pa.dictionary(pa.int32(), pa.string())),
+    ("start", pa.int64()),
+    ("stop", pa.int64()),
+    ("call_time", pa.float64()),
+    ("duration", pa.float64()),
+    ("exception", pa.dictionary(pa.int32(), pa.string())),
+    ("message", pa.dictionary(pa.int32(), pa.string())),
+    ("hostname", pa.dictionary(pa.int32(), pa.string())),
+    # Pass in which the chunk was read (0, or the retry pass, see utils.retry), and whether this is its
+    # last attempt: chunks that failed are read again in the next retry pass, if there is one
+    ("attempt", pa.int64()),
+    ("final", pa.bool_()),
+    # I/O counters of the uproot source (see utils.iostats), null for failed chunks
+    ("requested_bytes", pa.int64()),
+    ("received_bytes", pa.int64()),
+    ("num_requests", pa.int64()),
+    ("open_time", pa.float64()),
+    ("vector_read_bytes", pa.list_(pa.int64())),
+    # Requests of the chunk sent again to a fallback server, and those it answered first (see
+    # utils.speculation)
+    ("speculated_requests", pa.int64()),
+    ("speculation_wins", pa.int64()),
+    # Time spent in each phase of the chunk [s]. Decompression is the part of the uproot read
+    # time not spent opening the file or waiting for data; compute and fill come from the
+    # processor (see utils.phases) and are null unless PHASE_TIMING is enabled
+    ("fetch_time", pa.float64()),
+    ("decompress_time", pa.float64()),
+    ("compute_time", pa.float64()),
+    ("fill_time", pa.float64()),
+    # Seconds between the end of staging the chunk (see utils.prefetch) and the start of its read:
+    # negative if staging finished late, null if the chunk was not staged or could not be read
+    ("prefetch_lead", pa.float64()),
+])
+# Phase columns, in the order that they happen
+PHASES = ["open_time", "fetch_time", "decompress_time", "compute_time", "fill_time"]
+# Performance counter of the uproot report stored in each I/O column
+IO_COUNTERS = {
+    "requested_bytes": "num_requested_bytes",
+    "received_bytes": "num_received_bytes",
+    "num_requests": "num_requests",
+    "open_time": "open_time",
+    "vector_read_bytes": "vector_read_bytes",
+    "speculated_requests": "speculated_requests",
+    "speculation_wins": "speculation_wins",
+    "fetch_time": "fetch_time",
+}
+# Key in the parquet schema metadata holding run-level information (TotalTime etc.)
+RUN_INFO_KEY = b"xcache_test.run_info"
+
+def server_label(server):
+    """
+    Form of a server name (XROOTD_CHOICE) used for report directories and to group reports:
+    every run of characters other than letters, digits, '_' and '-' (e.g. '.' and '/') becomes '_'.
+    """
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", server).strip("_")
+
+def _unrepr(strings):
+    """
+    uproot stores the call arguments as repr() strings, so file and object paths are quoted.
+    """
+    return pc.replace_substring_regex(strings, pattern=r"^'(.*)'$", replacement=r"\1")
+
+def _dict_column(arr):
+    return pc.cast(arr, pa.string()).dictionary_encode().cast(pa.dictionary(pa.int32(), pa.string()))
+
+def _sites(files):
+    """
+    Site of each file (everything before '/store'), computed once per unique file.
+
+    Inputs:
+        files: dictionary-encoded arrow array of file paths
+    """
+    site_names = pc.replace_substring_regex(files.dictionary, pattern=r"/store.*$", replacement="")
+    return _dict_column(pc.take(site_names, files.indices))
+
+def _io_counter(rep, counter, typ):
+    """
+    One performance counter of every chunk, or nulls if the report does not have it (older
+    uproot versions, or runs without utils.iostats.CountingSource).
+    """
+    if "performance_counters" in rep.fields and counter in ak.fields(rep.performance_counters):
+        return pc.cast(ak.to_arrow(rep.performance_counters[counter], extensionarray=False), typ)
+    return pa.nulls(len(rep), typ)
+
+def _phase_time(phase_times, field, failed):
+    """
+    One processor phase time per chunk, null for chunks that failed to be read (the processor
+    then ran on an empty placeholder) or if the phases were not timed.
+    """
+    if phase_times is None:
+        return pa.nulls(len(failed), pa.float64())
+    return pa.array(np.asarray(phase_times[field], dtype=np.float64), mask=failed)
+
+def _prefetch_lead(files, starts, stops, read_start, staged):
+    """
+    Time from the end of staging to the start of the read of each chunk, null for unstaged chunks.
+    """
+    if not staged:
+        return pa.nulls(len(read_start), pa.float64())
+    keys = zip(files.to_pylist(), starts.to_pylist(), stops.to_pylist())
+    t_staged = pa.array([staged.get(key) for key in keys], pa.float64())
+    return pc.subtract(read_start, t_staged)
+
+def dataset_table(dset, rep, phase_times=None, staged=None, attempts=None, last_attempt=0):
+    """
+    Convert the awkward report of one dataset (one record per chunk) into an arrow table
+    following REPORT_SCHEMA.
+
+    Inputs:
+        dset: str
+            Name of the dataset
+        rep: Awkward array
+            Report returned by apply_to_fileset for this dataset
+        phase_times: Awkward array
+            "phase_times" output of the processor for this dataset (one record per chunk, in the
+            same order as the report), or None
+        staged: dict
+            Maps (file, start, stop) to the epoch time at which the chunk was staged by
+            utils.prefetch.Prefetcher, or None
+        attempts: numpy array
+            Pass in which each chunk was read (see utils.retry.merge_reports), or None if there
+            were no retries
+        last_attempt: int
+            Last pass of the run
+    """
+    n = len(rep)
+    args = rep.args
+    files = _dict_column(_unrepr(ak.to_arrow(args[:,0], extensionarray=False)))
+    columns = {
+        "dataset": _dict_column(pa.array([dset]*n, pa.string())),
+        "file": files,
+        "site": _sites(files),
+        "object_path": _dict_column(_unrepr(ak.to_arrow(args[:,1], extensionarray=False))),
+        "start": pc.cast(ak.to_arrow(args[:,2], extensionarray=False), pa.int64()),
+        "stop": pc.cast(ak.to_arrow(args[:,3], extensionarray=False), pa.int64()),
+        #Nanoseconds since the epoch do not fit a double exactly
+        "call_time": pc.cast(ak.to_arrow(rep.call_time, extensionarray=False), pa.float64(), safe=False),
+        "duration": ak.to_arrow(rep.duration, extensionarray=False),
+        "exception": _dict_column(ak.to_arrow(rep.exception, extensionarray=False)),
+        "message": _dict_column(ak.to_arrow(rep.message, extensionarray=False)),
+        "hostname": _dict_column(ak.to_arrow(rep.hostname, extensionarray=False)),
+    }
+    failed = ak.to_numpy(~ak.is_none(rep.message))
+    attempts = np.zeros(n, dtype=np.int64) if attempts is None else np.asarray(attempts, dtype=np.int64)
+    columns["attempt"] = pa.array(attempts)
+    #Every pass but the last reads again the chunks that failed in the pass before
+    columns["final"] = pa.array(~failed | (attempts == last_attempt))
+    for column, counter in IO_COUNTERS.items():
+        columns[column] = _io_counter(rep, counter, REPORT_SCHEMA.field(column).type)
+    io_time = pc.add(pc.fill_null(columns["open_time"], 0.0), pc.fill_null(columns["fetch_time"], 0.0))
+    columns["decompress_time"] = pc.if_else(
+        pc.is_null(columns["fetch_time"]), pa.nulls(n, pa.float64()),
+        pc.max_element_wise(pc.subtract(columns["duration"], io_time), 0.0),
+    )
+    columns["compute_time"] = pc.subtract(_phase_time(phase_times, "compute_done", failed),
+                                          _io_counter(rep, "read_done", pa.float64()))
+    columns["fill_time"] = _phase_time(phase_times, "fill", failed)
+    #uproot only records the call time of failed reads, so the start of successful reads is
+    #worked out from the time at which they finished
+    read_start = pc.subtract(_io_counter(rep, "read_done", pa.float64()), columns["duration"])
+    columns["prefetch_lead"] = _prefetch_lead(columns["file"], columns["start"], columns["stop"], read_start, staged)
+    return pa.table([columns[name] for name in REPORT_SCHEMA.names], schema=REPORT_SCHEMA)
+
+def task_durations(task_stream, prefixes):
+    """
+    Compute time [s] of the tasks of a dask task stream whose key has one of the given prefixes.
+
+    Inputs:
+        task_stream: iterable of dict
+            Records of distributed.get_task_stream (or of the scheduler's task stream plugin)
+        prefixes: list of str
+            Task prefixes (the key without its token) to keep
+    """
+    return np.array([
+        startstop["stop"] - startstop["start"]
+        for task in task_stream if key_split(task["key"]) in prefixes
+        for startstop in task["startstops"] if startstop["action"] == "compute"
+    ], dtype=np.float64)
+
+def task_duration_stats(task_stream, prefixes):
+    """
+    Number of tasks and mean, standard deviation, 50th and 99th percentiles and maximum of their
+    compute time [s], for the tasks of a dask task stream whose key has one of the given prefixes
+    (see task_durations).
+    """
+    durations = task_durations(task_stream, prefixes)
+    if len(durations) == 0:
+        return {"tasks": 0, "mean": None, "std": None, "p50": None, "p99": None, "max": None}
+    return {
+        "tasks": len(durations),
+        "mean": float(durations.mean()),
+        "std": float(durations.std()),
+        "p50": float(np.percentile(durations, 50)),
+        "p99": float(np.percentile(durations, 99)),
+        "max": float(durations.max()),
+    }
+
+def write_report(creports, path, run_info=None, phase_times=None, staged=None, attempts=None):
+    """
+    Write computed reports to a parquet file with one row group per dataset.
+
+    Inputs:
+        creports: dict
+            Maps dataset name to the awkward report computed by dask
+        path: str
+            Where to write the parquet file
+        run_info: dict
+            JSON-serializable run-level information (e.g. TotalTime), stored in the file metadata
+        phase_times: dict
+            Maps dataset name to the "phase_times" output of the processor, if available
+        staged: dict
+            Maps (file, start, stop) to the epoch time at which the chunk was staged, if prefetching
+        attempts: dict
+            Maps dataset name to the pass in which each chunk of its report was read, if failed
+            chunks were retried
+    """
+    attempts = attempts or {}
+    last_attempt = max((int(vals.max()) for vals in attempts.values() if len(vals)), default=0)
+    schema = REPORT_SCHEMA.with_metadata({RUN_INFO_KEY: json.dumps(run_info or {})})
+    with pq.ParquetWriter(path, schema, use_dictionary=True, compression="zstd") as writer:
+        for dset, rep in creports.items():
+            if len(rep) == 0:
+                continue
+            table = dataset_table(dset, rep, (phase_times or {}).get(dset, None), staged, attempts.get(dset), last_attempt)
+            writer.write_table(table.replace_schema_metadata(schema.metadata))
+
+def read_pickle_report(path):
+    """
+    Read a report written by older versions of xcache_test.py (a pickled dict of awkward arrays,
+    with the total time stored under "TotalTime") and return (table, run_info).
+    """
+    with open(path, "rb") as f:
+        reports_plus = pickle.load(f)
+    run_info = {"TotalTime": reports_plus.get("TotalTime", None)}
+    tables = [dataset_table(dset, rep) for dset, rep in reports_plus.items() if dset != "TotalTime" and len(rep) > 0]
+    if not tables:
+        return REPORT_SCHEMA.empty_table(), run_info
+    return pa.concat_tables(tables).unify_dictionaries().combine_chunks(), run_info
+
+def read_report(path, columns=None):
+    """
+    Read a report as an arrow table, plus the run-level information dict.
+
+    Parquet reports are memory-mapped and only the requested columns are read. Pickled
+    reports are fully loaded and converted.
+
+    Inputs:
+        path: str
+            Location of a .parquet or .pkl report
+        columns: list of str
+            Columns to read. If None, read every column
+    """
+    if str(path).endswith(".pkl"):
+        table, run_info = read_pickle_report(path)
+        if columns is not None:
+            table = table.select(columns)
+        return table, run_info
+    pfile = pq.ParquetFile(path, memory_map=True)
+    metadata = pfile.schema_arrow.metadata or {}
+    run_info = json.loads(metadata.get(RUN_INFO_KEY, b"{}"))
+    if columns is not None:
+        columns = [c for c in columns if c in pfile.schema_arrow.names]
+    table = pfile.read(columns=columns)
+    return table.unify_dictionaries().combine_chunks(), run_info
+
+def final_chunks(table):
+    """
+    The rows of the last attempt at reading each chunk, so that chunks read again by a retry pass
+    (see utils.retry) count once. Reports without the final column have one attempt per chunk.
+    """
+    if "final" not in table.column_names:
+        return table
+    return table.filter(pc.fill_null(table["final"], True))
+
+def retry_stats(table):
+    """
+    Number of chunks read, failed, and recovered (read successfully after failing in the pass
+    before), per pass of the run. Returns None if no chunk was retried.
+    """
+    if "attempt" not in table.column_names or pc.max(table["attempt"]).as_py() in (None, 0):
+        return None
+    attempts = table["attempt"].to_numpy()
+    failed = table["message"].is_valid().to_numpy(zero_copy_only=False)
+    n_passes = attempts.max() + 1
+    chunks = np.bincount(attempts, minlength=n_passes)
+    failed_chunks = np.bincount(attempts[failed], minlength=n_passes)
+    return pa.table({
+        "attempt": np.arange(n_passes),
+        "chunks": chunks,
+        "failed_chunks": failed_chunks,
+        "recovered_chunks": np.where(np.arange(n_passes) > 0, chunks - failed_chunks, 0),
+    })
+
+def _codes(column):
+    """
+    Dictionary indices of a dictionary-encoded column as a numpy array, with nulls as -1.
+    """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    return pc.fill_null(column.indices, -1).to_numpy(zero_copy_only=False).astype(np.int64), column.dictionary
+
+def _strip_newline(values):
+    """
+    Map dictionary values to their version without a trailing newline, merging values that become
+    identical. Returns (mapping from old to new index, new values).
+    """
+    cleaned = pc.replace_substring_regex(values, pattern="\n$", replacement="").dictionary_encode()
+    return cleaned.indices.to_numpy(zero_copy_only=False).astype(np.int64), cleaned.dictionary
+
+def _numeric(table, name):
+    """
+    A numeric column as a float numpy array with nulls as 0, or zeros if the column is missing.
+    """
+    if name not in table.column_names:
+        return np.zeros(len(table))
+    return pc.fill_null(table[name], 0).to_numpy().astype(np.float64)
+
+def aggregate(table):
+    """
+    Compute all per-dataset, per-file, per-site and per-message counts of a report in one
+    vectorized pass over the dictionary codes of its columns.
+
+    A chunk failed if its message is not null, and a file failed if any of its chunks failed.
+    Site file counts only consider the first chunk (start == 0) of each file. Events are the
+    entries (stop - start) of the chunks that were read successfully. Byte counters, requests
+    and read time (the duration of successful chunks) are summed where the columns exist.
+
+    Inputs:
+        table: arrow table
+            Report as returned by read_report, with at least the dataset, file, site, start, stop
+            and message columns
+
+    Returns a dict of arrow tables: "datasets", "files", "sites", "messages" and "site_messages".
+    """
+    ds, ds_names = _codes(table["dataset"])
+    files, file_names = _codes(table["file"])
+    sites, site_names = _codes(table["site"])
+    msgs, msg_names = _codes(table["message"])
+    start = pc.fill_null(table["start"], 0).to_numpy()
+    entries = pc.fill_null(table["stop"], 0).to_numpy() - start
+    first = start == 0
+    failed = msgs >= 0
+    n_ds, n_files, n_sites = len(ds_names), len(file_names), len(site_names)
+    io = {name: _numeric(table, name) for name in ["requested_bytes", "received_bytes", "num_requests", "open_time"]}
+    io["read_time"] = _numeric(table, "duration")
+
+    #Chunks per dataset
+    ds_chunks = np.bincount(ds, minlength=n_ds)
+    ds_failed_chunks = np.bincount(ds[failed], minlength=n_ds)
+    ds_events = np.bincount(ds[~failed], weights=entries[~failed], minlength=n_ds).astype(np.int64)
+    ds_io = {name: np.bincount(ds, weights=vals, minlength=n_ds) for name, vals in io.items()}
+
+    #Files, keyed by (dataset, file)
+    file_keys, file_first_row, file_inv = np.unique(ds*n_files + files, return_index=True, return_inverse=True)
+    file_chunks = np.bincount(file_inv, minlength=len(file_keys))
+    file_failed_chunks = np.bincount(file_inv[failed], minlength=len(file_keys))
+    file_io = {name: np.bincount(file_inv, weights=vals, minlength=len(file_keys)) for name, vals in io.items()}
+    file_ds = file_keys // max(n_files, 1)
+    file_failed = file_failed_chunks > 0
+    ds_files = np.bincount(file_ds, minlength=n_ds)
+    ds_failed_files = np.bincount(file_ds[file_failed], minlength=n_ds)
+
+    #Sites, counting each file once through its first chunk
+    site_files = np.bincount(sites[first], minlength=n_sites)
+    site_failed_files = np.bincount(sites[first & failed], minlength=n_sites)
+    site_chunks = np.bincount(sites, minlength=n_sites)
+    site_read_chunks = np.bincount(sites[~failed], minlength=n_sites)
+    site_events = np.bincount(sites[~failed], weights=entries[~failed], minlength=n_sites).astype(np.int64)
+    site_io = {name: np.bincount(sites, weights=vals, minlength=n_sites) for name, vals in io.items()}
+
+    #Messages, with trailing newlines removed
+    msg_map, clean_msgs = _strip_newline(msg_names)
+    n_msgs = len(clean_msgs)
+    failed_msgs = msg_map[msgs[failed]]
+    msg_chunks = np.bincount(failed_msgs, minlength=n_msgs)
+    sm_keys, sm_chunks = np.unique(sites[failed]*n_msgs + failed_msgs, return_counts=True)
+
+    has_ds = ds_chunks > 0
+    has_site = site_files > 0
+    has_msg = msg_chunks > 0
+    return {
+        "datasets": pa.table({
+            "dataset": ds_names.filter(pa.array(has_ds)),
+            "chunks": ds_chunks[has_ds],
+            "failed_chunks": ds_failed_chunks[has_ds],
+            "files": ds_files[has_ds],
+            "failed_files": ds_failed_files[has_ds],
+            "events": ds_events[has_ds],
+            **{name: vals[has_ds] for name, vals in ds_io.items()},
+        }),
+        "files": pa.table({
+            "dataset": ds_names.take(pa.array(file_ds)),
+            "file": file_names.take(pa.array(file_keys % max(n_files, 1))),
+            "site": site_names.take(pa.array(sites[file_first_row])),
+            "chunks": file_chunks,
+            "failed_chunks": file_failed_chunks,
+            **file_io,
+        }),
+        "sites": pa.table({
+            "site": site_names.filter(pa.array(has_site)),
+            "files": site_files[has_site],
+            "failed_files": site_failed_files[has_site],
+            "chunks": site_chunks[has_site],
+            "read_chunks": site_read_chunks[has_site],
+            "events": site_events[has_site],
+            **{name: vals[has_site] for name, vals in site_io.items()},
+        }),
+        "messages": pa.table({
+            "message": clean_msgs.filter(pa.array(has_msg)),
+            "chunks": msg_chunks[has_msg],
+        }).sort_by([("chunks", "descending")]),
+        "site_messages": pa.table({
+            "site": site_names.take(pa.array(sm_keys // max(n_msgs, 1))),
+            "message": clean_msgs.take(pa.array(sm_keys % max(n_msgs, 1))),
+            "chunks": sm_chunks,
+        }),
+    }
+
+def phase_percentiles(table, by, percentiles=(50, 95, 99)):
+    """
+    Percentiles of the duration of each phase (see PHASES) over the chunks in each group.
+    Chunks where a phase was not recorded are ignored for that phase.
+
+    Inputs:
+        table: arrow table
+            Report as returned by read_report
+        by: str
+            Dictionary-encoded column to group by, e.g. "dataset" or "site"
+        percentiles: tuple of floats
+            Percentiles to compute
+
+    Returns an arrow table with one row per group and phase, the rows of each group together.
+    """
+    groups, names = _codes(table[by])
+    phase_values = {phase: pc.fill_null(pc.cast(table[phase], pa.float64()), np.nan).to_numpy()
+                    for phase in PHASES if phase in table.column_names}
+    rows = {by: [], "phase": [], "chunks": [], **{f"p{p:g}": [] for p in percentiles}}
+    for i, name in enumerate(names.to_pylist()):
+        for phase, values in phase_values.items():
+            vals = values[(groups == i) & ~np.isnan(values)]
+            if len(vals) == 0:
+                continue
+            rows[by].append(name)
+            rows["phase"].append(phase.removesuffix("_time"))
+            rows["chunks"].append(len(vals))
+            for p, val in zip(percentiles, np.percentile(vals, percentiles)):
+                rows[f"p{p:g}"].append(val)
+    return pa.table(rows)
+
+def prefetch_stats(table):
+    """
+    Count the chunks that were staged before they were read (hits), staged too late, or not staged
+    at all (misses), from the prefetch_lead column. Returns None if no chunk was staged.
+    """
+    if "prefetch_lead" not in table.column_names or table["prefetch_lead"].null_count == len(table):
+        return None
+    lead = pc.fill_null(table["prefetch_lead"], np.nan).to_numpy()
+    staged = ~np.isnan(lead)
+    return {
+        "chunks": len(lead),
+        "hits": int(np.sum(lead[staged] >= 0)),
+        "late": int(np.sum(lead[staged] < 0)),
+        "misses": int(np.sum(~staged)),
+        "median_lead": float(np.median(lead[staged])),
+    }
+
+def speculation_stats(table):
+    """
+    Count, per site, the chunks whose requests were sent again to the fallback server (see
+    utils.speculation) and those for which the fallback answered at least one of them first,
+    with the numbers of requests. Reports without the counters count nothing.
+    """
+    sites, site_names = _codes(table["site"])
+    n_sites = len(site_names)
+    requests = _numeric(table, "speculated_requests")
+    wins = _numeric(table, "speculation_wins")
+    chunks = np.bincount(sites, minlength=n_sites)
+    has_site = chunks > 0
+    return pa.table({
+        "site": site_names.filter(pa.array(has_site)),
+        "chunks": chunks[has_site],
+        "speculated_chunks": np.bincount(sites[requests > 0], minlength=n_sites)[has_site],
+        "won_chunks": np.bincount(sites[wins > 0], minlength=n_sites)[has_site],
+        "speculated_requests": np.bincount(sites, weights=requests, minlength=n_sites).astype(np.int64)[has_site],
+        "won_requests": np.bincount(sites, weights=wins, minlength=n_sites).astype(np.int64)[has_site],
+    })
+
+def compare_passes(paths, primed=()):
+    """
+    Compare the reports of repeated passes over the same fileset (see xcache_test.py --warm-cache),
+    to separate cold reads from cache hits.
+
+    The read time of a file is the summed duration of its chunks, and is null in a pass where
+    any of its chunks failed. The speedup of pass i is the read time in the first pass divided
+    by the read time in pass i, per file.
+
+    Inputs:
+        paths: list of str
+            Reports of the passes, in the order that they were run
+        primed: collection of (dataset, file) tuples
+            Files read in a priming pass before the first pass, flagged in the per-file table
+
+    Returns (passes, files): a list with one dict of metrics per pass, and an arrow table with the
+    read time of each file in every pass and its speedup in every pass after the first.
+    """
+    passes = []
+    read_times = []
+    for i, path in enumerate(paths):
+        table, run_info = read_report(path, columns=["dataset", "file", "site", "start", "stop", "message", "duration", "received_bytes", "final"])
+        tables = aggregate(final_chunks(table))
+        total_time = run_info.get("TotalTime", None)
+        events = sum(tables["datasets"]["events"].to_pylist())
+        passes.append({
+            "pass": i,
+            "report": str(path),
+            "time": total_time,
+            "events": events,
+            "throughput": events/total_time if total_time else None,
+            "received_bytes": sum(tables["datasets"]["received_bytes"].to_pylist()),
+        })
+        files = tables["files"].to_pydict()
+        read_times.append({
+            (dset, fname): (read_time if n_failed == 0 else None)
+            for dset, fname, read_time, n_failed in zip(files["dataset"], files["file"], files["read_time"], files["failed_chunks"])
+        })
+
+    keys = list(read_times[0]) if read_times else []
+    rows = {"dataset": [dset for dset, _ in keys], "file": [fname for _, fname in keys]}
+    rows["primed"] = [key in primed for key in keys]
+    for i, times in enumerate(read_times):
+        rows[f"read_time_{i}"] = [times.get(key) for key in keys]
+    for i in range(1, len(read_times)):
+        speedups = [cold/warm if cold and warm else None for cold, warm in zip(rows["read_time_0"], rows[f"read_time_{i}"])]
+        rows[f"speedup_{i}"] = speedups
+        measured = [s for s in speedups if s is not None]
+        passes[i]["median_speedup"] = float(np.median(measured)) if measured else None
+        #Files that were read no faster than in the first pass: cache misses or evictions
+        passes[i]["not_faster_fraction"] = sum(s <= 1 for s in measured)/len(measured) if measured else None
+    return passes, pa.table(rows)
@@ -0,0 +1,90 @@
+import awkward as ak
+import numpy as np
+
+from .speculation import fallback_path
+
+# Retry passes for the chunks that failed. With allow_read_errors_with_report and skipbadfiles,
+# chunks that hit a transient error are dropped, so their events are lost and runs that failed
+# fast look faster. After the computation, the failed chunks (those whose report has a message)
+# are gathered into a fileset of their own, possibly on another server, and read again, and the
+# outputs and reports of the passes are merged. Every row of the merged report keeps the attempt
+# it comes from, so that first-try failures can be told from permanent ones (see
+# utils.reports.final_chunks).
+
+def failed_chunks(reports):
+    """
+    (file, object_path, start, stop) of the chunks that failed, per dataset.
+
+    Inputs:
+        reports: dict
+            Maps dataset name to its computed report
+    """
+    failed = {}
+    for dset, rep in reports.items():
+        if len(rep) == 0:
+            continue
+        mask = ak.to_numpy(~ak.is_none(rep.message))
+        #The call arguments are repr() strings
+        for fname, object_path, start, stop, *_ in ak.to_list(rep.args[mask]):
+            failed.setdefault(dset, []).append((fname.strip("'"), object_path.strip("'"), int(start), int(stop)))
+    return failed
+
+def retry_fileset(fileset, failed, xrd_base=None):
+    """
+    Run-ready fileset of the failed chunks: the datasets and files with failed chunks, with only
+    those chunks as steps.
+
+    Inputs:
+        fileset: dict
+            Run-ready fileset that was read (by the first pass, or the retry pass before)
+        failed: dict
+            Failed chunks per dataset, as returned by failed_chunks
+        xrd_base: str
+            Server to read the chunks from (see get_xrd_base in xcache_test.py), or None to read them
+            from the same server
+    """
+    out = {}
+    for dset, chunks in failed.items():
+        files = {}
+        for fname, _, start, stop in chunks:
+            path = (fallback_path(fname, xrd_base) if xrd_base else None) or fname
+            if path not in files:
+                files[path] = {**fileset[dset]["files"][fname], "steps": []}
+            files[path]["steps"].append([start, stop])
+        out[dset] = {**fileset[dset], "files": files}
+    return out
+
+def merge_outputs(first, retry):
+    """
+    Merge the computed outputs of two passes: dicts key by key, arrays with one entry per chunk
+    (the phase times, or the reads of the I/O-only mode) concatenated in the order of the reports,
+    and everything else (histograms and counts) added.
+    """
+    if isinstance(first, dict) and isinstance(retry, dict):
+        return {key: merge_outputs(first[key], retry[key]) if key in first and key in retry else first.get(key, retry.get(key))
+                for key in {**first, **retry}}
+    if isinstance(first, ak.Array):
+        return ak.concatenate([first, retry])
+    return first + retry
+
+def merge_reports(reports, attempts, retry_reports, attempt):
+    """
+    Append the reports of a retry pass to those of the passes before it. Returns the merged reports
+    and the attempt of every row of them, per dataset.
+
+    Inputs:
+        reports: dict
+            Maps dataset name to its merged report so far
+        attempts: dict
+            Maps dataset name to the attempt of every row of its report (None for the first pass)
+        retry_reports: dict
+            Maps dataset name to its report in the retry pass
+        attempt: int
+            Number of the retry pass (1 for the first one)
+    """
+    attempts = {dset: (attempts or {}).get(dset, np.zeros(len(rep), dtype=np.int64)) for dset, rep in reports.items()}
+    merged = dict(reports)
+    for dset, rep in retry_reports.items():
+        merged[dset] = ak.concatenate([reports[dset], rep]) if dset in reports else rep
+        attempts[dset] = np.concatenate([attempts.get(dset, np.zeros(0, dtype=np.int64)), np.full(len(rep), attempt, dtype=np.int64)])
+    return merged, attempts
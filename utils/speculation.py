@@ -0,0 +1,232 @@
+import asyncio
+import threading
+import time
+
+import fsspec
+import fsspec.asyn
+import fsspec.implementations.cached
+from distributed.diagnostics.task_stream import TaskStreamPlugin
+import numpy as np
+
+from .iostats import CountingSource
+from .reports import task_durations
+
+# Speculative re-reads of straggling chunks. A few chunks stuck on a slow server (e.g. a cache
+# disk filling from the origin, or a redirect to a far-away site) hold up the end of a run until
+# they finish or time out. SpeculationMonitor follows the durations of the chunk reads that have
+# completed, and hands a percentile of them to the workers as a threshold. Once a chunk read by
+# SpeculativeSource has been running for longer than that, any request of the chunk still
+# waiting for data (and every later one) is sent again to the same file on a fallback server,
+# and whichever server answers first is used. The number of requests sent again, and of those
+# the fallback won, are stored with the I/O counters of each chunk (see utils.iostats).
+
+# Seconds between checks of a pending request (worker side) and between updates of the
+# threshold (client side)
+POLL_SECONDS = 0.5
+UPDATE_SECONDS = 5.0
+
+# Threshold [s] of this worker process, set by SpeculationMonitor with set_threshold. No
+# request is sent again while it is None
+_threshold = None
+
+def set_threshold(threshold):
+    global _threshold
+    _threshold = threshold
+
+def fallback_path(file_path, fallback_base):
+    """
+    Path of a file on the fallback server: the server prefix (everything before /store) replaced
+    by fallback_base, as for the fileset. None if the path has no /store.
+    """
+    parts = file_path.split("/store")
+    if len(parts) != 2:
+        return None
+    return "/store".join([fallback_base, parts[-1]])
+
+async def _cat_ranges(fs, paths, starts, ends):
+    #Like uproot, caching filesystems and those without an async implementation run in a thread
+    if fs.async_impl and not isinstance(fs, fsspec.implementations.cached.CachingFileSystem):
+        return await fs._cat_ranges(paths=paths, starts=starts, ends=ends)
+    return await asyncio.to_thread(fs.cat_ranges, paths=paths, starts=starts, ends=ends)
+
+async def _cat_file(fs, path, start, end):
+    if fs.async_impl and not isinstance(fs, fsspec.implementations.cached.CachingFileSystem):
+        return await fs._cat_file(path, start=start, end=end)
+    return await asyncio.to_thread(fs.cat_file, path, start=start, end=end)
+
+class _RacingFileSystem:
+    """
+    Stands in for the fsspec filesystem of a SpeculativeSource. Reads go to the file on the
+    primary server, and are sent again to the fallback server if the chunk becomes a straggler
+    while they wait. Everything else is passed on to the primary filesystem.
+    """
+    def __init__(self, source, fs):
+        self._source = source
+        self._primary = fs
+        self._fallback = None
+        self._fallback_lock = asyncio.Lock()
+        self.async_impl = True
+
+    def __getattr__(self, name):
+        return getattr(self._primary, name)
+
+    async def _fallback_fs(self):
+        async with self._fallback_lock:
+            if self._fallback is None:
+                #Connecting may block, so it is kept off the event loop
+                self._fallback = await asyncio.to_thread(fsspec.core.url_to_fs, self._source._fallback_url,
+                                                         **self._source._fsspec_options)
+        return self._fallback
+
+    async def _race(self, read):
+        """
+        Result of read(fs, path) on the primary server, or on the fallback server if the chunk
+        became a straggler and the fallback answered first. If every read fails, the error of the
+        primary server is raised.
+        """
+        primary = asyncio.ensure_future(read(self._primary, self._source._file_path))
+        fallback = None
+        pending = {primary}
+        while True:
+            done, pending = await asyncio.wait(pending, timeout=POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is fallback:
+                        self._source._speculation_wins += 1
+                    return task.result()
+            if not pending:
+                return primary.result()
+            if fallback is None and self._source.straggling():
+                self._source._speculated_requests += 1
+                fallback = asyncio.ensure_future(self._read_fallback(read))
+                pending.add(fallback)
+
+    async def _read_fallback(self, read):
+        fs, path = await self._fallback_fs()
+        return await read(fs, path)
+
+    async def _cat_ranges(self, paths, starts, ends, **kwargs):
+        #uproot only ever asks for ranges of its own file
+        return await self._race(lambda fs, path: _cat_ranges(fs, [path]*len(paths), starts, ends))
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        return await self._race(lambda fs, path: _cat_file(fs, path, start, end))
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        return fsspec.asyn.sync(fsspec.asyn.get_loop(), self._cat_file, path, start=start, end=end)
+
+class SpeculativeSource(CountingSource):
+    """
+    utils.iostats.CountingSource whose requests are sent again to a fallback server once the
+    chunk has been read for longer than the threshold of this worker (see set_threshold). Pass
+    it as the "handler" uproot option, with the base of the fallback server (e.g.
+    "root://cmsxrootd.fnal.gov/") as the "speculation_fallback" uproot option.
+    """
+    def __init__(self, file_path, **options):
+        fallback_base = options.pop("speculation_fallback", None)
+        self._fallback_url = fallback_path(file_path, fallback_base) if fallback_base else None
+        super().__init__(file_path, **options)
+
+    def _open(self):
+        super()._open()
+        if self._fallback_url is not None and self._fallback_url != self._file_path_orig:
+            self._fs = _RacingFileSystem(self, self._fs)
+            self._async_impl = True
+
+    def straggling(self):
+        """
+        Whether this chunk has been read for longer than the threshold.
+        """
+        threshold = _threshold
+        return threshold is not None and time.monotonic() - self._t_open > threshold
+
+def _start_task_stream(dask_scheduler=None):
+    """
+    Start recording the task stream on the scheduler, if it is not recorded yet.
+    """
+    if TaskStreamPlugin.name not in dask_scheduler.plugins:
+        dask_scheduler.add_plugin(TaskStreamPlugin(dask_scheduler))
+
+def _completed_durations(prefixes, dask_scheduler=None):
+    """
+    Compute time of the completed tasks with the given prefixes, from the task stream of the
+    scheduler.
+    """
+    return task_durations(list(dask_scheduler.plugins[TaskStreamPlugin.name].buffer), prefixes).tolist()
+
+class SpeculationMonitor:
+    """
+    Sets the threshold of the workers to a percentile of the durations of the completed chunk
+    reads, in a background thread of the client, while the computation runs.
+
+    Inputs:
+        client: distributed.Client
+            Client whose workers read the chunks
+        prefixes: list of str
+            Task prefixes of the chunk reads, e.g. utils.prefetch.READ_PREFIX
+        percentile: float
+            Percentile of the completed reads that a chunk must exceed to be read again
+        min_chunks: int
+            Number of completed reads needed before anything is read again
+        min_seconds: float
+            Lower bound of the threshold, so that short chunks are not all read twice
+    """
+    def __init__(self, client, prefixes, percentile, min_chunks, min_seconds=0.0):
+        self.client = client
+        self.prefixes = list(prefixes)
+        self.percentile = percentile
+        self.min_chunks = min_chunks
+        self.min_seconds = min_seconds
+        self.threshold = None
+        #Exception that stopped the monitor thread, if any, as "<type>: <message>"
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="speculation", daemon=True)
+
+    def start(self):
+        #The reads that complete before the task stream is recorded would not be counted
+        self.client.run_on_scheduler(_start_task_stream)
+        self.client.run(set_threshold, None)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop updating the threshold (once the computation is done), and turn speculation off on
+        the workers. If the monitor failed during the run, this is reported again here, and the
+        error is kept in the summary.
+        """
+        self._stop.set()
+        self._thread.join()
+        self.client.run(set_threshold, None)
+        if self.error is not None:
+            print(f"Warning: the speculation threshold stopped being updated during the run ({self.error}), "
+                  f"so the last threshold ({self.threshold}) was used from then on")
+
+    def _run(self):
+        try:
+            while not self._stop.wait(UPDATE_SECONDS):
+                durations = self.client.run_on_scheduler(_completed_durations, self.prefixes)
+                if len(durations) < self.min_chunks:
+                    continue
+                threshold = max(float(np.percentile(durations, self.percentile)), self.min_seconds)
+                if threshold != self.threshold:
+                    self.client.run(set_threshold, threshold)
+                    self.threshold = threshold
+        except Exception as err:
+            #An exception would otherwise end the thread silently, with the run going on
+            self.error = f"{type(err).__name__}: {err}"
+            print(f"Speculation monitor failed, the threshold is no longer updated: {self.error}")
+
+    def summary(self):
+        """
+        Run-level speculation settings and the last threshold, stored in the report.
+        """
+        return {
+            "speculation_percentile": self.percentile,
+            "speculation_min_chunks": self.min_chunks,
+            "speculation_min_seconds": self.min_seconds,
+            "speculation_threshold": self.threshold,
+            "speculation_error": self.error,
+        }
@@ -0,0 +1,182 @@
+import gzip
+import json
+from pathlib import Path
+
+import awkward as ak
+import numpy as np
+import uproot
+
+from .branchsizes import SIZES_KEY, index_files
+
+# Synthetic NanoAOD-like files, to run the benchmark without CMS data or an XRootD server. The
+# files hold the branches used by TtbarAnalysis and the IO_BRANCHES of utils/config.py, with
+# multiplicities roughly those of ttbar events in NanoAOD. Values are random, and only the cuts
+# of the processor are made to pass for a fraction of the events.
+
+# Datasets written by default, with the metadata used by the processor
+DATASETS = {
+    "ttbar__nominal": {"process": "ttbar", "variation": "nominal", "xsec": 729.84},
+    "ttbar__scaledown": {"process": "ttbar", "variation": "scaledown", "xsec": 729.84},
+    "single_top_t_chan__nominal": {"process": "single_top_t_chan", "variation": "nominal", "xsec": 219.43},
+    "wjets__nominal": {"process": "wjets", "variation": "nominal", "xsec": 61457.0},
+}
+# Server prefix of the file paths in the fileset, which xcache_test.py replaces like any other
+ORIGIN = "root://synthetic.invalid/"
+
+def _kinematics(rng, pt_scale, eta_width):
+    return {
+        "pt": lambda k: (rng.exponential(pt_scale, k) + 15).astype(np.float32),
+        "eta": lambda k: rng.normal(0, eta_width, k).astype(np.float32),
+        "phi": lambda k: rng.uniform(-np.pi, np.pi, k).astype(np.float32),
+        "mass": lambda k: rng.exponential(5, k).astype(np.float32),
+    }
+
+def _local_index(counts):
+    """
+    Position of each object within its event, for flat arrays of objects.
+    """
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(counts.sum()) - starts
+
+def _collection(counts, fields):
+    k = int(counts.sum())
+    return ak.zip({name: ak.unflatten(make(k), counts) for name, make in fields.items()})
+
+def make_events(n_events, rng, io_branches=True, jets_per_event=7):
+    """
+    Branches of n_events synthetic events, as a dict that can be written with uproot's mktree.
+    Collections are records of jagged arrays, written as <collection>_<field> with an
+    n<collection> counter like in NanoAOD.
+
+    Inputs:
+        n_events: int
+            Number of events
+        rng: numpy.random.Generator
+            Source of the random values
+        io_branches: bool
+            Also write the (generator-level and weight) branches of IO_BRANCHES that the
+            processor does not use
+        jets_per_event: float
+            Mean number of jets per event
+    """
+    n_jets = rng.poisson(jets_per_event, n_events)
+    branches = {
+        "run": np.ones(n_events, np.uint32),
+        "luminosityBlock": np.ones(n_events, np.uint32),
+        "event": np.arange(n_events, dtype=np.uint64),
+        "Jet": _collection(n_jets, {
+            **_kinematics(rng, 40, 1.5),
+            "btagPNetB": lambda k: rng.beta(0.4, 2, k).astype(np.float32),
+            "btagCSVV2": lambda k: rng.uniform(0, 1, k).astype(np.float32),
+            "jetId": lambda k: rng.choice(np.array([2, 6], np.uint8), k, p=[0.1, 0.9]),
+            "qgl": lambda k: rng.uniform(0, 1, k).astype(np.float32),
+            "muonSubtrFactor": lambda k: rng.uniform(0.9, 1, k).astype(np.float32),
+            "puIdDisc": lambda k: rng.uniform(-1, 1, k).astype(np.float32),
+        }),
+        "Electron": _collection(rng.poisson(0.6, n_events), {
+            **_kinematics(rng, 30, 1.2),
+            "cutBased": lambda k: rng.choice(np.arange(5, dtype=np.uint8), k, p=[0.1, 0.1, 0.1, 0.2, 0.5]),
+            "sip3d": lambda k: rng.exponential(2, k).astype(np.float32),
+            "charge": lambda k: rng.choice(np.array([-1, 1], np.int32), k),
+        }),
+        "Muon": _collection(rng.poisson(0.6, n_events), {
+            **_kinematics(rng, 30, 1.2),
+            "tightId": lambda k: rng.uniform(0, 1, k) < 0.8,
+            "sip3d": lambda k: rng.exponential(2, k).astype(np.float32),
+            "pfRelIso04_all": lambda k: rng.exponential(0.1, k).astype(np.float32),
+            "charge": lambda k: rng.choice(np.array([-1, 1], np.int32), k),
+        }),
+    }
+    if not io_branches:
+        return branches
+
+    n_gen = rng.poisson(60, n_events)
+    #Mothers always come earlier in the event, the first particles have none
+    mothers = np.floor(rng.uniform(0, 1, int(n_gen.sum())) * _local_index(n_gen)).astype(np.int32)
+    mothers[_local_index(n_gen) == 0] = -1
+    gen_fields = {
+        **_kinematics(rng, 20, 2.5),
+        "pdgId": lambda k: rng.choice(np.array([1, 2, 5, 11, 13, 21, 22, 211, -211], np.int32), k),
+        "status": lambda k: rng.choice(np.array([1, 2, 23, 62], np.int32), k),
+        "statusFlags": lambda k: rng.integers(0, 1 << 15, k, dtype=np.int32),
+    }
+    branches.update({
+        "GenPart": ak.with_field(_collection(n_gen, gen_fields), ak.unflatten(mothers, n_gen), "genPartIdxMother"),
+        "GenJet": _collection(rng.poisson(9, n_events), _kinematics(rng, 35, 2.0)),
+        "LHEPart": _collection(np.full(n_events, 8), _kinematics(rng, 50, 2.0)),
+        "SoftActivityJet": _collection(np.full(n_events, 6), {
+            name: make for name, make in _kinematics(rng, 5, 2.0).items() if name != "mass"
+        }),
+        "CorrT1METJet": _collection(rng.poisson(5, n_events), {"phi": _kinematics(rng, 10, 2.0)["phi"]}),
+        "LHEPdfWeight": ak.unflatten(rng.normal(1, 0.02, 103*n_events).astype(np.float32), np.full(n_events, 103)),
+        "LHEScaleWeight": ak.unflatten(rng.normal(1, 0.1, 9*n_events).astype(np.float32), np.full(n_events, 9)),
+    })
+    return branches
+
+def write_file(path, n_events, seed, basket_entries=10000, io_branches=True, jets_per_event=7):
+    """
+    Write one synthetic file with an "Events" tree, basket_entries entries per basket.
+    Returns the uuid of the file.
+    """
+    rng = np.random.default_rng(seed)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with uproot.recreate(path) as file:
+        for start in range(0, n_events, basket_entries):
+            branches = make_events(min(basket_entries, n_events - start), rng, io_branches=io_branches,
+                                   jets_per_event=jets_per_event)
+            if start == 0:
+                file.mktree("Events", {
+                    name: (val.type.content if isinstance(val, ak.Array) else val.dtype) for name, val in branches.items()
+                })
+            branches["event"] += start
+            file["Events"].extend(branches)
+    with uproot.open(path) as file:
+        return str(file.file.uuid)
+
+def make_fileset(directory, datasets=None, files_per_dataset=2, events_per_file=50000, step_size=10000,
+                 basket_entries=10000, io_branches=True, seed=0):
+    """
+    Write synthetic files under <directory>/store/synthetic/<dataset>/ and the matching fileset,
+    in the .json.gz format of the benchmark filesets (with the branch-size index of the first file
+    of each dataset), to <directory>/fileset.json.gz. File paths
+    in the fileset start with ORIGIN, so that the directory (or a server in front of it) is used
+    as the XRootD base.
+
+    Inputs:
+        directory: str or Path
+            Where to write the files
+        datasets: dict
+            Dataset name to processor metadata ("process", "variation", "xsec"). Default DATASETS
+        files_per_dataset, events_per_file: int
+            Size of the fileset
+        step_size: int
+            Entries per chunk
+        basket_entries: int
+            Entries per basket in the files
+        io_branches: bool
+            Also write the IO_BRANCHES not used by the processor
+        seed: int
+            Seed of the random values, each file gets its own seed derived from it
+
+    Returns the path of the fileset.
+    """
+    directory = Path(directory)
+    fileset = {}
+    for i_dset, (dset, metadata) in enumerate((datasets or DATASETS).items()):
+        files = {}
+        for i_file in range(files_per_dataset):
+            store_path = f"/store/synthetic/{dset}/{i_file}.root"
+            uuid = write_file(f"{directory}{store_path}", events_per_file, seed=(seed, i_dset, i_file),
+                              basket_entries=basket_entries, io_branches=io_branches)
+            files[f"{ORIGIN}{store_path}"] = {
+                "object_path": "Events",
+                "steps": [[start, min(start + step_size, events_per_file)] for start in range(0, events_per_file, step_size)],
+                "num_entries": events_per_file,
+                "uuid": uuid,
+            }
+        fileset[dset] = {"files": files, "metadata": dict(metadata), "form": None,
+                         SIZES_KEY: index_files([(f"{directory}/store/synthetic/{dset}/0.root", "Events")])}
+    fileset_path = directory / "fileset.json.gz"
+    with gzip.open(fileset_path, "wt") as f:
+        json.dump(fileset, f)
+    return fileset_path
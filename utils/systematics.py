@@ -1,19 +1,16 @@
+import functools
+
 import awkward as ak
 import numpy as np
 import correctionlib.schemav2 as cs
 
-# functions creating systematic variations
-def jet_pt_resolution(pt,phi):
-    """
-    normal distribution with 5% variations, shape matches jets. Uses phi as a source
-    of entropy in correctionlib.
+from . import corrections
 
-    Inputs:
-        pt: Awkward array of floats
-            The pt of the jets to smear
-        phi: Awkward array of floats
-            The phis of the jets to smear. Just used as a source of entropy for
-            correctionlib
+@functools.cache
+def _resolution_correction():
+    """
+    Deterministic smearing value generator used by jet_pt_resolution, built once per process.
+    Tasks evaluate it from the correction cache of their worker.
     """
     res = cs.Correction(
         name="res",
@@ -30,8 +27,22 @@ def jet_pt_resolution(pt,phi):
             distribution="stdnormal",
         )
     )
+    return corrections.correction_model(res)["res"]
 
-    vals = res.to_evaluator().evaluate(pt,phi)
+# functions creating systematic variations
+def jet_pt_resolution(pt,phi):
+    """
+    normal distribution with 5% variations, shape matches jets. Uses phi as a source
+    of entropy in correctionlib.
+
+    Inputs:
+        pt: Awkward array of floats
+            The pt of the jets to smear
+        phi: Awkward array of floats
+            The phis of the jets to smear. Just used as a source of entropy for
+            correctionlib
+    """
+    vals = _resolution_correction().evaluate(pt,phi)
     #Make the standard deviation 0.05
     vals = 0.05 * vals
     #Make the mean 1
@@ -0,0 +1,294 @@
+import json
+
+from dask.utils import key_split
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Structured export of the dask task stream of a run, and timelines computed from it. The HTML
+# performance report shows the task stream, but cannot be analyzed. Every task that computed is
+# written with its start and stop times, its worker and thread, and, for the chunk reads, the
+# chunks that it read, to <report>_tasks.parquet next to the parquet report. From this, the
+# timelines separate the time that the workers took to arrive and start working (the batch system)
+# from the time spent reading (the server): concurrency and throughput over time, ramp-up of the
+# workers, idle gaps and the tail of the run after most chunks were read.
+
+# Suffix of the task-stream file of a report (<report>.parquet -> <report>_tasks.parquet)
+TASKS_SUFFIX = "_tasks.parquet"
+# Columns written for every task. Times are seconds since the epoch
+TASKS_SCHEMA = pa.schema([
+    ("key", pa.string()),
+    ("prefix", pa.dictionary(pa.int32(), pa.string())),
+    ("worker", pa.dictionary(pa.int32(), pa.string())),
+    ("thread", pa.int64()),
+    ("status", pa.dictionary(pa.int32(), pa.string())),
+    ("start", pa.float64()),
+    ("stop", pa.float64()),
+    # Time spent fetching the inputs of the task from other workers before it started
+    ("transfer_time", pa.float64()),
+    # Chunks of the chunk-read tasks, null for other tasks. The file and entry range are only given
+    # for tasks of one chunk (tasks of the I/O-only mode may read several, see utils.rechunk)
+    ("dataset", pa.dictionary(pa.int32(), pa.string())),
+    ("partition", pa.int64()),
+    ("chunks", pa.int64()),
+    ("file", pa.dictionary(pa.int32(), pa.string())),
+    ("entry_start", pa.int64()),
+    ("entry_stop", pa.int64()),
+    ("events", pa.int64()),
+])
+# Key in the parquet schema metadata holding the start and stop of the run and the read prefix
+TASKS_INFO_KEY = b"xcache_test.tasks_info"
+
+def tasks_path(report_path):
+    """
+    Task-stream file of a report, with or without the .parquet suffix.
+    """
+    return str(report_path).removesuffix(".parquet") + TASKS_SUFFIX
+
+def read_partitions(collections, prefix, tasks):
+    """
+    Map the names of the graph layers of the chunk reads (whose keys have the given prefix) to
+    their dataset and the chunks of each of their partitions.
+
+    Inputs:
+        collections: dict
+            Maps dataset name to a dask collection that depends on its reads, e.g. its report
+        prefix: str
+            Task prefix of the reads, e.g. utils.prefetch.READ_PREFIX
+        tasks: dict
+            Maps each dataset to the chunks of each of its partitions (see
+            utils.readpatterns.fileset_tasks)
+    """
+    return {layer: (name, tasks.get(name, [])) for name, coll in collections.items()
+            for layer in coll.dask.layers if key_split(layer) == prefix}
+
+def _chunk_columns(keys, partitions):
+    """
+    Dataset, partition and chunks of the tasks with the given keys, for those of the read layers.
+    """
+    columns = {name: [] for name in ["dataset", "partition", "chunks", "file", "entry_start", "entry_stop", "events"]}
+    for key in keys:
+        #Keys of partitions are (layer name, partition index)
+        dataset, layer_chunks = partitions.get(key[0], (None, [])) if isinstance(key, tuple) and len(key) == 2 else (None, [])
+        if dataset is None or not 0 <= key[1] < len(layer_chunks):
+            for column in columns.values():
+                column.append(None)
+            continue
+        chunks = layer_chunks[key[1]]
+        single = chunks[0] if len(chunks) == 1 else (None, None, None, None)
+        columns["dataset"].append(dataset)
+        columns["partition"].append(key[1])
+        columns["chunks"].append(len(chunks))
+        columns["file"].append(single[0])
+        columns["entry_start"].append(single[2])
+        columns["entry_stop"].append(single[3])
+        columns["events"].append(sum(stop - start for _, _, start, stop in chunks))
+    return columns
+
+def tasks_table(task_stream, partitions=None):
+    """
+    Convert a dask task stream into an arrow table following TASKS_SCHEMA, with one row per task
+    that computed.
+
+    Inputs:
+        task_stream: iterable of dict
+            Records of distributed.get_task_stream
+        partitions: dict
+            Maps the read layers to their dataset and the chunks of their partitions (see
+            read_partitions)
+    """
+    rows = {name: [] for name in ["key", "prefix", "worker", "thread", "status", "start", "stop", "transfer_time"]}
+    keys = []
+    for task in task_stream:
+        compute = [startstop for startstop in task["startstops"] if startstop["action"] == "compute"]
+        if not compute:
+            continue
+        keys.append(task["key"])
+        rows["key"].append(str(task["key"]))
+        rows["prefix"].append(key_split(task["key"]))
+        rows["worker"].append(task.get("worker"))
+        rows["thread"].append(task.get("thread"))
+        rows["status"].append(task.get("status"))
+        rows["start"].append(compute[0]["start"])
+        rows["stop"].append(compute[-1]["stop"])
+        rows["transfer_time"].append(sum(startstop["stop"] - startstop["start"] for startstop in task["startstops"]
+                                         if startstop["action"] == "transfer"))
+    rows.update(_chunk_columns(keys, partitions or {}))
+    columns = []
+    for field in TASKS_SCHEMA:
+        if pa.types.is_dictionary(field.type):
+            columns.append(pa.array(rows[field.name], pa.string()).dictionary_encode().cast(field.type))
+        else:
+            columns.append(pa.array(rows[field.name], field.type))
+    return pa.table(columns, schema=TASKS_SCHEMA)
+
+def write_tasks(task_stream, path, partitions=None, tasks_info=None):
+    """
+    Write the task stream of a run to a parquet file (see tasks_table).
+
+    Inputs:
+        task_stream: iterable of dict
+            Records of distributed.get_task_stream
+        path: str
+            Where to write the parquet file
+        partitions: dict
+            Read layers and the chunks of their partitions, as for tasks_table
+        tasks_info: dict
+            JSON-serializable information on the run (run_start, run_stop and read_prefix),
+            stored in the file metadata
+    """
+    table = tasks_table(task_stream, partitions)
+    table = table.replace_schema_metadata({TASKS_INFO_KEY: json.dumps(tasks_info or {})})
+    pq.write_table(table, path, use_dictionary=True, compression="zstd")
+
+def read_tasks(path):
+    """
+    Read a task-stream file as an arrow table, plus its information dict.
+    """
+    table = pq.read_table(path, memory_map=True)
+    tasks_info = json.loads((table.schema.metadata or {}).get(TASKS_INFO_KEY, b"{}"))
+    return table.unify_dictionaries().combine_chunks(), tasks_info
+
+def _times(table):
+    return table["start"].to_numpy(), table["stop"].to_numpy()
+
+def _read_tasks(table, prefix):
+    """
+    The rows of the chunk reads, or of every task if the prefix is not known.
+    """
+    if prefix is None:
+        return table
+    return table.filter(pc.equal(pc.cast(table["prefix"], pa.string()), prefix))
+
+def busy_time(starts, stops, times):
+    """
+    Task-seconds spent computing up to each of the given times, by the tasks running from starts
+    to stops. Its increase over an interval, divided by the interval, is the mean number of tasks
+    running in it.
+    """
+    starts, stops = np.sort(starts), np.sort(stops)
+    started = np.concatenate([[0.0], np.cumsum(starts)])
+    stopped = np.concatenate([[0.0], np.cumsum(stops)])
+    n_started = np.searchsorted(starts, times)
+    n_stopped = np.searchsorted(stops, times)
+    return (n_started*times - started[n_started]) - (n_stopped*times - stopped[n_stopped])
+
+def idle_gaps(starts, stops):
+    """
+    (start, duration) of the periods between the first start and the last stop during which none
+    of the given tasks was running.
+    """
+    if len(starts) == 0:
+        return np.empty(0), np.empty(0)
+    order = np.argsort(starts)
+    starts = starts[order]
+    #Latest stop of the tasks started so far
+    busy_until = np.maximum.accumulate(stops[order])
+    gaps = starts[1:] - busy_until[:-1]
+    idle = gaps > 0
+    return busy_until[:-1][idle], gaps[idle]
+
+def curves(table, tasks_info, interval=None, bins=100):
+    """
+    Timelines of a run, in bins of interval seconds (or bins bins) from the start of the run to the
+    last stop: the mean number of tasks and of chunk reads running, the number of workers that
+    had started a task, and the events of the chunk reads that completed per second.
+
+    Returns an arrow table with one row per bin, and times in seconds since the start of the run.
+    """
+    run_start = tasks_info.get("run_start") or (float(pc.min(table["start"]).as_py()) if len(table) else 0.0)
+    starts, stops = _times(table)
+    end = max(float(stops.max()) if len(stops) else run_start, tasks_info.get("run_stop") or run_start)
+    if interval is None:
+        interval = max((end - run_start)/bins, 1e-3)
+    #Times since the start of the run, since sums of epoch times lose precision
+    edges = np.arange(0, end - run_start + interval, interval)
+    if len(edges) < 2:
+        edges = np.array([0.0, interval])
+    starts, stops = starts - run_start, stops - run_start
+    reads = _read_tasks(table, tasks_info.get("read_prefix"))
+    read_starts, read_stops = _times(reads)
+    read_starts, read_stops = read_starts - run_start, read_stops - run_start
+    events = pc.fill_null(reads["events"], 0).to_numpy().astype(np.float64)
+    workers = pc.cast(table["worker"], pa.string()).to_numpy(zero_copy_only=False)
+    first_starts = np.sort([starts[workers == worker].min() for worker in np.unique(workers)])
+    return pa.table({
+        "time": edges[:-1],
+        "running_tasks": np.diff(busy_time(starts, stops, edges))/interval,
+        "running_reads": np.diff(busy_time(read_starts, read_stops, edges))/interval,
+        "active_workers": np.searchsorted(first_starts, edges[1:]),
+        "events_per_second": np.histogram(read_stops, edges, weights=events)[0]/interval,
+    })
+
+def timeline_stats(table, tasks_info, tail_fraction=0.95, min_gap=1.0):
+    """
+    Scalar timeline metrics of a run, with times in seconds since its start:
+
+    - ramp-up: when the first task, and the tasks of the first half and of all the workers that
+      ran tasks, started (a batch system that is slow to provide workers shows up here)
+    - idle gaps: periods of at least min_gap seconds during which a worker ran no task, after its
+      first task, and during which no worker ran any (summed worker-seconds, count and longest)
+    - tail: time from the completion of tail_fraction of the chunk reads to the last one (a few
+      slow chunks, or a slow server, show up here)
+    - peak and mean concurrency of the tasks, between the first start and the last stop
+
+    Inputs:
+        table: arrow table
+            Task stream as returned by read_tasks
+        tasks_info: dict
+            Information dict of the task-stream file
+        tail_fraction: float
+            Fraction of the chunk reads after which the tail starts
+        min_gap: float
+            Shortest idle period counted [s]
+    """
+    if len(table) == 0:
+        return {"tasks": 0}
+    starts, stops = _times(table)
+    run_start = tasks_info.get("run_start") or float(starts.min())
+    workers = pc.cast(table["worker"], pa.string()).to_numpy(zero_copy_only=False)
+    first_starts = []
+    worker_gaps = []
+    for worker in np.unique(workers):
+        mask = workers == worker
+        first_starts.append(starts[mask].min())
+        worker_gaps.append(idle_gaps(starts[mask], stops[mask])[1])
+    first_starts = np.sort(first_starts) - run_start
+    worker_gaps = np.concatenate(worker_gaps)
+    worker_gaps = worker_gaps[worker_gaps >= min_gap]
+    _, run_gaps = idle_gaps(starts, stops)
+    run_gaps = run_gaps[run_gaps >= min_gap]
+
+    #Concurrency: number of tasks running at each start or stop
+    times = np.concatenate([starts, stops])
+    changes = np.concatenate([np.ones(len(starts)), -np.ones(len(stops))])
+    order = np.lexsort((changes, times))
+    running = np.cumsum(changes[order])
+    span = float(stops.max() - starts.min())
+
+    stats = {
+        "tasks": len(table),
+        "workers": len(first_starts),
+        "first_task_start": float(first_starts[0]),
+        "half_workers_start": float(first_starts[(len(first_starts) - 1)//2]),
+        "all_workers_start": float(first_starts[-1]),
+        "worker_idle_time": float(worker_gaps.sum()),
+        "worker_idle_gaps": len(worker_gaps),
+        "longest_worker_idle_gap": float(worker_gaps.max()) if len(worker_gaps) else 0.0,
+        "run_idle_time": float(run_gaps.sum()),
+        "longest_run_idle_gap": float(run_gaps.max()) if len(run_gaps) else 0.0,
+        "peak_concurrency": int(running.max()),
+        "mean_concurrency": float((stops - starts).sum()/span) if span > 0 else None,
+        "read_tasks": 0,
+        "tail_start": None,
+        "tail_duration": None,
+    }
+    reads = _read_tasks(table, tasks_info.get("read_prefix"))
+    if len(reads):
+        read_stops = np.sort(reads["stop"].to_numpy())
+        tail_start = read_stops[max(int(np.ceil(tail_fraction*len(read_stops))) - 1, 0)]
+        stats["read_tasks"] = len(reads)
+        stats["tail_start"] = float(tail_start - run_start)
+        stats["tail_duration"] = float(read_stops[-1] - tail_start)
+    return stats
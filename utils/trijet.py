@@ -0,0 +1,87 @@
+import awkward as ak
+import dask_awkward as dak
+import numba
+import numpy as np
+
+# Reconstruction of the hadronic top candidate of the 4j2b region: the trijet with the largest pT
+# among those with at least one b-tagged jet. Building every 3-jet combination with
+# ak.combinations takes memory cubic in the number of jets, for one candidate per event. The
+# kernel below loops over the combinations without storing them and only returns the indices of
+# the three jets of the best one, whose four-momentum is then summed as before.
+
+@numba.njit(cache=True)
+def _best_trijet_kernel(offsets, x, y, btag, threshold, best):
+    """
+    For each event, local indices of the jets of the trijet with the largest pT, among those with
+    at least one jet with btag > threshold, or -1 if there is none. Combinations are visited in
+    the order of ak.combinations and the first one wins ties, like ak.argmax. The pT is computed
+    in the same precision and order of operations as the vector sum of coffea.
+    """
+    for i_event in range(len(offsets) - 1):
+        start = offsets[i_event]
+        n_jets = offsets[i_event + 1] - start
+        best[i_event, :] = -1
+        best_pt = x.dtype.type(0)
+        for i in range(n_jets):
+            for j in range(i + 1, n_jets):
+                for k in range(j + 1, n_jets):
+                    if not (btag[start + i] > threshold or btag[start + j] > threshold or btag[start + k] > threshold):
+                        continue
+                    px = x[start + i] + x[start + j] + x[start + k]
+                    py = y[start + i] + y[start + j] + y[start + k]
+                    pt = np.sqrt(px**2 + py**2)
+                    if best[i_event, 0] < 0 or pt > best_pt:
+                        best[i_event, 0] = i
+                        best[i_event, 1] = j
+                        best[i_event, 2] = k
+                        best_pt = pt
+
+def _best_trijet_indices(x, y, btag, threshold):
+    """
+    Indices of the jets of the best trijet, as a record of j1, j2, j3 with one (possibly None)
+    index per event, so that they can be used to index the jets like the result of
+    ak.argmax(..., keepdims=True). Also called by dask-awkward on typetracers, to find the type
+    of the output and the columns that are needed.
+    """
+    typetracer = ak.backend(x) == "typetracer"
+    if typetracer:
+        for array in (x, y, btag):
+            ak.typetracer.touch_data(array)
+        best = np.empty((0, 3), dtype=np.int64)
+    else:
+        counts = ak.to_numpy(ak.num(x, axis=1))
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        btag_flat = ak.to_numpy(ak.flatten(btag))
+        best = np.empty((len(counts), 3), dtype=np.int64)
+        #Compare in the precision of the b-tag values, like awkward does with a python float
+        _best_trijet_kernel(offsets, ak.to_numpy(ak.flatten(x)), ak.to_numpy(ak.flatten(y)),
+                            btag_flat, btag_flat.dtype.type(threshold), best)
+
+    ones = np.ones(len(best), dtype=np.int64)
+    index = ak.zip({
+        field: ak.unflatten(ak.mask(best[:, i], best[:, i] >= 0), ones) for i, field in enumerate(("j1", "j2", "j3"))
+    }, depth_limit=1)
+    if typetracer:
+        index = ak.Array(index.layout.to_typetracer(forget_length=True))
+    return index
+
+def top_trijet_mass(jets, btag_threshold):
+    """
+    Mass of the trijet with the largest pT among those with at least one b-tagged jet, for each
+    event. Same result as building all combinations with ak.combinations, filtering them and
+    taking the one with ak.argmax of the pT, with None for events without any candidate.
+
+    Inputs:
+        jets: (dask) awkward array of coffea jets
+            Jets of each event
+        btag_threshold: float
+            Minimum btagPNetB of a b-tagged jet
+    """
+    args = (jets.x, jets.y, jets.btagPNetB, btag_threshold)
+    if isinstance(jets, dak.Array):
+        best = dak.map_partitions(_best_trijet_indices, *args, label="best-trijet")
+    else:
+        best = _best_trijet_indices(*args)
+    p4 = jets[best.j1] + jets[best.j2] + jets[best.j3]
+    return ak.flatten(p4.mass)
@@ -1,21 +1,26 @@
+import argparse
 import awkward as ak
 from coffea import processor
 from coffea.analysis_tools import PackedSelection
 from coffea.dataset_tools import apply_to_fileset, max_files, max_chunks
 import dask
-from dask.distributed import Client, performance_report
+from dask.distributed import Client, get_task_stream, performance_report
 import datetime
+import functools
 import gzip
 import hist
 import hist.dask as hda
+import itertools
 import json
 from pathlib import Path
-import pickle
+import pyarrow.parquet as pq
+import random
 import time
 
-from test_processor import TtbarAnalysis
+from test_processor import CORRECTIONS_FILE, TtbarAnalysis, fileset_categories
 import utils # contains code for bookkeeping and cosmetics, as well as some boilerplate
 
+#.json.gz, or the binary format made by convert_fileset.py (.arrow)
 FILESET_LOC = "xcache_test_fileset_available.json.gz"
 N_FILES_MAX_PER_SAMPLE = utils.config["benchmarking"]["N_FILES_MAX_PER_SAMPLE"]
 N_CHUNKS_MAX_PER_FILE = utils.config["benchmarking"]["N_CHUNKS_MAX_PER_FILE"]
@@ -26,53 +31,116 @@ XRD_CHOICE = utils.config["benchmarking"]["XROOTD_CHOICE"]
 if utils.config["global"]["AF"] == "Wisconsin":
     import cowtools.jobqueue
 
-def get_client():
+def get_client(max_workers=MAX_WORKERS):
     if not utils.config["benchmarking"]["USE_HTC"]:
-        return Client()
-    if utils.config["global"]["AF"] == "Wisconsin":
+        client = Client()
+    elif utils.config["global"]["AF"] == "Wisconsin":
         client = cowtools.jobqueue.GetCondorClient(
-            max_workers=utils.config["benchmarking"]["MAX_WORKERS"],
+            max_workers=max_workers,
             memory="4 GB",
             disk="2 GB"
         )
-        return client
     else:
         raise ValueError(f"""
         No known way to create a distributed client for AF {utils.config['global']['AF']}.
         Please configure the client yourself, and include it in xcache_test.py.""")
+    #Every worker (including those added later) loads the corrections once, when it starts
+    client.register_plugin(utils.corrections.CorrectionCachePlugin([CORRECTIONS_FILE]))
+    return client
 
-def main():
-    #Store reports here
-    Path(f"reports/{XRD_CHOICE.replace('.','_')}").mkdir(parents=True, exist_ok=True)
-    if utils.config["benchmarking"]["USE_HTC"]:
-        htc_label = "HTC"
-    else:
-        htc_label = "local"
-        
+def start_live_metrics(client):
+    """
+    If LIVE_METRICS, stream the metrics of the runs of client to reports/live_<timestamp>.csv (or
+    .prom) while they compute, see utils.livemetrics.
+    """
+    if not utils.config["benchmarking"]["LIVE_METRICS"]:
+        return
+    fmt = utils.config["benchmarking"]["LIVE_METRICS_FORMAT"]
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    Path("reports").mkdir(exist_ok=True)
+    #Written by the scheduler, which runs on this machine
+    path = Path(f"reports/live_{timestamp}.{'prom' if fmt == 'prometheus' else fmt}").resolve()
+    client.register_plugin(utils.livemetrics.ChunkReportPlugin())
+    client.register_plugin(utils.livemetrics.LiveMetricsPlugin(str(path), fmt, utils.config["benchmarking"]["LIVE_METRICS_INTERVAL"]))
+    print(f"Streaming live metrics to {path}")
+
+def rescale_client(client, max_workers):
+    """
+    Scale the cluster behind client to max_workers, and wait (up to WORKER_WAIT_TIMEOUT seconds)
+    for the workers to arrive. Local clients are left as they are.
+    """
+    if not utils.config["benchmarking"]["USE_HTC"]:
+        return
+    client.cluster.scale(max_workers)
+    timeout = utils.config["sweep"]["WORKER_WAIT_TIMEOUT"]
+    if timeout:
+        try:
+            client.wait_for_workers(max_workers, timeout=timeout)
+        except TimeoutError:
+            print(f"Only {len(client.scheduler_info()['workers'])} of {max_workers} workers arrived within {timeout} seconds")
+
+def get_xrd_base(xrd_choice):
+    #A list of choices spreads the files over these servers (see utils.endpoints)
+    if isinstance(xrd_choice, (list, tuple)):
+        return utils.endpoints.Endpoints(
+            [get_xrd_base(choice) for choice in xrd_choice],
+            utils.config["benchmarking"]["ENDPOINT_STRATEGY"],
+            utils.config["benchmarking"]["ENDPOINT_WEIGHTS"],
+        )
+    #A URL (e.g. root://host:port/ or http://host:port) or local directory is used as is
+    if "://" in xrd_choice or xrd_choice.startswith("/"):
+        return xrd_choice
     ###################### Modify this if adding a new AF/set of XRootD options ######################
     if utils.config["global"]["AF"] == "Wisconsin":
-        if XRD_CHOICE == "cmsxrootd.fnal.gov":
+        if xrd_choice == "cmsxrootd.fnal.gov":
             xrd_base = f"root://cmsxrootd.fnal.gov/"
         else:
-            xrd_base = f"root://cms{XRD_CHOICE}.hep.wisc.edu/"
+            xrd_base = f"root://cms{xrd_choice}.hep.wisc.edu/"
     ##################################################################################################
-    
-    #Prepare fileset
+    return xrd_base
+
+def xrd_bases(xrd_choice):
+    """
+    XRootD bases of a server choice: one, or one per server of a list.
+    """
+    xrd_base = get_xrd_base(xrd_choice)
+    return xrd_base.bases if isinstance(xrd_base, utils.endpoints.Endpoints) else [xrd_base]
+
+def single_xrd_base(xrd_choice, option):
+    """
+    XRootD base of a server choice that must be a single server (config option, for the error).
+    """
+    if isinstance(xrd_choice, (list, tuple)):
+        raise ValueError(f"{option} must be a single server, not a list ({xrd_choice})")
+    return get_xrd_base(xrd_choice)
+
+def server_name(xrd_choice):
+    """
+    Name of a server choice for the reports: the choice itself, or the choices joined with '+'
+    for several servers.
+    """
+    return "+".join(xrd_choice) if isinstance(xrd_choice, (list, tuple)) else xrd_choice
+
+@functools.cache
+def load_fileset():
     print(f"Applying to signal fileset {FILESET_LOC}")
     with gzip.open(FILESET_LOC, "rt") as file:
-        fileset_full = json.load(file)
+        return json.load(file)
+
+def prepare_fileset(fileset_full, xrd_base, n_files, n_chunks):
     #Only do at most first # files
-    if N_FILES_MAX_PER_SAMPLE:
-        fileset_maxfiles = max_files(fileset_full,N_FILES_MAX_PER_SAMPLE)
+    if n_files:
+        fileset_maxfiles = max_files(fileset_full,n_files)
     else:
         fileset_maxfiles = fileset_full
     #Only do at most first # chunks of each file
-    if N_CHUNKS_MAX_PER_FILE:
-        fileset_maxchunks = max_chunks(fileset_maxfiles,N_CHUNKS_MAX_PER_FILE)
+    if n_chunks:
+        fileset_maxchunks = max_chunks(fileset_maxfiles,n_chunks)
     else:
         fileset_maxchunks = fileset_maxfiles
-    #Change filepaths to use chosen XRootD server
+    #Change filepaths to use chosen XRootD server, or one of the chosen servers for each file
     fileset_ready = {}
+    i_file = 0
     for dset in fileset_maxchunks:
         dataset_ready = {}
         for key, val in fileset_maxchunks[dset].items():
@@ -84,37 +152,488 @@ def main():
                     fparts = fkey.split('/store')
                     if len(fparts) != 2:
                         raise ValueError(f"Filepath {fkey} in dataset {dset} does not fit pattern (splittable on '/store'")
-                    xfname = '/store'.join([xrd_base,fparts[-1]])
+                    if isinstance(xrd_base, utils.endpoints.Endpoints):
+                        file_base = xrd_base.base(i_file, '/store'+fparts[-1])
+                    else:
+                        file_base = xrd_base
+                    xfname = '/store'.join([file_base,fparts[-1]])
                     files_info[xfname] = fval
+                    i_file += 1
                 dataset_ready[key] = files_info
         fileset_ready[dset] = dataset_ready
-    
-    client = get_client()
+    return fileset_ready
+
+def rechunk_fileset(fileset_ready):
+    """
+    Rebalance the steps of a run-ready fileset toward RECHUNK_TARGET events or bytes per task
+    (see utils.rechunk), and print the task sizes before and after.
+    """
+    by = utils.config["benchmarking"]["RECHUNK_BY"]
+    target = utils.config["benchmarking"]["RECHUNK_TARGET"]
+    before = utils.rechunk.size_stats(utils.rechunk.task_sizes(fileset_ready, by))
+    fileset_ready = utils.rechunk.rechunk(fileset_ready, target, by=by, timeout=utils.config["benchmarking"]["TIMEOUT"])
+    after = utils.rechunk.size_stats(utils.rechunk.task_sizes(fileset_ready, by))
+    for label, stats in [("Before", before), ("After", after)]:
+        if stats["tasks"]:
+            print(f"{label} re-chunking to {target:g} {by} per task: {stats['tasks']} tasks of "
+                  f"{stats['mean']:.4g} +- {stats['std']:.4g} {by} (largest {stats['max']:.4g})")
+    return fileset_ready
+
+def get_fileset(xrd_choice, n_files, n_chunks, rebuild=False):
+    """
+    Run-ready fileset for this server and these limits. Prepared filesets are cached on disk,
+    keyed by the checksum of FILESET_LOC, the XRootD base and the limits. If rebuild, the
+    fileset is prepared again and the cache is overwritten.
+    Binary filesets (see utils.filesets) are not cached, since they are read lazily with the
+    server and limits applied as each dataset is loaded.
+    With RECHUNK, the steps are then rebalanced (see rechunk_fileset), which loads binary filesets.
+    Returns (fileset, seconds taken).
+    """
+    t0 = time.monotonic()
+    xrd_base = get_xrd_base(xrd_choice)
+    rechunk = utils.config["benchmarking"]["RECHUNK"]
+    if utils.filesets.is_binary(FILESET_LOC):
+        print(f"Applying to signal fileset {FILESET_LOC}")
+        fileset_ready = utils.filesets.BinaryFileset(FILESET_LOC, xrd_base, n_files, n_chunks)
+        if rechunk:
+            fileset_ready = rechunk_fileset(fileset_ready)
+        prep_time = time.monotonic() - t0
+        print(f"Opened binary fileset in {prep_time:.2f} seconds")
+        return fileset_ready, prep_time
+    key = utils.filesets.cache_key(
+        fileset=utils.filesets.file_checksum(FILESET_LOC),
+        xrd_base=xrd_base.info() if isinstance(xrd_base, utils.endpoints.Endpoints) else xrd_base,
+        max_files=n_files,
+        max_chunks=n_chunks,
+        **({"rechunk": [utils.config["benchmarking"]["RECHUNK_BY"], utils.config["benchmarking"]["RECHUNK_TARGET"]]} if rechunk else {}),
+    )
+    fileset_ready = None if rebuild else utils.filesets.load_cached(key)
+    if fileset_ready is None:
+        fileset_ready = prepare_fileset(load_fileset(), xrd_base, n_files, n_chunks)
+        if rechunk:
+            fileset_ready = rechunk_fileset(fileset_ready)
+        utils.filesets.store_cached(key, fileset_ready)
+        how = "Prepared"
+    else:
+        how = "Loaded cached"
+    prep_time = time.monotonic() - t0
+    print(f"{how} fileset {key[:12]} in {prep_time:.2f} seconds")
+    return fileset_ready, prep_time
 
+def build_graph(fileset_ready, categories, io_pattern, io_branches, uproot_options, task_target):
+    """
+    Lazy outputs and reports of the benchmark on a fileset: the analysis, with histograms of the
+    given (processes, variations), or the reads of the I/O-only mode with the given pattern and
+    branches.
+    """
+    if io_pattern is None:
+        return apply_to_fileset(TtbarAnalysis(*categories),fileset_ready,uproot_options=uproot_options)
+    #Only read the IO branches, in the chosen pattern
+    return utils.readpatterns.read_fileset(
+        fileset_ready,
+        io_branches,
+        io_pattern,
+        utils.config["benchmarking"]["IO_SPARSE_FRACTION"],
+        uproot_options=uproot_options,
+        task_target=task_target,
+        task_by=utils.config["benchmarking"]["RECHUNK_BY"],
+    )
+
+def report_name(xrd_choice, max_workers, n_files, n_chunks):
+    """
+    Path (without suffix) of the reports of a run, in a directory for the server that is created
+    if needed. Returns (path, "HTC" or "local", timestamp).
+    """
+    #Store reports here
+    Path(f"reports/{utils.reports.server_label(server_name(xrd_choice))}").mkdir(parents=True, exist_ok=True)
+    if utils.config["benchmarking"]["USE_HTC"]:
+        htc_label = "HTC"
+    else:
+        htc_label = "local"
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    rep_fname = f"reports/{XRD_CHOICE.replace('.','_')}/{htc_label}_{MAX_WORKERS}_{N_FILES_MAX_PER_SAMPLE}_{N_CHUNKS_MAX_PER_FILE}"
-    with client, performance_report(filename=f"{rep_fname}.html"):
+    rep_fname = f"reports/{utils.reports.server_label(server_name(xrd_choice))}/{htc_label}_{max_workers}_{n_files}_{n_chunks}_{timestamp}"
+    return rep_fname, htc_label, timestamp
+
+def speculation_fallback(xrd_choice):
+    """
+    XRootD base of the fallback server of speculative reads, or None if SPECULATION is off or the
+    fallback is one of the servers under test.
+    """
+    if not utils.config["benchmarking"]["SPECULATION"]:
+        return None
+    fallback = single_xrd_base(utils.config["benchmarking"]["SPECULATION_FALLBACK"], "SPECULATION_FALLBACK")
+    #Speculating against a server under test would only read its stragglers twice
+    if fallback in xrd_bases(xrd_choice):
+        print("Not speculating, since the fallback server is a server under test")
+        return None
+    return fallback
+
+def task_partitions(reports, fileset_ready, read_prefix, task_target):
+    """
+    Chunks read by each read task of a graph, for the task stream (see utils.timeline.read_partitions).
+    """
+    return utils.timeline.read_partitions(reports, read_prefix, utils.readpatterns.fileset_tasks(
+        fileset_ready, task_target, utils.config["benchmarking"]["RECHUNK_BY"]))
+
+def start_prefetch(client, fileset_ready, branches, read_prefix):
+    """
+    Start staging the branches of the upcoming chunks while the computation runs, if PREFETCH.
+    Returns the running Prefetcher, or None.
+    """
+    if not utils.config["benchmarking"]["PREFETCH"]:
+        return None
+    prefetcher = utils.prefetch.Prefetcher(
+        client,
+        fileset_ready,
+        branches,
+        utils.config["benchmarking"]["PREFETCH_LOOKAHEAD"],
+        utils.config["benchmarking"]["PREFETCH_CONCURRENCY"],
+        timeout=utils.config["benchmarking"]["TIMEOUT"],
+        read_prefix=read_prefix,
+    )
+    print(f"Staging branches {', '.join(prefetcher.branches)} ahead of the computation")
+    prefetcher.start()
+    return prefetcher
+
+def start_speculation(client, fallback, read_prefix):
+    """
+    Start following the durations of the chunk reads, to read the straggling ones from the fallback
+    server too, unless fallback is None. Returns the running SpeculationMonitor, or None.
+    """
+    if fallback is None:
+        return None
+    monitor = utils.speculation.SpeculationMonitor(
+        client,
+        [read_prefix],
+        utils.config["benchmarking"]["SPECULATION_PERCENTILE"],
+        utils.config["benchmarking"]["SPECULATION_MIN_CHUNKS"],
+        utils.config["benchmarking"]["SPECULATION_MIN_SECONDS"],
+    )
+    print(f"Reading straggling chunks from {fallback} too")
+    monitor.start()
+    return monitor
+
+def retry_failed(fileset_ready, coutputs, creports, build, partitions, read_prefix, task_target, retry_base):
+    """
+    Read the chunks that failed again, in up to RETRY_PASSES passes with exponential backoff, and
+    merge the outputs and reports of the passes. The partitions of the retry graphs are added to
+    partitions.
+    Returns (outputs, reports, attempt of every report row per dataset or None, run info of the
+    retries). The backoff is not part of retry_time, and is stored as retry_backoff_time.
+
+    Inputs:
+        build: callable
+            Builds the lazy (outputs, reports) of a fileset, see build_graph. The histograms of the
+            retry passes need the categories of the first one, to be merged
+        retry_base: str or None
+            Server to read the failed chunks from, or None for the server under test
+    """
+    t0 = time.monotonic()
+    attempts = None
+    retry_info = {"retry_xrd_base": retry_base, "retry_chunks": [], "retry_recovered": [], "retry_backoff_time": 0.0}
+    fileset_retry, pass_reports = fileset_ready, creports
+    for attempt in range(1, utils.config["benchmarking"]["RETRY_PASSES"] + 1):
+        failed = utils.retry.failed_chunks(pass_reports)
+        if not failed:
+            break
+        n_failed = sum(len(chunks) for chunks in failed.values())
+        #Transient errors often last a while, so each pass waits longer
+        backoff = utils.config["benchmarking"]["RETRY_BACKOFF"]*2**(attempt - 1)
+        print(f"Retrying {n_failed} failed chunks in {backoff:g} seconds"
+              + (f" from {retry_base}" if retry_base is not None else "") + f" (pass {attempt})")
+        #The clock is stopped while waiting, so that the backoff does not count in the run time
+        t_sleep = time.monotonic()
+        time.sleep(backoff)
+        retry_info["retry_backoff_time"] += time.monotonic() - t_sleep
+        fileset_retry = utils.retry.retry_fileset(fileset_retry, failed, retry_base)
+        try:
+            outputs, reports = build(fileset_retry)
+        except OSError as err:
+            #The first file of each dataset is opened to build the graph
+            print(f"Not retrying, since the failed chunks could not be opened: {type(err).__name__}: {err}")
+            break
+        partitions.update(task_partitions(reports, fileset_retry, read_prefix, task_target))
+        routputs, pass_reports = dask.compute(outputs, reports)
+        coutputs = utils.retry.merge_outputs(coutputs, routputs)
+        creports, attempts = utils.retry.merge_reports(creports, attempts, pass_reports, attempt)
+        n_recovered = n_failed - sum(len(chunks) for chunks in utils.retry.failed_chunks(pass_reports).values())
+        print(f"Recovered {n_recovered} of the {n_failed} chunks")
+        retry_info["retry_chunks"].append(n_failed)
+        retry_info["retry_recovered"].append(n_recovered)
+    retry_info["retry_time"] = time.monotonic() - t0 - retry_info["retry_backoff_time"]
+    return coutputs, creports, attempts, retry_info
+
+def speculation_summary(monitor, fallback, creports):
+    """
+    Run info of the speculative reads: the settings, and the chunks read from the fallback server
+    too, and those it answered first for.
+    """
+    speculation_info = {
+        **monitor.summary(),
+        "speculation_fallback": fallback,
+        "speculation_chunks": sum(int(ak.sum(rep.performance_counters.speculated_requests > 0)) for rep in creports.values()),
+        "speculation_wins": sum(int(ak.sum(rep.performance_counters.speculation_wins > 0)) for rep in creports.values()),
+    }
+    print(f"Speculation: {speculation_info['speculation_chunks']} chunks read from the fallback server too, "
+          f"which answered first for {speculation_info['speculation_wins']} of them")
+    return speculation_info
+
+def io_summary(fileset_ready, io_pattern, io_branches, coutputs, creports):
+    """
+    Run info of the I/O-only mode: the requests and entries read, and the bytes read against
+    IO_FILE_PERCENT of the files, per dataset and in total.
+    """
+    io_info = {
+        "io_read_pattern": io_pattern,
+        "io_requests": sum(int(ak.sum(out["io_reads"].num_requests)) for out in coutputs.values()),
+        "io_entries_read": sum(int(ak.sum(out["io_reads"].entries_read)) for out in coutputs.values()),
+    }
+    print(f"Read pattern {io_pattern}: {io_info['io_requests']} requests for {io_info['io_entries_read']} entries")
+    io_fraction = float(utils.config["benchmarking"]["IO_FILE_PERCENT"])/100
+    targets = utils.branchsizes.byte_targets(
+        fileset_ready,
+        io_branches,
+        {dset: int(ak.sum(out["io_reads"].entries_read)) for dset, out in coutputs.items()},
+        {dset: int(ak.sum(rep.performance_counters.num_received_bytes)) for dset, rep in creports.items()},
+        io_fraction,
+    )
+    io_info["io_datasets"] = {dset: {"branches": io_branches[dset], **target} for dset, target in targets.items()}
+    io_info["io_target_fraction"] = io_fraction
+    io_info["io_bytes_read"] = sum(target["bytes_read"] for target in targets.values())
+    if all(target["target_bytes"] is not None for target in targets.values()):
+        io_info["io_target_bytes"] = sum(target["target_bytes"] for target in targets.values())
+        print(f"Read {io_info['io_bytes_read']/1e6:.1f} MB for a target of {io_info['io_target_bytes']/1e6:.1f} MB "
+              f"({100*io_fraction:g}% of the files)")
+    return io_info
+
+def run_point(client, fileset_ready, xrd_choice, max_workers, n_files, n_chunks, extra_info=None):
+    """
+    Run the benchmark once on an existing client and write its HTML and parquet reports.
+    Returns the report path, without suffix.
+    """
+    rep_fname, htc_label, timestamp = report_name(xrd_choice, max_workers, n_files, n_chunks)
+    io_pattern = utils.config["benchmarking"]["IO_READ_PATTERN"] if utils.config["benchmarking"]["DISABLE_PROCESSING"] else None
+    io_branches = utils.branchsizes.io_branches(fileset_ready) if io_pattern is not None else None
+    read_prefix = utils.prefetch.READ_PREFIX if io_pattern is None else f"io-{io_pattern}"
+    fallback = speculation_fallback(xrd_choice)
+    #Checked before the run, rather than once it has failed chunks
+    retry_choice = utils.config["benchmarking"]["RETRY_XROOTD_CHOICE"]
+    retry_base = single_xrd_base(retry_choice, "RETRY_XROOTD_CHOICE") if retry_choice is not None else None
+    client.run(utils.corrections.reset_stats)
+    #Live metrics are counted from here
+    client.log_event(utils.livemetrics.RUN_TOPIC, rep_fname)
+    with performance_report(filename=f"{rep_fname}.html"), get_task_stream(client) as task_stream:
         print("Starting clock")
         t0 = time.monotonic()
+        run_start = time.time()
         #Run across the fileset (if set up correctly, a lazy dask operation)
-        outputs, reports = apply_to_fileset(TtbarAnalysis(),fileset_ready,uproot_options={"allow_read_errors_with_report": True, "skipbadfiles": True, "timeout": utils.config["benchmarking"]["TIMEOUT"]})
+        uproot_options = {"allow_read_errors_with_report": True, "skipbadfiles": True, "timeout": utils.config["benchmarking"]["TIMEOUT"], "handler": utils.iostats.CountingSource}
+        if fallback is not None:
+            uproot_options["handler"] = utils.speculation.SpeculativeSource
+            uproot_options["speculation_fallback"] = fallback
+        #Small files are grouped into multi-file tasks too in the I/O-only mode
+        task_target = utils.config["benchmarking"]["RECHUNK_TARGET"] if utils.config["benchmarking"]["RECHUNK"] and io_pattern is not None else None
+        #The same categories for every pass, so that the histograms of retry passes can be merged
+        build = functools.partial(build_graph, categories=fileset_categories(fileset_ready), io_pattern=io_pattern,
+                                  io_branches=io_branches, uproot_options=uproot_options, task_target=task_target)
+        outputs, reports = build(fileset_ready)
+        #Chunks read by each task, for the task stream
+        partitions = task_partitions(reports, fileset_ready, read_prefix, task_target)
+        #Optionally stage upcoming chunks, and read straggling chunks from the fallback server too, while computing
+        prefetcher = start_prefetch(client, fileset_ready, utils.prefetch.needed_branches(outputs, reports) if io_pattern is None
+                                    else sorted(set().union(*io_branches.values())), read_prefix)
+        monitor = start_speculation(client, fallback, read_prefix)
         #Actually compute the outputs
         print('About to compute signal outputs')
         coutputs, creports = dask.compute(outputs,reports)
         print('Finished computing signal outputs')
+        if prefetcher is not None:
+            prefetcher.stop()
+        if monitor is not None:
+            monitor.stop()
+        first_pass_time = time.monotonic() - t0
+        #Optionally read the chunks that failed again, and merge the passes
+        attempts = None
+        retry_info = {}
+        if utils.config["benchmarking"]["RETRY_FAILED"]:
+            coutputs, creports, attempts, retry_info = retry_failed(
+                fileset_ready, coutputs, creports, build, partitions, read_prefix, task_target, retry_base)
+            retry_info["first_pass_time"] = first_pass_time
 
-    exec_time = time.monotonic() - t0
-
-    if utils.config["benchmarking"]["USE_HTC"]:
-        client.shutdown()
-    
+    exec_time = time.monotonic() - t0 - retry_info.get("retry_backoff_time", 0.0)
+    run_stop = time.time()
     print(f"\nexecution took {exec_time:.2f} seconds")
-    creports["TotalTime"] = exec_time
+    if retry_info.get("retry_chunks"):
+        print(f"of which {retry_info['retry_time']:.2f} seconds retrying failed chunks, {sum(retry_info['retry_recovered'])} "
+              f"of {retry_info['retry_chunks'][0]} recovered (not counting {retry_info['retry_backoff_time']:.2f} seconds of backoff)")
+    #Spread of the durations of the tasks that read (and process) the chunks, to see the straggler tail
+    task_durations = utils.reports.task_duration_stats(task_stream.data, [read_prefix])
+    if task_durations["tasks"]:
+        print(f"Read tasks: {task_durations['tasks']}, {task_durations['mean']:.2f} +- {task_durations['std']:.2f} seconds "
+              f"(p99 {task_durations['p99']:.2f}, longest {task_durations['max']:.2f})")
+    cache_stats = utils.corrections.worker_stats(client)
+    print(f"Correction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+          f"{cache_stats['load_time']:.3f} seconds loading, {cache_stats['time_saved']:.3f} seconds saved")
+
+    xrd_base = get_xrd_base(xrd_choice)
+    run_info = {
+        "TotalTime": exec_time,
+        "server": server_name(xrd_choice),
+        "xrd_base": str(xrd_base),
+        **(xrd_base.info() if isinstance(xrd_base, utils.endpoints.Endpoints) else {}),
+        "htc_label": htc_label,
+        "max_workers": max_workers,
+        "max_files": n_files,
+        "max_chunks": n_chunks,
+        "timestamp": timestamp,
+        **{f"correction_cache_{key}": val for key, val in cache_stats.items()},
+        **(io_summary(fileset_ready, io_pattern, io_branches, coutputs, creports) if io_pattern is not None else {}),
+        "rechunk_by": utils.config["benchmarking"]["RECHUNK_BY"] if utils.config["benchmarking"]["RECHUNK"] else None,
+        "rechunk_target": utils.config["benchmarking"]["RECHUNK_TARGET"] if utils.config["benchmarking"]["RECHUNK"] else None,
+        **{f"task_duration_{key}": val for key, val in task_durations.items()},
+        **(prefetcher.summary() if prefetcher is not None else {}),
+        **(speculation_summary(monitor, fallback, creports) if monitor is not None else {}),
+        **retry_info,
+        **(extra_info or {}),
+    }
+    phase_times = {dset: out["phase_times"] for dset, out in coutputs.items() if "phase_times" in out}
+    utils.reports.write_report(creports, f"{rep_fname}.parquet", run_info=run_info, phase_times=phase_times,
+                               staged=prefetcher.staged if prefetcher is not None else None, attempts=attempts)
+
+    #The task stream, with the chunks read by each task, for the timelines of parse_reports.py
+    utils.timeline.write_tasks(
+        task_stream.data,
+        utils.timeline.tasks_path(rep_fname),
+        partitions=partitions,
+        tasks_info={"run_start": run_start, "run_stop": run_stop, "read_prefix": read_prefix, "max_workers": max_workers},
+    )
 
-    with open(f"{rep_fname}.pkl", "wb") as f:
-        pickle.dump(creports,f)
+    print(f"Wrote HTML and parquet reports to {rep_fname} (.html and .parquet, respectively)")
+    print(f"Wrote the task stream to {utils.timeline.tasks_path(rep_fname)}")
+    return rep_fname
 
-    print(f"Wrote HTML and pkl reports to {rep_fname} (.html and .pkl, respectively)")
+def sweep(rebuild_fileset=False):
+    """
+    Run every combination of the parameters in the "sweep" section of utils/config.py, REPEATS
+    times each, in random order against a single client that is rescaled between points.
+    """
+    sweep_config = utils.config["sweep"]
+    points = list(itertools.product(
+        sweep_config["XROOTD_CHOICE"],
+        sweep_config["MAX_WORKERS"],
+        sweep_config["N_FILES_MAX_PER_SAMPLE"],
+        sweep_config["N_CHUNKS_MAX_PER_FILE"],
+    )) * sweep_config["REPEATS"]
+    #Randomize the order, so that time-of-day effects do not line up with any parameter
+    random.Random(sweep_config["SEED"]).shuffle(points)
+    print(f"Sweeping over {len(points)} runs")
+
+    prepared = {}
+    sweep_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    manifest = []
+    client = get_client(max(sweep_config["MAX_WORKERS"]))
+    with client:
+        start_live_metrics(client)
+        for i, (xrd_choice, max_workers, n_files, n_chunks) in enumerate(points):
+            print(f"\nSweep point {i+1}/{len(points)}: {server_name(xrd_choice)}, {max_workers} workers, {n_files} files, {n_chunks} chunks")
+            key = (server_name(xrd_choice), n_files, n_chunks)
+            if key not in prepared:
+                prepared[key] = get_fileset(xrd_choice, n_files, n_chunks, rebuild=rebuild_fileset)
+            fileset_ready, prep_time = prepared[key]
+            rescale_client(client, max_workers)
+            rep_fname = run_point(client, fileset_ready, xrd_choice, max_workers, n_files, n_chunks,
+                                  extra_info={"sweep_id": sweep_id, "sweep_index": i, "fileset_prep_time": prep_time})
+            manifest.append({"index": i, "server": server_name(xrd_choice), "max_workers": max_workers,
+                             "max_files": n_files, "max_chunks": n_chunks, "report": f"{rep_fname}.parquet"})
+        if utils.config["benchmarking"]["USE_HTC"]:
+            client.shutdown()
+
+    with open(f"reports/sweep_{sweep_id}.json", "w") as f:
+        json.dump(manifest, f, indent=1)
+    print(f"\nWrote the list of sweep reports to reports/sweep_{sweep_id}.json")
+
+def prime_subset(fileset, fraction, seed=None):
+    """
+    Fileset with a random fraction of the files of each dataset (at least one file per dataset).
+    """
+    rng = random.Random(seed)
+    subset = {}
+    for dset, dataset in fileset.items():
+        fnames = list(dataset["files"])
+        chosen = set(rng.sample(fnames, max(1, round(fraction*len(fnames)))))
+        subset[dset] = {**dataset, "files": {fname: finfo for fname, finfo in dataset["files"].items() if fname in chosen}}
+    return subset
+
+def warm_cache(rebuild_fileset=False):
+    """
+    Run the same fileset PASSES times in a row on one client, optionally after a priming pass over
+    a fraction of the files, and compare the passes file by file (see the "warm_cache" section of
+    utils/config.py). The first pass reads cold (or partially primed) files, later passes should
+    hit the cache.
+    """
+    cache_config = utils.config["warm_cache"]
+    fileset_ready, prep_time = get_fileset(XRD_CHOICE, N_FILES_MAX_PER_SAMPLE, N_CHUNKS_MAX_PER_FILE, rebuild=rebuild_fileset)
+    warm_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    extra_info = {"warm_cache_id": warm_id, "fileset_prep_time": prep_time}
+
+    client = get_client()
+    with client:
+        start_live_metrics(client)
+        primed = {}
+        if cache_config["PRIME_FRACTION"]:
+            primed = prime_subset(fileset_ready, cache_config["PRIME_FRACTION"], cache_config["SEED"])
+            print(f"\nPriming pass over {sum(len(d['files']) for d in primed.values())} files")
+            run_point(client, primed, XRD_CHOICE, MAX_WORKERS, N_FILES_MAX_PER_SAMPLE, N_CHUNKS_MAX_PER_FILE,
+                      extra_info={**extra_info, "cache_pass": "prime"})
+        rep_fnames = []
+        for i in range(cache_config["PASSES"]):
+            print(f"\nPass {i+1}/{cache_config['PASSES']}")
+            rep_fnames.append(run_point(client, fileset_ready, XRD_CHOICE, MAX_WORKERS, N_FILES_MAX_PER_SAMPLE, N_CHUNKS_MAX_PER_FILE,
+                                        extra_info={**extra_info, "cache_pass": i}))
+        if utils.config["benchmarking"]["USE_HTC"]:
+            client.shutdown()
+
+    primed_files = {(dset, fname) for dset, dataset in primed.items() for fname in dataset["files"]}
+    passes, files = utils.reports.compare_passes([f"{rep_fname}.parquet" for rep_fname in rep_fnames], primed=primed_files)
+    out_name = f"reports/{utils.reports.server_label(server_name(XRD_CHOICE))}/warm_cache_{warm_id}"
+    pq.write_table(files, f"{out_name}_files.parquet")
+    with open(f"{out_name}.json", "w") as f:
+        json.dump({"server": server_name(XRD_CHOICE), "prime_fraction": cache_config["PRIME_FRACTION"], "passes": passes}, f, indent=1)
+
+    print("\nCOLD VS WARM:\n----------------------------------------------------")
+    for p in passes:
+        line = f"Pass {p['pass']+1}: {p['time']:.2f} seconds, {p['throughput']:.1f} events/s"
+        if "median_speedup" in p and p["median_speedup"] is not None:
+            line += f", median speedup per file {p['median_speedup']:.2f}, {100*p['not_faster_fraction']:.1f}% of files not faster"
+        print(line)
+    print(f"\nWrote the cold-vs-warm report to {out_name}.json (per-file read times in {out_name}_files.parquet)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="XRootD/XCache benchmark"
+    )
+    parser.add_argument("--sweep", action="store_true", help="Run the parameter sweep configured in the 'sweep' section of utils/config.py")
+    parser.add_argument("--warm-cache", action="store_true", help="Run the fileset several times in a row to compare cold and warm cache reads, as configured in the 'warm_cache' section of utils/config.py")
+    parser.add_argument("--rebuild-fileset", action="store_true", help="Prepare the fileset again instead of using the cached one")
+    args = parser.parse_args(argv)
+
+    if args.sweep:
+        sweep(rebuild_fileset=args.rebuild_fileset)
+        return
+    if args.warm_cache:
+        warm_cache(rebuild_fileset=args.rebuild_fileset)
+        return
+
+    fileset_ready, prep_time = get_fileset(XRD_CHOICE, N_FILES_MAX_PER_SAMPLE, N_CHUNKS_MAX_PER_FILE, rebuild=args.rebuild_fileset)
+
+    client = get_client()
+    with client:
+        start_live_metrics(client)
+        rep_fname = run_point(client, fileset_ready, XRD_CHOICE, MAX_WORKERS, N_FILES_MAX_PER_SAMPLE, N_CHUNKS_MAX_PER_FILE,
+                              extra_info={"fileset_prep_time": prep_time})
+        if utils.config["benchmarking"]["USE_HTC"]:
+            client.shutdown()
+    return rep_fname
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()